@@ -0,0 +1,48 @@
+from instruction import Directive
+
+import sys
+
+# Lines are formatted and written out this many at a time.
+WRITE_CHUNK = 4096
+# Size of the buffer of the files opened for the assembly.
+WRITE_BUFFER_SIZE = 2**16
+
+
+class AssemblyWriter:
+
+    # Takes the place of the list of program lines. Whatever is appended is
+    # written to the output in chunks, so the assembly is never held whole.
+
+    def __init__(self, output) -> None:
+        self.output = output
+        self.pending = []
+        self.count = 0
+
+    def append(self, line):
+        self.pending.append(line)
+        self.count += 1
+        if len(self.pending) >= WRITE_CHUNK:
+            self.flush()
+
+    def extend(self, lines):
+        for line in lines:
+            self.append(line)
+
+    def flush(self):
+        if self.pending:
+            self.output.write("\n".join(map(str, self.pending)) + "\n")
+            self.pending.clear()
+        self.output.flush()
+
+    def __len__(self):
+        return self.count
+
+
+def open_assembly(path):
+    return open(path, "w", buffering=WRITE_BUFFER_SIZE)
+
+
+if __name__ == "__main__":
+    writer = AssemblyWriter(sys.stdout)
+    writer.extend(Directive(f".long {i}") for i in range(10))
+    writer.flush()
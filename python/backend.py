@@ -0,0 +1,259 @@
+from instruction import (EAX, ECX, EDI, EDX, ESI, R8D, R9D, R10D, R11D, RIP, Immediate, Instruction,
+                         Memory, Register, Target)
+from register_allocator import is_simple
+
+from abc import ABC, abstractmethod
+
+
+class Backend(ABC):
+
+    NAME = None
+    WORD_SIZE = 4
+    # Object file format written by the built-in encoder, if any.
+    OBJECT_FORMAT = None
+    # Offset of the frame pointer from a 16 byte boundary.
+    FRAME_BASE_OFFSET = 8
+    CALLEE_SAVED = []
+    SCRATCH_REGISTERS = ()
+
+    def __init__(self) -> None:
+        self.stack_pointer = Register("esp", self.WORD_SIZE)
+        self.frame_pointer = Register("ebp", self.WORD_SIZE)
+
+    def address_register(self, register):
+        return Register(register.name, self.WORD_SIZE)
+
+    def frame_memory(self, displacement, index=None):
+        if index is None:
+            return Memory(displacement, self.frame_pointer)
+        return Memory(displacement, self.frame_pointer, self.address_register(index), 4)
+
+    def stack_slot(self, slot):
+        return Memory(slot * self.WORD_SIZE, self.stack_pointer)
+
+    @abstractmethod
+    def push(self, operand):
+        # Returns the instruction pushing the operand onto the stack.
+        pass
+
+    @abstractmethod
+    def pop(self, register):
+        pass
+
+    @abstractmethod
+    def release(self, slots):
+        # Returns the instruction freeing that many stack slots.
+        pass
+
+    @abstractmethod
+    def load_address(self, memory, register):
+        pass
+
+    @abstractmethod
+    def data(self, label):
+        # Returns the memory operand of a label in the data sections.
+        pass
+
+    def symbol(self, name):
+        return name
+
+    @abstractmethod
+    def call(self, generator, name, arguments, variadic=False):
+        # Emits a call to a runtime function, passing the arguments, which
+        # are nodes, string labels or immediates, as the target's ABI does.
+        pass
+
+    @abstractmethod
+    def begin_data(self, generator):
+        pass
+
+    @abstractmethod
+    def begin_main(self, generator, saved_registers):
+        pass
+
+    @abstractmethod
+    def end_main(self, generator, saved_registers):
+        pass
+
+
+class MinGW32Backend(Backend):
+
+    NAME = "mingw32"
+    WORD_SIZE = 4
+    FRAME_BASE_OFFSET = 8
+    CALLEE_SAVED = ["ebx", "esi", "edi"]
+    SCRATCH_REGISTERS = (EAX, ECX, EDX)
+
+    def push(self, operand):
+        return Instruction("pushl", operand)
+
+    def pop(self, register):
+        return Instruction("popl", register)
+
+    def release(self, slots):
+        # leal leaves the flags alone, unlike addl.
+        return Instruction("leal", self.stack_slot(slots), self.stack_pointer)
+
+    def load_address(self, memory, register):
+        return Instruction("leal", memory, register)
+
+    def data(self, label):
+        return Memory(label)
+
+    def symbol(self, name):
+        return f"_{name}"
+
+    def call(self, generator, name, arguments, variadic=False):
+        # Arguments are pushed right to left and popped by the caller.
+        for argument in arguments[::-1]:
+            if isinstance(argument, str):
+                generator.emit("pushl", Immediate(argument))
+            elif isinstance(argument, Immediate):
+                generator.emit("pushl", argument)
+            else:
+                generator.emit("pushl", generator.source_operand(argument, self.SCRATCH_REGISTERS))
+        generator.emit("call", Target(self.symbol(name)))
+        generator.emit("addl", Immediate(4 * len(arguments)), self.stack_pointer)
+
+    def begin_data(self, generator):
+        generator.emit_directive("\t.text")
+        generator.emit_directive("\t.def\t___main;\t.scl\t2;\t.type\t32;\t.endef")
+        generator.emit_directive('\t.section .rdata,"dr"')
+
+    def begin_main(self, generator, saved_registers):
+        generator.emit_directive("\t.text")
+        generator.emit_directive("\t.globl\t_main")
+        generator.emit_directive("\t.def\t_main;\t.scl\t2;\t.type\t32;\t.endef")
+        generator.emit_label("_main")
+        generator.emit_label("LFB11")
+        generator.emit_directive("\t.cfi_startproc")
+        generator.emit("pushl", self.frame_pointer)
+        generator.emit_directive("\t.cfi_def_cfa_offset 8")
+        generator.emit_directive("\t.cfi_offset 5, -8")
+        generator.emit("movl", self.stack_pointer, self.frame_pointer)
+        generator.emit_directive("\t.cfi_def_cfa_register 5")
+        for register in saved_registers:
+            generator.emit("pushl", register)
+        generator.emit("call", Target("___main"))
+
+    def end_main(self, generator, saved_registers):
+        for i, register in enumerate(saved_registers):
+            generator.emit("movl", Memory(-4 * (i + 1), self.frame_pointer), register)
+        generator.emit("nop")
+        generator.emit("leave")
+        generator.emit_directive("\t.cfi_restore 5")
+        generator.emit_directive("\t.cfi_def_cfa 4, 4")
+        generator.emit("ret")
+        generator.emit_directive("\t.cfi_endproc")
+        generator.emit_label("LFE11")
+        generator.emit_directive('\t.ident\t"GCC: (MinGW.org GCC-8.2.0-3) 8.2.0"')
+        for name in ["basic_printf", "basic_write", "basic_write_int"]:
+            generator.emit_directive(f"\t.def\t{self.symbol(name)};\t.scl\t2;\t.type\t32;\t.endef")
+
+
+class SysV64Backend(Backend):
+
+    NAME = "x86_64-linux"
+    WORD_SIZE = 8
+    OBJECT_FORMAT = "elf64"
+    FRAME_BASE_OFFSET = 0
+    # esi and edi pass arguments here, so they are scratch registers instead.
+    CALLEE_SAVED = ["ebx", "r12d", "r13d", "r14d", "r15d"]
+    SCRATCH_REGISTERS = (EAX, ECX, EDX, ESI, EDI, R8D, R9D, R10D, R11D)
+    ARGUMENT_REGISTERS = (EDI, ESI, EDX, ECX, R8D, R9D)
+    CALL_CLOBBERS = ("esi", "edi", "r8d", "r9d", "r10d", "r11d")
+
+    def push(self, operand):
+        if isinstance(operand, Register):
+            operand = self.address_register(operand)
+        return Instruction("pushq", operand)
+
+    def pop(self, register):
+        return Instruction("popq", self.address_register(register))
+
+    def release(self, slots):
+        # leaq leaves the flags alone, unlike addq.
+        return Instruction("leaq", self.stack_slot(slots), self.stack_pointer)
+
+    def load_address(self, memory, register):
+        return Instruction("leaq", memory, self.address_register(register))
+
+    def data(self, label):
+        return Memory(label, RIP)
+
+    def call(self, generator, name, arguments, variadic=False):
+        # The first six arguments go in registers, the rest on the stack,
+        # which must be 16 byte aligned at the call.
+        register_arguments = list(zip(arguments, self.ARGUMENT_REGISTERS))
+        stack_arguments = arguments[len(self.ARGUMENT_REGISTERS):]
+        padding = len(stack_arguments) % 2
+        if padding:
+            generator.emit("subq", Immediate(self.WORD_SIZE), self.stack_pointer)
+        for argument in stack_arguments[::-1]:
+            if isinstance(argument, str):
+                generator.program_lines.append(self.load_address(self.data(argument), EAX))
+                argument = EAX
+            elif not isinstance(argument, Immediate):
+                argument = generator.source_operand(argument, self.SCRATCH_REGISTERS)
+                if isinstance(argument, Memory):
+                    generator.emit("movl", argument, EAX)
+                    argument = EAX
+            generator.program_lines.append(self.push(argument))
+
+        # Expressions are evaluated straight into their argument registers
+        # first, keeping the registers already holding arguments out of use.
+        used = []
+        for argument, register in register_arguments:
+            if not isinstance(argument, (str, Immediate)) and not is_simple(argument):
+                used.append(register)
+                free = tuple(scratch for scratch in self.SCRATCH_REGISTERS if scratch not in used)
+                generator.generate_expression(argument, register, free)
+        for argument, register in register_arguments:
+            if isinstance(argument, str):
+                generator.program_lines.append(self.load_address(self.data(argument), register))
+            elif isinstance(argument, Immediate):
+                generator.emit("movl", argument, register)
+            elif is_simple(argument):
+                generator.emit("movl", generator.operand(argument), register)
+
+        argument_names = [register.name for argument, register in register_arguments]
+        if variadic:
+            # al holds the number of vector registers used by a variadic call.
+            generator.emit("movl", Immediate(0), EAX)
+            argument_names.append("eax")
+        generator.emit("call", Target(self.symbol(name), tuple(argument_names), self.CALL_CLOBBERS))
+        if stack_arguments:
+            generator.emit("addq", Immediate(self.WORD_SIZE * (len(stack_arguments) + padding)),
+                           self.stack_pointer)
+
+    def begin_data(self, generator):
+        generator.emit_directive("\t.section\t.rodata")
+
+    def begin_main(self, generator, saved_registers):
+        generator.emit_directive("\t.text")
+        generator.emit_directive("\t.globl\tmain")
+        generator.emit_directive("\t.type\tmain, @function")
+        generator.emit_label("main")
+        generator.emit_directive("\t.cfi_startproc")
+        generator.emit("pushq", self.frame_pointer)
+        generator.emit_directive("\t.cfi_def_cfa_offset 16")
+        generator.emit_directive("\t.cfi_offset 6, -16")
+        generator.emit("movq", self.stack_pointer, self.frame_pointer)
+        generator.emit_directive("\t.cfi_def_cfa_register 6")
+        for register in saved_registers:
+            generator.emit("pushq", self.address_register(register))
+
+    def end_main(self, generator, saved_registers):
+        for i, register in enumerate(saved_registers):
+            generator.emit("movq", Memory(-8 * (i + 1), self.frame_pointer), self.address_register(register))
+        generator.emit("movl", Immediate(0), EAX)
+        generator.emit("leave")
+        generator.emit_directive("\t.cfi_def_cfa 7, 8")
+        generator.emit("ret")
+        generator.emit_directive("\t.cfi_endproc")
+        generator.emit_directive("\t.size\tmain, .-main")
+        generator.emit_directive('\t.section\t.note.GNU-stack,"",@progbits')
+
+
+BACKENDS = {backend.NAME: backend for backend in [MinGW32Backend, SysV64Backend]}
+DEFAULT_BACKEND = MinGW32Backend.NAME
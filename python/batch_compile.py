@@ -0,0 +1,242 @@
+from backend import BACKENDS, DEFAULT_BACKEND
+from compile_cache import compiler_fingerprint
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+RUNTIME_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime.c")
+EXECUTABLE_SUFFIX = ".exe" if os.name == "nt" else ""
+
+
+def compile_source(source, output_path, target, direct_object=False):
+    from code_generator import CodeGenerator
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        CodeGenerator(filename=source, backend=target).run(output_path, object_file=direct_object)
+    return time.perf_counter() - start
+
+
+def compile_worker(tasks, results):
+    # concurrent.futures and multiprocessing.pool import tokenize, which
+    # finds token.py here instead of the standard library's, so the pool is
+    # made of plain processes reading (index, source, output, target,
+    # direct_object) tasks until they get None.
+    for index, source, output_path, target, direct_object in iter(tasks.get, None):
+        try:
+            results.put((index, compile_source(source, output_path, target, direct_object), None))
+        except Exception as e:
+            results.put((index, None, str(e)))
+
+
+def run_tool(arguments):
+    start = time.perf_counter()
+    result = subprocess.run(arguments, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"{' '.join(arguments)} failed:\n{result.stderr.strip()}")
+    return time.perf_counter() - start
+
+
+class BuildJob:
+
+    __slots__ = ("source", "assembly", "object", "executable", "stamp", "key", "status", "error",
+                 "compile_time", "assemble_time", "link_time")
+
+    def __init__(self, source, output_dir) -> None:
+        name = os.path.splitext(os.path.basename(source))[0]
+        self.source = source
+        self.assembly = os.path.join(output_dir, f"{name}.s")
+        self.object = os.path.join(output_dir, f"{name}.o")
+        self.executable = os.path.join(output_dir, f"{name}{EXECUTABLE_SUFFIX}")
+        self.stamp = os.path.join(output_dir, f"{name}.stamp")
+        self.key = None
+        self.status = "pending"
+        self.error = None
+        self.compile_time = None
+        self.assemble_time = None
+        self.link_time = None
+
+    def outputs(self, link, direct_object=False):
+        compiled = self.object if direct_object else self.assembly
+        return [compiled, self.executable] if link else [compiled]
+
+
+class BatchCompiler:
+
+    def __init__(self, sources, output_dir="build", target=DEFAULT_BACKEND, jobs=None, link=True,
+                 up_to_date="hash", force=False, cc="gcc", direct_object=False) -> None:
+        self.output_dir = output_dir
+        self.target = target
+        self.jobs = jobs or os.cpu_count() or 1
+        self.link = link
+        self.up_to_date = up_to_date
+        self.force = force
+        self.cc = cc
+        self.direct_object = direct_object
+        if direct_object and BACKENDS[target].OBJECT_FORMAT is None:
+            raise Exception(f"Objects can't be written directly for {target}.")
+        self.build_jobs = []
+        jobs_by_assembly = {}
+        for source in sources:
+            job = BuildJob(source, output_dir)
+            other = jobs_by_assembly.setdefault(job.assembly, job)
+            if other is not job:
+                raise Exception(f"{source} and {other.source} would both be written to {job.assembly}.")
+            self.build_jobs.append(job)
+        self.runtime_object = os.path.join(output_dir, f"runtime-{target}.o")
+        self.runtime_ready = threading.Event()
+        self.runtime_error = None
+        self.wall_time = 0.0
+
+    def build_key(self, job):
+        digest = hashlib.sha256(f"{compiler_fingerprint()} {self.target} {self.link} {self.direct_object}".encode())
+        with open(job.source, "rb") as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+
+    def is_up_to_date(self, job):
+        if self.force or not all(os.path.exists(path) for path in job.outputs(self.link, self.direct_object)):
+            return False
+        if self.up_to_date == "hash":
+            job.key = self.build_key(job)
+            try:
+                with open(job.stamp) as f:
+                    return f.read().strip() == job.key
+            except OSError:
+                return False
+        newest_input = max([os.path.getmtime(job.source)] + [os.path.getmtime(path) for path in self.compiler_files()])
+        return all(os.path.getmtime(path) >= newest_input for path in job.outputs(self.link, self.direct_object))
+
+    def compiler_files(self):
+        directory = os.path.dirname(os.path.abspath(__file__))
+        return glob.glob(os.path.join(directory, "*.py")) + [RUNTIME_SOURCE]
+
+    def build_runtime(self):
+        if os.path.exists(self.runtime_object) and \
+                os.path.getmtime(self.runtime_object) >= os.path.getmtime(RUNTIME_SOURCE):
+            return 0.0
+        return run_tool([self.cc, "-O2", "-c", RUNTIME_SOURCE, "-o", self.runtime_object])
+
+    def finish(self, job):
+        if self.up_to_date == "hash":
+            with open(job.stamp, "w") as f:
+                f.write((job.key or self.build_key(job)) + "\n")
+        job.status = "built"
+
+    def link_worker(self, links):
+        for job in iter(links.get, None):
+            try:
+                self.runtime_ready.wait()
+                if self.runtime_error is not None:
+                    raise Exception(self.runtime_error)
+                if not self.direct_object:
+                    job.assemble_time = run_tool([self.cc, "-c", job.assembly, "-o", job.object])
+                job.link_time = run_tool([self.cc, job.object, self.runtime_object, "-o", job.executable])
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                continue
+            self.finish(job)
+
+    def runtime_worker(self):
+        try:
+            self.build_runtime()
+        except Exception as e:
+            self.runtime_error = str(e)
+        self.runtime_ready.set()
+
+    def run(self):
+        # Sources compile in a pool of processes. As each one finishes its
+        # assemble and link steps start on a thread, while the rest compile.
+        start = time.perf_counter()
+        os.makedirs(self.output_dir, exist_ok=True)
+        pending = []
+        for job in self.build_jobs:
+            if self.is_up_to_date(job):
+                job.status = "up to date"
+            else:
+                pending.append(job)
+
+        tasks = multiprocessing.SimpleQueue()
+        results = multiprocessing.SimpleQueue()
+        processes = [multiprocessing.Process(target=compile_worker, args=(tasks, results), daemon=True)
+                     for _ in range(min(self.jobs, len(pending)))]
+        links = queue.Queue()
+        threads = [threading.Thread(target=self.link_worker, args=(links,)) for _ in range(self.jobs)]
+        if self.link and pending:
+            threads.append(threading.Thread(target=self.runtime_worker))
+        for worker in processes + threads:
+            worker.start()
+
+        for index, job in enumerate(pending):
+            output = job.object if self.direct_object else job.assembly
+            tasks.put((index, job.source, output, self.target, self.direct_object))
+        for _ in processes:
+            tasks.put(None)
+        for _ in pending:
+            index, elapsed, error = results.get()
+            job = pending[index]
+            job.compile_time = elapsed
+            if error is not None:
+                job.status = "failed"
+                job.error = error
+            elif self.link:
+                links.put(job)
+            else:
+                self.finish(job)
+        for _ in range(self.jobs):
+            links.put(None)
+        for worker in processes + threads:
+            worker.join()
+
+        self.wall_time = time.perf_counter() - start
+        return all(job.status != "failed" for job in self.build_jobs)
+
+    def report(self):
+        def seconds(value):
+            return f"{'-':>10}" if value is None else f"{value:>9.3f}s"
+
+        lines = [f"{'source':<32}{'status':>12}{'compile':>10}{'assemble':>10}{'link':>10}"]
+        for job in self.build_jobs:
+            lines.append(f"{job.source:<32}{job.status:>12}{seconds(job.compile_time)}"
+                         f"{seconds(job.assemble_time)}{seconds(job.link_time)}")
+            if job.error is not None:
+                lines.append(f"    {job.error}")
+        counts = {status: len([job for job in self.build_jobs if job.status == status])
+                  for status in ["built", "up to date", "failed"]}
+        lines.append(f"{counts['built']} built, {counts['up to date']} up to date, {counts['failed']} failed "
+                     f"in {self.wall_time:.3f}s with {self.jobs} jobs.")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compiles BASIC programs in parallel, each to its own outputs.")
+    parser.add_argument("sources", nargs="*", help="programs to compile, all .txt files here by default")
+    parser.add_argument("-o", "--output-dir", default="build")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes, one per CPU by default")
+    parser.add_argument("--target", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--no-link", action="store_true", help="stop after writing the assembly")
+    parser.add_argument("--up-to-date", choices=["hash", "mtime"], default="hash",
+                        help="compare source hashes or timestamps to skip finished outputs")
+    parser.add_argument("--force", action="store_true", help="rebuild everything")
+    parser.add_argument("--cc", default="gcc", help="compiler driver used to assemble and link")
+    parser.add_argument("--direct-object", action="store_true",
+                        help="encode the objects without an assembler, x86_64-linux only")
+    args = parser.parse_args()
+
+    sources = args.sources or sorted(glob.glob("*.txt"))
+    batch_compiler = BatchCompiler(sources, output_dir=args.output_dir, target=args.target, jobs=args.jobs,
+                                   link=not args.no_link, up_to_date=args.up_to_date, force=args.force,
+                                   cc=args.cc, direct_object=args.direct_object)
+    succeeded = batch_compiler.run()
+    print(batch_compiler.report())
+    sys.exit(0 if succeeded else 1)
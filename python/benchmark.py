@@ -0,0 +1,496 @@
+from bytecode_compiler import compile_file
+from code_generator import CodeGenerator
+from interpreter import Interpreter
+from lexical_analyser import LexicalAnalyser
+from pass_manager import PassManager
+from syntax_analyser import SyntaxAnalyser
+from token import Token
+from visitor import walk_preorder
+
+import argparse
+import os
+import contextlib
+import gc
+import glob
+import io
+import json
+import math
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+class CharLexicalAnalyser(LexicalAnalyser):
+
+    def __init__(self, filename="./sample_text.txt") -> None:
+        super().__init__(filename=filename)
+        self.token = ""
+
+    def add_token(self, token):
+        if token.strip() or token == "\n":
+            token_type = self.get_token_type(token)
+            new_token = Token(token_type, token)
+            self.token_list.append(new_token)
+        self.token = ""
+
+    def scan_line(self, line):
+        self.token_list = []
+        self.build_tokens(line)
+        return self.token_list
+
+    def build_tokens(self, line):
+
+        enum_line = enumerate(line)
+
+        for i, char in enum_line:
+            if not char.strip():
+                self.add_token(self.token)
+                if char == "\n":
+                    self.add_token(char)
+            elif char in self.OPERATORS:
+                self.add_token(self.token)
+                current_and_next = char + line[i+1]
+                if current_and_next in self.OPERATORS:
+                    self.add_token(current_and_next)
+                    next(enum_line, None)
+                else:
+                    self.add_token(char)
+            elif char in self.SEPARATORS:
+                self.add_token(self.token)
+                self.add_token(char)
+            elif char == '"':
+                self.add_token(self.token)
+
+                token = '"'
+
+                for j in range(i+1, len(line)):
+
+                    i, char = next(enum_line, None)
+                    token = token + char
+
+                    if char == '"' and line[j-1] != "\\":
+                        break
+
+                self.add_token(token)
+
+            else:
+                self.token = self.token + char
+                if i == len(line) - 1:
+                    self.add_token(self.token)
+
+
+def generate_program(n_lines):
+    lines = ["DIM a[10][10] = {{1, 2, 3}, {4, -5, 6}}", "LET size = 10", "LET total = 0"]
+    while len(lines) < n_lines:
+        lines += [
+            "FOR i = 0 TO size-1",
+            "    FOR j = 0 TO size-1",
+            "        a[i][j] = (i * size + j) / 2 - -1",
+            "        IF a[i][j] >= 10",
+            '            PRINT "a[%d][%d] = %3d\\n", i, j, a[i][j]',
+            "        ELSE",
+            "            total = total + a[i][j] * -2",
+            "        END",
+            "    END",
+            "END",
+        ]
+    return "\n".join(f"{10 * (n + 1):06d} {line}" for n, line in enumerate(lines[:n_lines])) + "\n"
+
+
+def number_lines(lines):
+    return "\n".join(f"{10 * (n + 1):06d} {line}" for n, line in enumerate(lines)) + "\n"
+
+
+def generate_straight_line(n_lines, variables=16):
+    lines = [f"LET v{i} = {i}" for i in range(variables)]
+    while len(lines) < n_lines:
+        i = len(lines)
+        if i % 50 == 0:
+            lines.append(f'PRINT "%d\\n", v{i % variables}')
+        else:
+            lines.append(f"LET v{i % variables} = v{(i + 3) % variables} * 3 + v{(i + 7) % variables} - {i % 100}")
+    return number_lines(lines)
+
+
+def generate_nested(n_lines, depth=50):
+    # FOR and IF alternate down to the given depth, block after block.
+    lines = ["LET total = 0"]
+    while len(lines) < n_lines:
+        for level in range(depth):
+            indent = "    " * level
+            if level % 2 == 0:
+                lines.append(f"{indent}FOR i{level} = 0 TO {level % 5 + 1}")
+            else:
+                lines.append(f"{indent}IF i{level - 1} < {level % 3 + 1}")
+        lines.append(f"{'    ' * depth}total = total + i{depth - 2}")
+        lines += [f"{'    ' * level}END" for level in range(depth - 1, -1, -1)]
+    lines.append('PRINT "%d\\n", total')
+    return number_lines(lines)
+
+
+def generate_wide_expressions(n_lines, terms=16, variables=8):
+    lines = [f"LET x{i} = {i + 1}" for i in range(variables)]
+    while len(lines) < n_lines:
+        i = len(lines)
+        expression = f"x{i % variables}"
+        for j in range(1, terms):
+            operand = f"x{(i + j) % variables}" if j % 3 else f"(x{(i + j) % variables} - {j})"
+            expression += f" {'+-*'[j % 3]} {operand}"
+        lines.append(f"LET x{i % variables} = {expression}")
+    lines.append('PRINT "%d\\n", x0')
+    return number_lines(lines)
+
+
+def generate_initializers(n_lines, rows=4, columns=8):
+    lines = []
+    while len(lines) < n_lines:
+        i = len(lines)
+        values = ", ".join("{" + ", ".join(str((i + r * columns + c) % 97 - 48) for c in range(columns)) + "}"
+                           for r in range(rows))
+        lines.append(f"DIM t{i}[{rows}][{columns}] = {{{values}}}")
+        lines.append(f'PRINT "%d\\n", t{i}[{i % rows}][{i % columns}]')
+    return number_lines(lines)
+
+
+def generate_many_variables(n_lines):
+    # The loop keeps the chain from being folded into one constant.
+    lines = ["FOR k = 0 TO 1", "LET v1 = k"]
+    while len(lines) < n_lines - 2:
+        i = len(lines)
+        lines.append(f"LET v{i} = v{i - 1} + {i % 10}")
+    lines += [f'PRINT "%d\\n", v{len(lines) - 1}', "END"]
+    return number_lines(lines)
+
+
+GENERATORS = {
+    "mixed": generate_program,
+    "straight-line": generate_straight_line,
+    "nested": generate_nested,
+    "wide-expressions": generate_wide_expressions,
+    "initializers": generate_initializers,
+    "many-variables": generate_many_variables,
+}
+
+
+def time_lexer(lexer_class, filename, repeat=3):
+    best = None
+    token_list = None
+    for _ in range(repeat):
+        lexer = lexer_class(filename=filename)
+        token_list = []
+        gc.collect()
+        start = time.perf_counter()
+        with open(filename, "r") as f:
+            for line in f:
+                if line.strip():
+                    token_list.extend(lexer.scan_line(line))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, token_list
+
+
+def benchmark_lexer(n_lines):
+    filename = write_program(n_lines)
+    try:
+        char_time, char_tokens = time_lexer(CharLexicalAnalyser, filename)
+        table_time, table_tokens = time_lexer(LexicalAnalyser, filename)
+    finally:
+        os.remove(filename)
+
+    if [(t.type, t.value) for t in char_tokens] != [(t.type, t.value) for t in table_tokens]:
+        raise Exception("Lexers produced different token streams.")
+
+    print(f"{n_lines:>8} lines {len(table_tokens):>9} tokens   "
+          f"char loop {char_time:8.3f}s   table {table_time:8.3f}s   "
+          f"speedup {char_time / table_time:5.2f}x")
+
+
+def write_program(n_lines, generator=generate_program):
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write(generator(n_lines))
+        return f.name
+
+
+def ast_size(nodes):
+    size = 0
+    for node in nodes:
+        size += sys.getsizeof(node) + sys.getsizeof(node.children)
+        if hasattr(node, "__dict__"):
+            size += sys.getsizeof(node.__dict__)
+    return size
+
+
+def benchmark_parser(n_lines, repeat=3):
+    filename = write_program(n_lines)
+    try:
+        best = None
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                SyntaxAnalyser(filename=filename).build_ast()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            ast = SyntaxAnalyser(filename=filename).build_ast()
+    finally:
+        os.remove(filename)
+
+    nodes = ast.get_all_children()
+    # resource only exists on Unix, so Windows runs leave the RSS out.
+    try:
+        import resource
+        max_rss = f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10:8.1f} MiB"
+    except ImportError:
+        max_rss = f"{'-':>8}"
+    print(f"{n_lines:>8} lines {len(nodes):>9} nodes   parse {best:8.3f}s   "
+          f"ast {ast_size(nodes) / 2**20:8.1f} MiB   max rss {max_rss}")
+
+
+def benchmark_code_generator(n_lines, repeat=3):
+    filename = write_program(n_lines)
+    cwd = os.getcwd()
+    try:
+        best = None
+        with tempfile.TemporaryDirectory() as output_dir:
+            os.chdir(output_dir)
+            for _ in range(repeat):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    code_generator = CodeGenerator(filename=filename)
+                gc.collect()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    code_generator.run()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+    finally:
+        os.chdir(cwd)
+        os.remove(filename)
+
+    print(f"{n_lines:>8} lines {len(code_generator.program_lines):>9} instructions   codegen {best:8.3f}s")
+
+
+def run_interpreter(filename):
+    output = io.StringIO()
+    Interpreter(compile_file(filename), output).run()
+    return output.getvalue()
+
+
+def run_native(filename, runtime, output_dir):
+    backend = "mingw32" if os.name == "nt" else "x86_64-linux"
+    assembly = os.path.join(output_dir, "final.s")
+    executable = os.path.join(output_dir, "final.exe")
+    with contextlib.redirect_stdout(io.StringIO()):
+        CodeGenerator(filename=filename, backend=backend).run(assembly)
+    subprocess.run(["gcc", assembly, runtime, "-o", executable], check=True)
+    return subprocess.run([executable], capture_output=True, check=True).stdout.decode()
+
+
+def benchmark_interpreter(filenames, repeat=3):
+    # Time to result covers everything from the source file to the program's
+    # output: compiling and running the bytecode against generating code,
+    # assembling, linking and running the executable.
+    if shutil.which("gcc") is None:
+        raise Exception("The native path needs gcc.")
+    runtime_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime.c")
+    with tempfile.TemporaryDirectory() as output_dir:
+        runtime = os.path.join(output_dir, "runtime.o")
+        subprocess.run(["gcc", "-O2", "-c", runtime_source, "-o", runtime], check=True)
+        for filename in filenames:
+            times = []
+            outputs = []
+            try:
+                for run in [run_interpreter, lambda filename: run_native(filename, runtime, output_dir)]:
+                    best = None
+                    for _ in range(repeat):
+                        gc.collect()
+                        start = time.perf_counter()
+                        output = run(filename)
+                        elapsed = time.perf_counter() - start
+                        best = elapsed if best is None else min(best, elapsed)
+                    times.append(best)
+                    outputs.append(output)
+            except Exception as e:
+                print(f"{os.path.basename(filename):>20}   failed: {e}")
+                continue
+            status = "" if outputs[0] == outputs[1] else "   OUTPUT DIFFERS"
+            print(f"{os.path.basename(filename):>20}   interpreter {times[0]:8.3f}s   native {times[1]:8.3f}s   "
+                  f"speedup {times[1] / times[0]:6.2f}x{status}")
+
+
+def best_time(function, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def measure_program(generator_name, n_lines):
+    # Times the lexer, the parser on the lexer's tokens, the optimization
+    # passes and CodeGenerator.run on their own, keeping the best run of each
+    # pass. Large programs run once.
+    repeat = 3 if n_lines <= 10000 else 1
+    filename = write_program(n_lines, GENERATORS[generator_name])
+    cwd = os.getcwd()
+    try:
+        with open(filename) as f:
+            lines = sum(1 for line in f)
+        with contextlib.redirect_stdout(io.StringIO()):
+            lex_time, tokens = best_time(lambda: LexicalAnalyser(filename=filename).analyse_text(), repeat)
+            parse_time, ast = best_time(lambda: SyntaxAnalyser(filename=filename, tokens=tokens).build_ast(), repeat)
+        nodes = sum(1 for node in walk_preorder(ast))
+        del ast
+
+        with tempfile.TemporaryDirectory() as output_dir, open(os.devnull, "w") as null:
+            os.chdir(output_dir)
+            codegen_time = None
+            passes = {}
+            for _ in range(repeat):
+                with contextlib.redirect_stdout(null):
+                    pass_manager = PassManager(collect_stats=True)
+                    code_generator = CodeGenerator(filename=filename, pass_manager=pass_manager)
+                    gc.collect()
+                    start = time.perf_counter()
+                    code_generator.run()
+                    elapsed = time.perf_counter() - start
+                codegen_time = elapsed if codegen_time is None else min(codegen_time, elapsed)
+                for stats in pass_manager.stats:
+                    passes[stats.name] = min(passes.get(stats.name, stats.time), stats.time)
+    finally:
+        os.chdir(cwd)
+        os.remove(filename)
+
+    optimize_time = sum(passes[name] for name in passes if name not in ["lex", "parse", "emission", "peephole", "write"])
+    return {
+        "generator": generator_name,
+        "lines": lines,
+        "tokens": len(tokens),
+        "nodes": nodes,
+        "instructions": len(code_generator.program_lines),
+        "lex": lex_time,
+        "parse": parse_time,
+        "optimize": optimize_time,
+        "codegen": codegen_time,
+        "passes": passes,
+    }
+
+
+SUITE_PHASES = ["lex", "parse", "optimize", "codegen"]
+# Doubling the input more than doubles the time beyond this exponent.
+SUPERLINEAR_EXPONENT = 1.3
+# Growth is only judged between sizes this many times apart, from times
+# at the smaller size long enough not to be noise.
+SCALING_MIN_RATIO = 10
+SCALING_MIN_TIME = 0.05
+# Slowdowns against a baseline reported as regressions.
+REGRESSION_RATIO = 1.25
+
+
+def scaling_exponent(smaller_lines, smaller_time, larger_lines, larger_time):
+    if smaller_time <= 0 or larger_time <= 0 or larger_lines <= smaller_lines:
+        return None
+    return math.log(larger_time / smaller_time) / math.log(larger_lines / smaller_lines)
+
+
+def superlinear_timings(smaller, larger):
+    # Checks the phases and every compiler pass on its own, since one slow
+    # pass can hide inside a phase made of several fast ones.
+    timings = [(phase, smaller[phase], larger[phase]) for phase in SUITE_PHASES]
+    timings += [(f"{name} pass", smaller["passes"][name], time)
+                for name, time in larger["passes"].items() if name in smaller["passes"]]
+    superlinear = []
+    for name, smaller_time, larger_time in timings:
+        exponent = scaling_exponent(smaller["lines"], smaller_time, larger["lines"], larger_time)
+        if exponent is not None and exponent > SUPERLINEAR_EXPONENT and smaller_time > SCALING_MIN_TIME:
+            superlinear.append(f"{name} n^{exponent:.2f}")
+    return superlinear
+
+
+def run_suite(sizes, generator_names, output=None, baseline=None):
+    results = []
+    for generator_name in generator_names:
+        # Results by the size asked for, as the generators overshoot it a little.
+        measured = {}
+        for n_lines in sizes:
+            result = measure_program(generator_name, n_lines)
+            results.append(result)
+            line = (f"{generator_name:>16} {result['lines']:>8} lines   " +
+                    "   ".join(f"{phase} {result[phase]:8.3f}s" for phase in SUITE_PHASES))
+            smaller = [size for size in measured if size * SCALING_MIN_RATIO <= n_lines]
+            if smaller:
+                superlinear = superlinear_timings(measured[max(smaller)], result)
+                if superlinear:
+                    line += "   SUPERLINEAR " + ", ".join(superlinear)
+            print(line)
+            measured[n_lines] = result
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "sizes": sizes,
+        "results": results,
+    }
+    if output is None:
+        os.makedirs("benchmark_results", exist_ok=True)
+        output = os.path.join("benchmark_results", f"suite-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {output}.")
+
+    if baseline is not None:
+        compare_results(baseline, results)
+
+
+def compare_results(baseline, results):
+    with open(baseline) as f:
+        baseline_results = {(result["generator"], result["lines"]): result for result in json.load(f)["results"]}
+    regressions = 0
+    for result in results:
+        old = baseline_results.get((result["generator"], result["lines"]))
+        if old is None:
+            continue
+        ratios = {phase: result[phase] / old[phase] for phase in SUITE_PHASES if old[phase] > 0}
+        slower = [phase for phase, ratio in ratios.items() if ratio > REGRESSION_RATIO and result[phase] > 0.05]
+        regressions += len(slower)
+        print(f"{result['generator']:>16} {result['lines']:>8} lines   " +
+              "   ".join(f"{phase} {ratio:5.2f}x" for phase, ratio in ratios.items()) +
+              ("   REGRESSION " + ", ".join(slower) if slower else ""))
+    print(f"{regressions} regressions against {baseline}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the compiler phases on generated programs.")
+    parser.add_argument("phase", nargs="?", default="lexer",
+                        choices=["lexer", "parser", "codegen", "interpreter", "suite"])
+    parser.add_argument("arguments", nargs="*", help="program sizes in lines, or programs for the interpreter")
+    parser.add_argument("--generators", nargs="+", choices=sorted(GENERATORS), default=list(GENERATORS),
+                        help="programs generated by the suite")
+    parser.add_argument("--output", help="where the suite saves its results")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier suite results to compare against")
+    args = parser.parse_args()
+
+    if args.phase == "interpreter":
+        filenames = args.arguments or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.txt")))
+        benchmark_interpreter(filenames)
+        sys.exit()
+    # Time grows about tenfold with each size here, so a million lines would
+    # take hours per generator. Pass 1000000 to run it.
+    sizes = [int(argument) for argument in args.arguments] or [1000, 10000, 100000]
+    if args.phase == "suite":
+        run_suite(sizes, args.generators, args.output, args.compare)
+        sys.exit()
+    for n_lines in sizes:
+        if args.phase == "lexer":
+            benchmark_lexer(n_lines)
+        elif args.phase == "parser":
+            benchmark_parser(n_lines)
+        elif args.phase == "codegen":
+            benchmark_code_generator(n_lines)
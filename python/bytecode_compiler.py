@@ -0,0 +1,410 @@
+from constant_folder import ConstantFolder
+from invariant_code_mover import index_terms
+from print_format import decode_string, parse_format
+from syntax_analyser import SyntaxAnalyser
+from visitor import NodeVisitor, walk_postorder, walk_preorder
+
+import bisect
+import contextlib
+import io
+import re
+import sys
+
+# Every instruction is an (opcode, a, b, c, d) tuple. Operands are slots of
+# one flat memory holding constants, variables and temporaries, so no
+# instruction needs to tell immediates from variables.
+(
+    FOR_NEXT,   # var, step, limit, target: var += step, jump if var <= limit
+    ADD,        # destination, left, right
+    SUB,
+    MUL,
+    DIV,
+    NEG,        # destination, operand
+    MOVE,       # destination, source
+    LOAD,       # destination, base, index, bounds
+    STORE,      # base, index, bounds, source
+    LOAD2,      # destination, base, (index, term, stride), bounds
+    STORE2,     # base, (index, term, stride), bounds, source
+    OFFSET,     # destination, index, term, stride: index + term * stride
+    SCALE,      # destination, term, stride
+    JUMP,       # target
+    JEQ,        # left, right, target: jump if left == right
+    JNE,
+    JLT,
+    JLE,
+    JGT,
+    JGE,
+    PRINT,      # format, slots
+    PRINTF,     # format, slots, unsigned
+    INIT,       # base, values
+) = range(23)
+
+OPCODE_NAMES = ["FOR_NEXT", "ADD", "SUB", "MUL", "DIV", "NEG", "MOVE", "LOAD", "STORE", "LOAD2", "STORE2",
+                "OFFSET", "SCALE", "JUMP", "JEQ", "JNE", "JLT", "JLE", "JGT", "JGE", "PRINT", "PRINTF", "INIT"]
+OPERATIONS = {"+": ADD, "-": SUB, "*": MUL, "/": DIV}
+# Jumps taken when the comparison is false.
+FALSE_JUMPS = {"==": JNE, "<": JGE, "<=": JGT, ">": JLE, ">=": JLT, "<>": JEQ}
+# Operand fields holding jump targets, patched once the labels are placed.
+TARGET_FIELDS = {FOR_NEXT: 4, JUMP: 1, JEQ: 3, JNE: 3, JLT: 3, JLE: 3, JGT: 3, JGE: 3}
+
+# printf conversions with int arguments that Python formats the same way,
+# length modifiers are dropped and unsigned ones get the value as unsigned.
+PRINTF_CONVERSION = re.compile(r"%([-+ 0]*(?:\*|[0-9]+)?(?:\.(?:\*|[0-9]+))?)(?:hh|h|ll|l)?([diouxXc%])")
+
+
+def printf_format(value):
+    text = decode_string(value)
+    if text is None:
+        raise Exception(f"Unsupported escape in format string {value}.")
+    text = text.decode()
+    python_format = ""
+    unsigned = []
+    start = 0
+    i = text.find("%")
+    while i != -1:
+        match = PRINTF_CONVERSION.match(text, i)
+        if match is None:
+            raise Exception(f"Unsupported conversion in format string {value}.")
+        python_format += text[start:i].replace("%", "%%")
+        flags, conversion = match.groups()
+        if conversion == "%":
+            python_format += "%%"
+        else:
+            unsigned += [False] * flags.count("*")
+            unsigned.append(conversion in "ouxX")
+            python_format += f"%{flags}{'d' if conversion in 'iu' else conversion}"
+        start = match.end()
+        i = text.find("%", start)
+    python_format += text[start:].replace("%", "%%")
+    return python_format, tuple(unsigned)
+
+
+class Bytecode:
+
+    __slots__ = ("code", "memory", "lines")
+
+    def __init__(self, code, memory, lines) -> None:
+        self.code = code
+        self.memory = memory
+        self.lines = lines
+
+    def disassemble(self):
+        lines = []
+        for pc, instruction in enumerate(self.code):
+            opcode, *operands = instruction
+            while operands and operands[-1] is None:
+                operands.pop()
+            operands = [f"<{len(operand)} values>" if isinstance(operand, tuple) and len(operand) > 8 else repr(operand)
+                        for operand in operands]
+            lines.append(f"{pc:6} {OPCODE_NAMES[opcode]:<8} {', '.join(operands)}")
+        return "\n".join(lines)
+
+
+class BytecodeCompiler(NodeVisitor):
+
+    def __init__(self, ast) -> None:
+        self.ast = ast
+        self.code = []
+        self.lines = []
+        self.memory = []
+        self.slots = {}
+        self.constants = {}
+        self.temporaries = []
+        self.temporary_slots = set()
+        self.temporary_count = 0
+        self.labels = {}
+        self.patches = []
+        self.line_addresses = {}
+        self.current_line = None
+
+    def run(self):
+        self.allocate_variables()
+        self.visit(self.ast)
+        self.resolve_jumps()
+        return Bytecode(self.code, self.memory, self.lines)
+
+    def allocate_variables(self):
+        for node in walk_preorder(self.ast):
+            if node.node_type() not in ["program", "subroutine"]:
+                continue
+            for symbol in node.symbol_table:
+                self.slots[symbol] = len(self.memory)
+                self.memory.extend([0] * symbol.num_of_items())
+
+    def constant(self, value):
+        slot = self.constants.get(value)
+        if slot is None:
+            slot = self.constants[value] = len(self.memory)
+            self.memory.append(value)
+        return slot
+
+    def allocate_temporary(self):
+        if self.temporary_count == len(self.temporaries):
+            self.temporaries.append(len(self.memory))
+            self.temporary_slots.add(len(self.memory))
+            self.memory.append(0)
+        self.temporary_count += 1
+        return self.temporaries[self.temporary_count - 1]
+
+    def release(self, *slots):
+        # Temporaries are taken and given back in stack order.
+        self.temporary_count -= len([slot for slot in slots if slot in self.temporary_slots])
+
+    def emit(self, opcode, a=None, b=None, c=None, d=None):
+        self.code.append((opcode, a, b, c, d))
+        self.lines.append(self.current_line)
+
+    def emit_jump(self, opcode, label, *operands):
+        self.patches.append((len(self.code), label))
+        fields = list(operands)
+        fields.insert(TARGET_FIELDS[opcode] - 1, None)
+        self.emit(opcode, *fields)
+
+    def place_label(self, label):
+        self.labels[label] = len(self.code)
+
+    def resolve_jumps(self):
+        lines = sorted(self.line_addresses)
+        for pc, label in self.patches:
+            if label[0] == "line":
+                # Lines without a statement of their own, like END and
+                # ELSE, continue at the next statement after them.
+                i = bisect.bisect_left(lines, label[1])
+                target = self.line_addresses[lines[i]] if i < len(lines) else len(self.code)
+            else:
+                target = self.labels[label]
+            instruction = list(self.code[pc])
+            instruction[TARGET_FIELDS[instruction[0]]] = target
+            self.code[pc] = tuple(instruction)
+
+    def enter(self, node):
+        if node.line_number is not None and node.node_type() != "program":
+            self.current_line = node.line_number
+            self.line_addresses.setdefault(node.line_number, len(self.code))
+        self.temporary_count = 0
+        return super().enter(node)
+
+    def enter_assign(self, assign_node):
+        variable_node, expression_node = assign_node.children
+        slot = self.direct_slot(variable_node)
+        if slot is not None:
+            self.compile_expression(expression_node, slot)
+            return []
+
+        value = self.compile_expression(expression_node)
+        base, index, bounds = self.element(variable_node)
+        self.emit(STORE2 if isinstance(index, tuple) else STORE, base, index, bounds, value)
+        return []
+
+    def enter_initializer(self, initializer_node):
+        values = tuple(self.int_value(value) for value in initializer_node.values)
+        self.emit(INIT, self.slots[initializer_node.symbol], values)
+        return []
+
+    def enter_goto(self, goto_node):
+        self.emit_jump(JUMP, ("line", int(goto_node.children[0].value)))
+        return []
+
+    def enter_print(self, print_node):
+        format_node = print_node.children[0]
+        slots = tuple(self.compile_expression(argument_node) for argument_node in print_node.children[1:])
+        pieces = parse_format(format_node.value)
+        if pieces is None or len([piece for piece in pieces if piece[0] == "int"]) != len(slots):
+            python_format, unsigned = printf_format(format_node.value)
+            if len(unsigned) != len(slots):
+                raise Exception(f"Format string on line {print_node.line_number} expects "
+                                f"{len(unsigned)} arguments. Received {len(slots)}.")
+            if any(unsigned):
+                self.emit(PRINTF, python_format, slots, unsigned)
+            else:
+                self.emit(PRINT, python_format, slots)
+            return []
+
+        text = decode_string(format_node.value)
+        python_format = ""
+        for piece in pieces:
+            if piece[0] == "write":
+                kind, offset, length = piece
+                python_format += text[offset:offset + length].decode().replace("%", "%%")
+            else:
+                kind, width = piece
+                python_format += f"%{width}d" if width else "%d"
+        self.emit(PRINT, python_format, slots)
+        return []
+
+    def enter_println(self, println_node):
+        if println_node.children:
+            self.emit(PRINT, "%d\n", (self.compile_expression(println_node.children[0]),))
+        else:
+            self.emit(PRINT, "\n", ())
+        return []
+
+    def enter_for(self, for_node):
+        assign_node, limit_node, step_node, subroutine_node = for_node.children
+        variable_node = assign_node.children[0]
+        if self.direct_slot(variable_node) is None:
+            raise Exception(f"FOR variable on line {for_node.line_number} must not have a variable index.")
+
+        self.enter_assign(assign_node)
+        self.temporary_count = 0
+        limit = self.compile_expression(limit_node)
+        self.emit_jump(JGT, ("end", for_node), self.direct_slot(variable_node), limit)
+        self.place_label(("start", for_node))
+        return [subroutine_node]
+
+    def leave_for(self, for_node):
+        assign_node, limit_node, step_node, subroutine_node = for_node.children
+        variable = self.direct_slot(assign_node.children[0])
+        self.current_line = for_node.line_number
+        self.temporary_count = 0
+
+        step = self.compile_expression(step_node)
+        if self.is_direct(limit_node):
+            self.emit_jump(FOR_NEXT, ("start", for_node), variable, step, self.compile_expression(limit_node))
+        else:
+            # The limit is evaluated after the step, as it may use the variable.
+            self.emit(ADD, variable, variable, step)
+            limit = self.compile_expression(limit_node)
+            self.emit_jump(JLE, ("start", for_node), variable, limit)
+        self.place_label(("end", for_node))
+
+    def enter_if(self, if_node):
+        comparator_node = if_node.children[0]
+        if comparator_node.operation not in FALSE_JUMPS:
+            raise Exception(f"Expected comparator. Received {comparator_node.operation}.")
+
+        left = self.compile_expression(comparator_node.children[0])
+        right = self.compile_expression(comparator_node.children[1])
+        label = ("else", if_node) if len(if_node.children) > 2 else ("end", if_node)
+        self.emit_jump(FALSE_JUMPS[comparator_node.operation], label, left, right)
+        return if_node.children[1:]
+
+    def leave_subroutine(self, subroutine_node):
+        if_node = subroutine_node.parent
+        if if_node is None or if_node.node_type() != "if" or subroutine_node is not if_node.children[1]:
+            return
+        if len(if_node.children) > 2:
+            self.emit_jump(JUMP, ("end", if_node))
+            self.place_label(("else", if_node))
+
+    def leave_if(self, if_node):
+        self.place_label(("end", if_node))
+
+    def int_value(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise Exception(f"Only int values can be interpreted. Received {value} on line {self.current_line}.")
+
+    def is_direct(self, node):
+        if node.node_type() == "literal":
+            return True
+        return node.node_type() == "variable" and self.direct_slot(node) is not None
+
+    def direct_slot(self, variable_node):
+        # Scalars and elements with a constant index have a slot of their own.
+        if variable_node.num_of_dims() == 0:
+            return self.slots[variable_node.symbol]
+        constant, terms = index_terms(variable_node)
+        if terms:
+            return None
+        if not 0 <= constant < variable_node.num_of_items():
+            raise Exception(f"Index of {variable_node.name} out of bounds on line {self.current_line}.")
+        return self.slots[variable_node.symbol] + constant
+
+    def element(self, variable_node, slots=None):
+        # Returns the base, the slot holding the flattened index and the
+        # range the index must be in for an element with a variable index.
+        # Two terms are left for LOAD2 and STORE2 to add up themselves.
+        constant, terms = index_terms(variable_node)
+        if slots is None:
+            slots = {index_node: self.compile_expression(index_node) for index_node, stride in terms}
+        terms = [(slots[index_node], stride) for index_node, stride in terms]
+        self.release(*[slot for slot, stride in terms])
+
+        unit_terms = [term for term in terms if term[1] == 1]
+        if unit_terms and len(terms) == 1:
+            index = unit_terms[0][0]
+        elif unit_terms and len(terms) == 2:
+            terms.remove(unit_terms[0])
+            index = (unit_terms[0][0],) + terms[0]
+        else:
+            index = self.allocate_temporary()
+            if unit_terms:
+                terms.remove(unit_terms[0])
+                first = unit_terms[0][0]
+            else:
+                slot, stride = terms.pop(0)
+                self.emit(SCALE, index, slot, stride)
+                first = index
+            for slot, stride in terms:
+                self.emit(OFFSET, index, first, slot, stride)
+                first = index
+            self.release(index)
+
+        base = self.slots[variable_node.symbol] + constant
+        return base, index, range(-constant, variable_node.num_of_items() - constant)
+
+    def compile_expression(self, expression_node, destination=None):
+        # Returns the slot holding the value of the expression, writing it to
+        # the destination if one is given. Only temporaries are taken.
+        slots = {}
+        for node in walk_postorder(expression_node):
+            if node.parent is not None and node.parent.node_type() == "variable" and \
+                    node.node_type() == "literal" and node.type == "int":
+                continue
+            target = destination if node is expression_node else None
+            slots[node] = self.compile_node(node, slots, target)
+
+        slot = slots[expression_node]
+        if destination is not None and slot != destination:
+            self.emit(MOVE, destination, slot)
+            return destination
+        return slot
+
+    def compile_node(self, node, slots, destination):
+        node_type = node.node_type()
+        if node_type == "literal":
+            if node.type != "int":
+                raise Exception(f"Only int values can be interpreted. Received {node.value} on line {self.current_line}.")
+            return self.constant(int(node.value))
+
+        if node_type == "variable":
+            slot = self.direct_slot(node)
+            if slot is not None:
+                return slot
+            base, index, bounds = self.element(node, slots)
+            destination = self.allocate_temporary() if destination is None else destination
+            self.emit(LOAD2 if isinstance(index, tuple) else LOAD, destination, base, index, bounds)
+            return destination
+
+        if node_type != "operator":
+            raise Exception(f"Unexpected {node_type} node in expression on line {self.current_line}.")
+        operands = [slots[child_node] for child_node in node.children]
+        self.release(*operands)
+        destination = self.allocate_temporary() if destination is None else destination
+        if node.is_unary():
+            self.emit(NEG, destination, operands[0])
+        elif node.operation in OPERATIONS:
+            self.emit(OPERATIONS[node.operation], destination, *operands)
+        else:
+            raise Exception(f"Operator {node.operation} doesn't exist.")
+        return destination
+
+
+def compile_file(filename, optimize=True):
+    # The lexer reports the file it reads on stdout, which is the program's.
+    with contextlib.redirect_stdout(io.StringIO()):
+        ast = SyntaxAnalyser(filename=filename).build_ast()
+    if optimize:
+        ConstantFolder(ast).run()
+    return BytecodeCompiler(ast).run()
+
+
+if __name__ == "__main__":
+    filename = "sample_text.txt"
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    bytecode = compile_file(filename)
+    print(bytecode.disassemble())
+    print(f"Compiled {len(bytecode.code)} instructions using {len(bytecode.memory)} slots.")
@@ -1,249 +1,576 @@
-from node import IfNode
+from assembly_writer import AssemblyWriter, open_assembly
+from backend import BACKENDS, DEFAULT_BACKEND
+from constant_folder import ConstantFolder
+from elf_object import write_elf_object
+from frame_layout import FrameLayout
+from invariant_code_mover import InvariantCodeMover, index_terms
+from lexical_analyser import LexicalAnalyser
+from instruction import EAX, ECX, EDX, EDI, ESI, Directive, Immediate, Instruction, Label, Memory, Register, Target
+from liveness_analyser import LivenessAnalyser
+from pass_manager import PassManager
+from peephole_optimizer import PeepholeOptimizer
+from print_format import parse_format
+from register_allocator import RegisterAllocator, is_simple, is_register_variable, register_offset, sethi_ullman_numbers
+from strength_reducer import StrengthReducer
 from syntax_analyser import SyntaxAnalyser
+from token_buffer import TokenBuffer
+from visitor import NodeVisitor, walk_preorder
 
-import sys
+import argparse
+import os
 
-class CodeGenerator:
+OPERATIONS = {"+": "addl", "-": "subl", "*": "imul"}
+# Jumps taken when the comparison is false.
+FALSE_JUMPS = {"==": "jne", "<": "jge", "<=": "jg", ">": "jle", ">=": "jl", "<>": "je"}
+# Arrays up to this many elements are initialized with one store per element
+# instead of a block copy from their data.
+MAX_INLINE_INITIALIZER = 4
 
-    def __init__(self, filename="./sample_text.txt") -> None:
+class CodeGenerator(NodeVisitor):
+
+    def __init__(self, filename="./sample_text.txt", optimize=True, backend=DEFAULT_BACKEND, tokens=None,
+                 pass_manager=None, dump_tokens=False, dump_ast=False) -> None:
         self.filename = filename
+        self.optimize = optimize
+        self.tokens = tokens
+        self.dump_tokens = dump_tokens
+        self.dump_ast = dump_ast
+        self.backend = BACKENDS[backend]()
+        self.scratch_registers = self.backend.SCRATCH_REGISTERS
+        self.pass_manager = PassManager() if pass_manager is None else pass_manager
+        self.ast = None
+        self.string_list = []
         self.program_lines = []
         self.relative_address = 0
+        self.saved_registers = []
+        self.peephole_optimizer = None
         self.setup()
     
     def setup(self):
-        syntax_analyser = SyntaxAnalyser(filename=self.filename)
+        passes = [("lex", self.lex), ("parse", self.parse)]
+        if self.optimize:
+            passes += [
+                ("constant folding", lambda: ConstantFolder(self.ast).run()),
+                ("liveness", lambda: LivenessAnalyser(self.ast).run()),
+                ("loop invariants", lambda: InvariantCodeMover(self.ast).run()),
+                ("strength reduction", lambda: StrengthReducer(self.ast).run()),
+                ("register allocation", self.allocate_registers),
+            ]
+        self.pass_manager.run(passes, self)
+
+    def lex(self):
+        # The lexer streams into the parser, unless the passes are measured
+        # or dumped and the tokens have to exist on their own, in a TokenBuffer.
+        if self.tokens is None:
+            lexical_analyser = LexicalAnalyser(self.filename)
+            if self.pass_manager.collect_stats or self.dump_tokens:
+                self.tokens = lexical_analyser.tokenize()
+            else:
+                self.tokens = lexical_analyser.generate_tokens()
+        if self.dump_tokens:
+            self.print_tokens()
+
+    def print_tokens(self):
+        if not isinstance(self.tokens, TokenBuffer):
+            self.tokens = list(self.tokens)
+            for token in self.tokens:
+                print(token)
+            return
+        for index, token in enumerate(self.tokens):
+            line, column = self.tokens.location(index)
+            print(f"{line}:{column} {token}")
+
+    def parse(self):
+        syntax_analyser = SyntaxAnalyser(filename=self.filename, tokens=self.tokens)
         self.ast = syntax_analyser.build_ast()
-        self.all_strings = ""
-        for string in syntax_analyser.string_list:
-            self.all_strings += string.address + ":\n"
-            string_value = string.value[:-1] + "\\0\""
-            self.all_strings += f"\t.ascii\t{string_value}\n"
+        self.string_list = syntax_analyser.string_list
+        self.tokens = None
 
-    def run(self):
+    def allocate_registers(self):
+        registers = RegisterAllocator(self.ast, registers=list(self.backend.CALLEE_SAVED)).run()
+        self.saved_registers = [Register(name) for name in registers]
+        self.relative_address = self.backend.WORD_SIZE * len(self.saved_registers)
+
+    def generate(self):
         if self.ast.node_type() != "program":
             raise Exception(f"Root node must be a program node.")
 
-        program_node = self.ast
+        passes = [("emission", self.emit_program)]
+        if self.optimize:
+            passes.append(("peephole", self.optimize_peephole))
+        self.pass_manager.run(passes, self)
 
+    def emit_program(self):
         self.build_overhead()
+        self.visit(self.ast)
+        self.build_tail()
 
-        self.set_scope_variables_address(program_node)
+    def optimize_peephole(self):
+        self.peephole_optimizer = PeepholeOptimizer(self.program_lines)
+        self.program_lines = self.peephole_optimizer.run()
+
+    def run(self, output="final.s", object_file=False):
+        if object_file:
+            self.run_object(output)
+            return
+
+        # Without the peephole optimizer, which needs the whole program, the
+        # instructions are written to the output as they are emitted.
+        with open_assembly(output) as f:
+            if not self.optimize:
+                self.program_lines = AssemblyWriter(f)
+            self.generate()
+
+            if self.dump_ast:
+                self.ast.print_tree()
+
+            self.pass_manager.run([("write", lambda: self.write(f))], self)
+
+    def run_object(self, output="final.o"):
+        # Encodes the instructions straight into an object file, so no
+        # assembler runs before linking.
+        if self.backend.OBJECT_FORMAT != "elf64":
+            raise Exception(f"Objects can't be written for {self.backend.NAME}, only assembly.")
+        self.generate()
+        if self.dump_ast:
+            self.ast.print_tree()
+        self.pass_manager.run([("encode", lambda: write_elf_object(self.program_lines, output, self.filename))], self)
+
+    def write(self, output):
+        if isinstance(self.program_lines, AssemblyWriter):
+            self.program_lines.flush()
+        else:
+            writer = AssemblyWriter(output)
+            writer.extend(self.program_lines)
+            writer.flush()
 
-        for child_node in program_node.children:
-            self.generate_code(child_node)
+    def assembly(self):
+        return "\n".join(str(line) for line in self.program_lines) + "\n"
 
-        self.build_tail()
+    def emit(self, opcode, *operands):
+        self.program_lines.append(Instruction(opcode, *operands))
 
-        self.ast.print_tree()
+    def emit_label(self, name):
+        self.program_lines.append(Label(name))
 
-        f = open(f"final.s", "w")
-        f.write("\n".join(self.program_lines) + "\n")
-        f.close()
+    def emit_directive(self, text):
+        self.program_lines.append(Directive(text))
+
+    def enter_program(self, program_node):
+        frame_layout = FrameLayout(program_node, reserved=self.relative_address,
+                                   base_offset=self.backend.FRAME_BASE_OFFSET)
+        frame_size = frame_layout.run()
+        opcode = "subq" if self.backend.WORD_SIZE == 8 else "subl"
+        self.emit(opcode, Immediate(frame_size - self.relative_address), self.backend.stack_pointer)
 
-    def set_scope_variables_address(self, routine_node):
-        prev_relative_address = self.relative_address
-        for variable_node in routine_node.variable_list:
-            if variable_node.type == "int":
-                self.relative_address += 4 * variable_node.num_of_items()
-            routine_node.set_address(variable_node.name, self.relative_address)
-        self.program_lines.append(f"\tsubl\t${self.relative_address-prev_relative_address},\t%esp")
-        
-    def generate_code(self, node):
-        if node.node_type() == "assign":
-            self.generate_assign(node)
-        elif node.node_type() in ["print", "println"]:
-            self.generate_print(node)
-        elif node.node_type() == "for":
-            self.generate_for(node)
-        elif node.node_type() == "if":
-            self.generate_if(node)
+    def enter_assign(self, assign_node):
+        self.generate_assign(assign_node)
+        return []
+
+    def enter_print(self, print_node):
+        self.generate_print(print_node)
+        return []
+
+    def enter_println(self, println_node):
+        self.generate_printf(println_node)
+        return []
+
+    def enter_goto(self, goto_node):
+        return []
+
+    def enter_initializer(self, initializer_node):
+        values = initializer_node.values
+        base = -initializer_node.symbol.address
+        if len(values) <= MAX_INLINE_INITIALIZER:
+            for i, value in enumerate(values):
+                self.emit("movl", Immediate(value), self.backend.frame_memory(base + 4 * i))
+            return []
+
+        # esi and edi may hold variables or belong to the caller.
+        saved = [register for register in [ESI, EDI] if register.name in self.backend.CALLEE_SAVED]
+        for register in saved:
+            self.program_lines.append(self.backend.push(register))
+        self.program_lines.append(self.backend.load_address(self.backend.data(initializer_node.address), ESI))
+        self.program_lines.append(self.backend.load_address(self.backend.frame_memory(base), EDI))
+        self.emit("movl", Immediate(len(values)), ECX)
+        self.emit("rep movsl")
+        for register in saved[::-1]:
+            self.program_lines.append(self.backend.pop(register))
+        return []
 
     def generate_assign(self, node):
         variable_node = node.children[0]
         expression_node = node.children[1]
-        self.generate_expression(expression_node)
-        n_dims = variable_node.num_of_dims()
-        if n_dims != 0:
-            for n_dim in range(n_dims):
-                n_index_node = variable_node.children[n_dim]
-                self.generate_expression(n_index_node)
-            offset = 1
-            self.program_lines.append(f"\tmovl\t$0,\t%edx")
-            for dim in variable_node.dims[::-1]:
-                self.program_lines.append(f"\tpopl\t%eax")
-                self.program_lines.append(f"\timul\t${offset},\t%eax")
-                self.program_lines.append(f"\taddl\t%eax,\t%edx")
-                offset = offset * dim
-            self.program_lines.append(f"\tpopl\t%eax")
-            self.program_lines.append(f"\tmovl\t%eax,\t-{variable_node.address}(%ebp, %edx, 4)")
-        else:
-            self.program_lines.append(f"\tpopl\t%eax")
-            self.program_lines.append(f"\tmovl\t%eax,\t-{variable_node.address}(%ebp)")
+        if variable_node.register is not None:
+            self.generate_register_assign(variable_node, expression_node)
+            return
 
-    def generate_for(self, for_node):
+        if variable_node.num_of_dims() == 0 and self.is_update(variable_node, expression_node, ["+", "-"]):
+            right_node = expression_node.children[1]
+            if right_node.node_type() == "literal" or is_register_variable(right_node):
+                self.emit(OPERATIONS[expression_node.operation], self.operand(right_node), self.operand(variable_node))
+                return
+
+        value = self.value_operand(expression_node, self.scratch_registers)
+        if is_simple(variable_node):
+            self.emit("movl", value, self.operand(variable_node))
+            return
+        free = tuple(register for register in self.scratch_registers if register != value)
+        self.run_tasks(self.index_tasks(variable_node, free[0], free[1:]))
+        self.emit("movl", value, self.element(variable_node, free[0]))
+
+    def generate_register_assign(self, variable_node, expression_node):
+        register = Register(variable_node.register)
+        if not self.references(expression_node, variable_node.symbol):
+            self.generate_expression(expression_node, register, self.scratch_registers)
+            return
+
+        if self.is_update(variable_node, expression_node, OPERATIONS):
+            value = self.source_operand(expression_node.children[1], self.scratch_registers)
+            self.emit(OPERATIONS[expression_node.operation], value, register)
+            return
+
+        self.generate_expression(expression_node, EAX, self.scratch_registers[1:])
+        self.emit("movl", EAX, register)
+
+    def is_update(self, variable_node, expression_node, operations):
+        if (expression_node.node_type() != "operator" or expression_node.is_unary() or
+                expression_node.operation not in operations):
+            return False
+        left_node, right_node = expression_node.children
+        return (left_node.node_type() == "variable" and left_node.symbol is variable_node.symbol and
+                not left_node.children and not self.references(right_node, variable_node.symbol))
+
+    def references(self, expression_node, symbol):
+        return any(node.node_type() == "variable" and node.symbol is symbol
+                   for node in walk_preorder(expression_node))
+
+    def enter_for(self, for_node):
         assign_node = for_node.children[0]
-        variable_node = assign_node.children[0]
-        limit_node = for_node.children[1]
-        step_node = for_node.children[2]
         subroutine_node = for_node.children[3]
 
         self.generate_assign(assign_node)
-        self.program_lines.append(f"\tjmp\tFOR_{for_node.line_number}_END")
-        self.program_lines.append(f"FOR_{for_node.line_number}_START:")
-        
-        self.set_scope_variables_address(subroutine_node)
-        for child_node in subroutine_node.children:
-            self.generate_code(child_node)
-
-        self.program_lines.append(f"\taddl\t${step_node.value},\t-{variable_node.address}(%ebp)")
-        self.program_lines.append(f"FOR_{for_node.line_number}_END:")
-
-        self.generate_expression(limit_node)
-        self.program_lines.append(f"\tpopl\t%eax")
-        self.program_lines.append(f"\tcmpl\t%eax,\t-{variable_node.address}(%ebp)")
-        self.program_lines.append(f"\tjle\tFOR_{for_node.line_number}_START")
-
-    def generate_if(self, if_node):
+        self.emit("jmp", Target(f"FOR_{for_node.line_number}_END"))
+        self.emit_label(f"FOR_{for_node.line_number}_START")
+        return [subroutine_node]
+
+    def leave_for(self, for_node):
+        variable_node = for_node.children[0].children[0]
+        limit_node = for_node.children[1]
+        step_node = for_node.children[2]
+        variable = self.operand(variable_node)
+
+        self.emit("addl", self.literal_operand(step_node), variable)
+        self.emit_label(f"FOR_{for_node.line_number}_END")
+
+        limit = self.source_operand(limit_node, self.scratch_registers)
+        if isinstance(limit, Memory) and isinstance(variable, Memory):
+            self.emit("movl", limit, EAX)
+            limit = EAX
+        self.emit("cmpl", limit, variable)
+        self.emit("jle", Target(f"FOR_{for_node.line_number}_START"))
+
+    def enter_if(self, if_node):
         comparator_node = if_node.children[0]
-        true_node = if_node.children[1]
         if len(if_node.children) > 2:
-            false_node = if_node.children[2]
             destination = f"ELSE_{if_node.line_number}"
         else:
-            false_node = None
             destination = f"END_{if_node.line_number}"
 
+        if comparator_node.operation not in FALSE_JUMPS:
+            raise Exception(f"Expected comparator. Received {comparator_node.value}.")
+
         left_node = comparator_node.children[0]
         right_node = comparator_node.children[1]
-        self.generate_expression(left_node)
-        self.generate_expression(right_node)
-        self.program_lines.append(f"\tpopl\t%eax")
-        self.program_lines.append(f"\tpopl\t%edx")
-
-        if comparator_node.operation == "==":
-            jump = "jne"
-        elif comparator_node.operation == "<":
-            jump = "jg"
-            self.program_lines.append(f"\tsubl\t$1,\t%eax")
-        elif comparator_node.operation == "<=":
-            jump = "jg"
-        elif comparator_node.operation == ">":
-            jump = "jle"
-        elif comparator_node.operation == ">=":
-            jump = "jle"
-            self.program_lines.append(f"\tsubl\t$1,\t%eax")
-        elif comparator_node.operation == "<>":
-            jump = "je"
+        if is_simple(left_node) and is_simple(right_node):
+            left = self.operand(left_node)
+            right = self.operand(right_node)
+            if isinstance(left, Immediate) or (isinstance(left, Memory) and isinstance(right, Memory)):
+                self.emit("movl", left, EAX)
+                left = EAX
+            self.emit("cmpl", right, left)
         else:
-            raise Exception(f"Expected comparator. Received {comparator_node.value}.")
+            needs = sethi_ullman_numbers(comparator_node)
+            self.run_tasks(self.binary_tasks("cmpl", left_node, right_node, EAX, self.scratch_registers[1:], needs))
+        self.emit(FALSE_JUMPS[comparator_node.operation], Target(destination))
 
-        self.program_lines.append(f"\tcmpl\t%eax,\t%edx")
-        self.program_lines.append(f"\t{jump}\t{destination}")
-
-        for child_node in true_node.children:
-            self.generate_code(child_node)
-        self.program_lines.append(f"\tjmp\tEND_{if_node.line_number}")
-
-        if false_node is not None:
-            self.program_lines.append(f"ELSE_{if_node.line_number}:")
-            for child_node in false_node.children:
-                self.generate_code(child_node)
-
-        self.program_lines.append(f"END_{if_node.line_number}:")
-
-    def generate_expression(self, expression_node):
-        if expression_node.node_type() == "literal":
-            self.program_lines.append(f"\tpushl\t${expression_node.value}")
-        elif expression_node.node_type() == "variable":
-            n_dims = expression_node.num_of_dims()
-            if n_dims != 0:
-                for n_dim in range(n_dims):
-                    n_index_node = expression_node.children[n_dim]
-                    self.generate_expression(n_index_node)
-                offset = 1
-                self.program_lines.append(f"\tmovl\t$0,\t%edx")
-                for dim in expression_node.dims[::-1]:
-                    self.program_lines.append(f"\tpopl\t%eax")
-                    self.program_lines.append(f"\timul\t${offset},\t%eax")
-                    self.program_lines.append(f"\taddl\t%eax,\t%edx")
-                    offset = offset * dim
-                self.program_lines.append(f"\tpushl\t-{expression_node.address}(%ebp, %edx, 4)")
-            else:
-                self.program_lines.append(f"\tpushl\t-{expression_node.address}(%ebp)")
-        elif expression_node.node_type() == "operator":
-            left_node = expression_node.children[0]
-            right_node = expression_node.children[1]
-            self.generate_expression(left_node)
-            self.generate_expression(right_node)
-            self.program_lines.append(f"\tpopl\t%edx")
-            self.program_lines.append(f"\tpopl\t%eax")
-            if expression_node.operation == "+":
-                operation = "addl"
-            elif expression_node.operation == "-":
-                operation = "subl"
-            elif expression_node.operation == "*":
-                operation = "imul"
-            elif expression_node.operation == "/":
-                operation = "idivl"
+        return if_node.children[1:]
+
+    def leave_subroutine(self, subroutine_node):
+        if_node = subroutine_node.parent
+        if if_node.node_type() != "if" or subroutine_node is not if_node.children[1]:
+            return
+
+        self.emit("jmp", Target(f"END_{if_node.line_number}"))
+        if len(if_node.children) > 2:
+            self.emit_label(f"ELSE_{if_node.line_number}")
+
+    def leave_if(self, if_node):
+        self.emit_label(f"END_{if_node.line_number}")
+
+    def literal_operand(self, literal_node):
+        if literal_node.type == "int":
+            return Immediate(int(literal_node.value))
+        return Immediate(literal_node.value)
+
+    def operand(self, node):
+        if node.node_type() == "literal":
+            return self.literal_operand(node)
+        if node.register is not None:
+            return Register(node.register)
+        constant, terms = index_terms(node)
+        if terms:
+            index_node, offset = register_offset(terms[0][0])
+            return self.backend.frame_memory(-node.address + 4 * (constant + offset), Register(index_node.register))
+        return self.backend.frame_memory(-node.address + 4 * constant)
+
+    def element(self, variable_node, index_register):
+        constant, terms = index_terms(variable_node)
+        return self.backend.frame_memory(-variable_node.address + 4 * constant, index_register)
+
+    def scale_instructions(self, register, factor):
+        if factor == 1:
+            return []
+        if factor in [2, 4, 8]:
+            return [Instruction("shll", Immediate(factor.bit_length() - 1), register)]
+        if factor in [3, 5, 9]:
+            address_register = self.backend.address_register(register)
+            return [Instruction("leal", Memory(0, address_register, address_register, factor - 1), register)]
+        return [Instruction("imul", Immediate(factor), register)]
+
+    def source_operand(self, expression_node, free):
+        if is_simple(expression_node):
+            return self.operand(expression_node)
+        self.generate_expression(expression_node, free[0], free[1:])
+        return free[0]
+
+    def value_operand(self, expression_node, free):
+        if is_simple(expression_node):
+            operand = self.operand(expression_node)
+            if not isinstance(operand, Memory):
+                return operand
+        self.generate_expression(expression_node, free[0], free[1:])
+        return free[0]
+
+    def generate_expression(self, expression_node, destination, free):
+        needs = sethi_ullman_numbers(expression_node)
+        self.run_tasks([(expression_node, destination, free)], needs)
+
+    def run_tasks(self, tasks, needs=None):
+        # Tasks are either instructions to emit or (node, destination, free)
+        # triples still to be expanded, so deep expressions need no recursion.
+        stack = tasks[::-1]
+        while stack:
+            task = stack.pop()
+            if isinstance(task, Instruction):
+                self.program_lines.append(task)
+                continue
+            node, destination, free = task
+            if needs is None or node not in needs:
+                needs = sethi_ullman_numbers(node)
+            stack.extend(self.expression_tasks(node, destination, free, needs)[::-1])
+
+    def expression_tasks(self, node, destination, free, needs):
+        if is_simple(node):
+            operand = self.operand(node)
+            if operand == destination:
+                return []
+            return [Instruction("movl", operand, destination)]
+
+        if node.node_type() == "variable":
+            return (self.index_tasks(node, destination, free) +
+                    [Instruction("movl", self.element(node, destination), destination)])
+
+        if node.is_unary():
+            return [(node.children[0], destination, free), Instruction("negl", destination)]
+
+        left_node, right_node = node.children
+        if node.operation == "/":
+            return self.division_tasks(left_node, right_node, destination, free, needs)
+        if node.operation not in OPERATIONS:
+            raise Exception(f"Operator {node.operation} doesn't exist.")
+        return self.binary_tasks(OPERATIONS[node.operation], left_node, right_node, destination, free, needs)
+
+    def binary_tasks(self, opcode, left_node, right_node, destination, free, needs):
+        if opcode == "imul" and right_node.node_type() == "literal":
+            return [(left_node, destination, free)] + self.scale_instructions(destination, int(right_node.value))
+        if is_simple(right_node):
+            return [(left_node, destination, free), Instruction(opcode, self.operand(right_node), destination)]
+
+        if not free:
+            return self.spill_tasks(left_node, right_node, destination, free) + [
+                Instruction(opcode, self.backend.stack_slot(0), destination),
+                self.backend.release(1),
+            ]
+
+        temporary = free[0]
+        if max(1, needs[left_node]) >= needs[right_node]:
+            tasks = [(left_node, destination, free), (right_node, temporary, free[1:])]
+        else:
+            tasks = [(right_node, temporary, (destination,) + free[1:]), (left_node, destination, free[1:])]
+        return tasks + [Instruction(opcode, temporary, destination)]
+
+    def spill_tasks(self, left_node, right_node, destination, free):
+        return [(right_node, destination, free), self.backend.push(destination), (left_node, destination, free)]
+
+    def division_tasks(self, left_node, right_node, destination, free, needs):
+        divisor = self.operand(right_node) if is_simple(right_node) else None
+        temporaries = [register for register in free if register not in [EAX, EDX]]
+        spilled = False
+        if divisor is not None and not isinstance(divisor, Immediate) and not {"eax", "edx"} & set(divisor.registers()):
+            tasks = [(left_node, destination, free)]
+        elif temporaries:
+            divisor = temporaries[0]
+            rest = tuple(register for register in free if register != divisor)
+            if max(1, needs[left_node]) >= needs[right_node]:
+                tasks = [(left_node, destination, free), (right_node, divisor, rest)]
             else:
-                raise Exception(f"Operator {expression_node.operation} doesn't exist.")
-            if operation == "idivl":
-                self.program_lines.append(f"\tmovl\t%edx,\t%ecx")
-                self.program_lines.append(f"\tcltd")
-                self.program_lines.append(f"\tidivl\t%ecx")
+                tasks = [(right_node, divisor, (destination,) + rest), (left_node, destination, rest)]
+        else:
+            tasks = self.spill_tasks(left_node, right_node, destination, free)
+            divisor = self.backend.stack_slot(0)
+            spilled = True
+
+        saved = [register for register in [EAX, EDX] if register != destination and register not in free]
+        if isinstance(divisor, Memory) and divisor.base == self.backend.stack_pointer:
+            divisor = self.backend.stack_slot(len(saved))
+        tasks += [self.backend.push(register) for register in saved]
+        if destination != EAX:
+            tasks.append(Instruction("movl", destination, EAX))
+        tasks += [Instruction("cltd"), Instruction("idivl", divisor)]
+        if destination != EAX:
+            tasks.append(Instruction("movl", EAX, destination))
+        tasks += [self.backend.pop(register) for register in saved[::-1]]
+        if spilled:
+            tasks.append(self.backend.release(1))
+        return tasks
+
+    def index_tasks(self, variable_node, destination, free):
+        constant, terms = index_terms(variable_node)
+        tasks = []
+        for i, (index_node, stride) in enumerate(terms):
+            if i == 0:
+                tasks.append((index_node, destination, free))
+                tasks += self.scale_instructions(destination, stride)
+            elif is_simple(index_node) and stride == 1:
+                tasks.append(Instruction("addl", self.operand(index_node), destination))
+            elif is_register_variable(index_node) and stride in [2, 4, 8]:
+                base = self.backend.address_register(destination)
+                index = self.backend.address_register(Register(index_node.register))
+                tasks.append(Instruction("leal", Memory(0, base, index, stride), destination))
+            elif free:
+                if is_simple(index_node):
+                    tasks.append(Instruction("imul", Immediate(stride), self.operand(index_node), free[0]))
+                else:
+                    tasks.append((index_node, free[0], free[1:]))
+                    tasks += self.scale_instructions(free[0], stride)
+                tasks.append(Instruction("addl", free[0], destination))
             else:
-                self.program_lines.append(f"\t{operation}\t%edx,\t%eax")
-            self.program_lines.append(f"\tpushl\t%eax")
+                tasks += [self.backend.push(destination), (index_node, destination, free)]
+                tasks += self.scale_instructions(destination, stride)
+                tasks += [Instruction("addl", self.backend.stack_slot(0), destination), self.backend.release(1)]
+        return tasks
 
     def generate_print(self, print_node):
-
-        for child_node in print_node.children[::-1]:
-            if child_node == print_node.children[0]:
-                self.program_lines.append(f"\tpushl\t${child_node.address}")
+        format_node = print_node.children[0]
+        argument_nodes = print_node.children[1:]
+        pieces = parse_format(format_node.value)
+        if (pieces is None or
+                len([piece for piece in pieces if piece[0] == "int"]) != len(argument_nodes) or
+                any(argument_node.type != "int" for argument_node in argument_nodes)):
+            self.generate_printf(print_node)
+            return
+
+        argument_nodes = iter(argument_nodes)
+        for piece in pieces:
+            if piece[0] == "write":
+                kind, offset, length = piece
+                address = f"{format_node.address}+{offset}" if offset else format_node.address
+                self.backend.call(self, "basic_write", [address, Immediate(length)])
             else:
-                self.generate_expression(child_node)
+                kind, width = piece
+                self.backend.call(self, "basic_write_int", [next(argument_nodes), Immediate(width)])
 
-        self.program_lines.append(f"\tcall\t_printf")
-
-        for child_node in print_node.children:  
-            self.program_lines.append(f"\tpopl %eax")
+    def generate_printf(self, print_node):
+        format_node = print_node.children[0]
+        if format_node.node_type() == "literal":
+            arguments = [format_node.address]
+        else:
+            arguments = [Immediate(format_node.address)]
+        self.backend.call(self, "basic_printf", arguments + print_node.children[1:], variadic=True)
 
     def build_overhead(self):
-        overhead = f"""\t.file	"{self.filename}"
-	.text
-	.def	___main;	.scl	2;	.type	32;	.endef
-	.section .rdata,"dr"
-{self.all_strings}
-	.text
-	.globl	_main
-	.def	_main;	.scl	2;	.type	32;	.endef
-_main:
-LFB11:
-	.cfi_startproc
-	pushl	%ebp
-	.cfi_def_cfa_offset 8
-	.cfi_offset 5, -8
-	movl	%esp, %ebp
-	.cfi_def_cfa_register 5
-	call	___main"""
-        self.program_lines.append(overhead)
+        self.emit_directive(f'\t.file\t"{self.filename}"')
+        self.backend.begin_data(self)
+        for string in self.string_list:
+            self.emit_label(string.address)
+            string_value = string.value[:-1] + "\\0\""
+            self.emit_directive(f"\t.ascii\t{string_value}")
+        initializer_nodes = [node for node in walk_preorder(self.ast) if node.node_type() == "initializer"]
+        if initializer_nodes:
+            self.emit_directive("\t.align 4")
+        for initializer_node in initializer_nodes:
+            if len(initializer_node.values) <= MAX_INLINE_INITIALIZER:
+                continue
+            self.emit_label(initializer_node.address)
+            for i in range(0, len(initializer_node.values), 8):
+                self.emit_directive(f"\t.long\t{', '.join(initializer_node.values[i:i + 8])}")
+        self.backend.begin_main(self, self.saved_registers)
 
     def build_tail(self):
-        tail = """\tnop
-	leave
-	.cfi_restore 5
-	.cfi_def_cfa 4, 4
-	ret
-	.cfi_endproc
-LFE11:
-	.ident	"GCC: (MinGW.org GCC-8.2.0-3) 8.2.0"
-	.def	_printf;	.scl	2;	.type	32;	.endef"""
-        self.program_lines.append(tail)
+        self.backend.end_main(self, self.saved_registers)
 
 if __name__ == "__main__":
-    filename = "sample_text.txt"
-    if len(sys.argv) > 1:
-        filename = sys.argv[1]
-    code_generator = CodeGenerator(filename=filename)
-    code_generator.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Compiles a BASIC program to assembly.")
+    parser.add_argument("filename", nargs="?", default="sample_text.txt")
+    parser.add_argument("-o", "--output", help="where to write the assembly, or the object with --object")
+    parser.add_argument("--object", action="store_true",
+                        help="encode an ELF object directly instead of writing assembly, x86_64-linux only")
+    parser.add_argument("--no-optimize", dest="optimize", action="store_false",
+                        help="skip the optimization passes, streaming the assembly as it is emitted")
+    parser.add_argument("--target", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--cache-dir", default=os.environ.get("BASIC_CACHE_DIR"),
+                        help="reuse the output of earlier compilations stored in this directory")
+    parser.add_argument("--cache-size", type=int, default=256, help="cache size limit in MiB")
+    parser.add_argument("--stats", action="store_true",
+                        help="print the optimizer reports and the time and sizes of every pass, "
+                             "or the cache report when the cache is used")
+    parser.add_argument("--profile", action="store_true", help="like --stats, also tracing peak memory")
+    parser.add_argument("--stats-json", metavar="PATH", help="write the pass statistics as JSON, - for stdout")
+    parser.add_argument("--dump-tokens", action="store_true", help="print every token with its line and column")
+    parser.add_argument("--dump-ast", action="store_true", help="print the optimized syntax tree")
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = "final.o" if args.object else "final.s"
+    measured = args.stats or args.profile or args.stats_json is not None
+    # Profiles, JSON statistics, token dumps and objects always run every
+    # pass instead of using the cache.
+    if args.cache_dir is None or args.profile or args.stats_json is not None or args.dump_tokens or args.object:
+        pass_manager = PassManager(collect_stats=measured, trace_memory=args.profile)
+        code_generator = CodeGenerator(filename=args.filename, optimize=args.optimize, backend=args.target,
+                                       pass_manager=pass_manager, dump_tokens=args.dump_tokens,
+                                       dump_ast=args.dump_ast)
+        code_generator.run(args.output, object_file=args.object)
+        pass_manager.stop()
+        if args.stats or args.profile:
+            if code_generator.peephole_optimizer is not None:
+                print(code_generator.peephole_optimizer.report())
+            print(pass_manager.table())
+        if args.stats_json == "-":
+            print(pass_manager.to_json(filename=args.filename, target=args.target))
+        elif args.stats_json is not None:
+            f = open(args.stats_json, "w")
+            f.write(pass_manager.to_json(filename=args.filename, target=args.target) + "\n")
+            f.close()
+    else:
+        from compile_cache import CompileCache
+
+        cache = CompileCache(args.cache_dir, args.cache_size * 2**20)
+        ast, assembly = cache.compile(args.filename, optimize=args.optimize, backend=args.target)
+        if args.dump_ast and ast is not None:
+            ast.print_tree()
+        if args.stats:
+            print(cache.report())
+        f = open_assembly(args.output)
+        f.write(assembly)
+        f.close()
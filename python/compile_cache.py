@@ -0,0 +1,170 @@
+from backend import DEFAULT_BACKEND
+from code_generator import CodeGenerator
+from lexical_analyser import LexicalAnalyser
+
+import argparse
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "basic_compiler")
+DEFAULT_CACHE_SIZE = 256 * 2**20
+# Bumped when the layout of the entries changes.
+CACHE_VERSION = 2
+
+_compiler_fingerprint = None
+
+
+def compiler_fingerprint():
+    # Every module of the compiler goes into the keys, so editing any of
+    # them makes all earlier entries unreachable.
+    global _compiler_fingerprint
+    if _compiler_fingerprint is None:
+        digest = hashlib.sha256(f"{CACHE_VERSION} {sys.version_info[:2]}".encode())
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+            digest.update(os.path.basename(path).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        _compiler_fingerprint = digest.hexdigest()
+    return _compiler_fingerprint
+
+
+class CompileCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # Running size of the cache, read from the disk on the first put and
+        # again whenever it crosses the limit.
+        self.total_size = None
+
+    def key(self, kind, source, *options):
+        digest = hashlib.sha256(f"{compiler_fingerprint()} {kind} {options!r}".encode())
+        digest.update(source)
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            entry = {}
+            for name in os.listdir(path):
+                with open(os.path.join(path, name), "rb") as f:
+                    entry[name] = f.read()
+            # The modification time of an entry is its last use.
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        # Entries are written aside and renamed into place, so that
+        # concurrent compilers never see half of one.
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = tempfile.mkdtemp(prefix=".", dir=os.path.dirname(path))
+        for name, data in entry.items():
+            with open(os.path.join(temporary_path, name), "wb") as f:
+                f.write(data)
+        if self.total_size is None:
+            self.total_size = sum(size for used, size, path in self.entries())
+        try:
+            os.rename(temporary_path, path)
+        except OSError:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            return
+        self.total_size += sum(len(data) for data in entry.values())
+        if self.total_size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "??", "*")):
+            try:
+                size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for used, size, path in entries)
+        for used, size, path in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self.evicted += 1
+        self.total_size = total
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.total_size = 0
+
+    def compile(self, filename, optimize=True, backend=DEFAULT_BACKEND):
+        # Returns the optimized AST, or None if it could not be stored, and
+        # the assembly. The tokens only depend on the source, so they are
+        # shared by builds with different options.
+        with open(filename, "rb") as f:
+            source = f.read()
+        build_key = self.key("build", source, filename, optimize, backend)
+        entry = self.get(build_key)
+        if entry is not None:
+            ast = pickle.loads(entry["ast"]) if "ast" in entry else None
+            return ast, entry["final.s"].decode()
+
+        tokens_key = self.key("tokens", source)
+        entry = self.get(tokens_key)
+        if entry is not None:
+            lexed = False
+            tokens = pickle.loads(entry["tokens"])
+        else:
+            lexed = True
+            tokens = LexicalAnalyser(filename).tokenize()
+
+        code_generator = CodeGenerator(filename=filename, optimize=optimize, backend=backend, tokens=tokens)
+        code_generator.generate()
+        assembly = code_generator.assembly()
+
+        if lexed:
+            self.put(tokens_key, {"tokens": pickle.dumps(tokens, pickle.HIGHEST_PROTOCOL)})
+        entry = {"final.s": assembly.encode()}
+        try:
+            entry["ast"] = pickle.dumps(code_generator.ast, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # Deeply nested programs are cached without their AST.
+            pass
+        self.put(build_key, entry)
+        return code_generator.ast, assembly
+
+    def report(self):
+        entries = self.entries()
+        size = sum(size for used, size, path in entries)
+        return (f"Compile cache: {self.hits} hits, {self.misses} misses, {self.evicted} evicted, "
+                f"{len(entries)} entries using {size / 2**20:.1f} MiB of {self.max_size / 2**20:.0f} MiB.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reports on or empties the compile cache.")
+    parser.add_argument("--cache-dir", default=os.environ.get("BASIC_CACHE_DIR", DEFAULT_CACHE_DIR))
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE // 2**20, help="size limit in MiB")
+    parser.add_argument("--clear", action="store_true")
+    args = parser.parse_args()
+    cache = CompileCache(args.cache_dir, args.cache_size * 2**20)
+    if args.clear:
+        cache.clear()
+    else:
+        cache.evict()
+    print(cache.report())
@@ -0,0 +1,231 @@
+from node import LiteralNode, OperatorNode
+from visitor import NodeVisitor, walk_postorder, walk_preorder
+
+import sys
+
+
+def to_int32(value):
+    value &= 0xFFFFFFFF
+    return value - (1 << 32) if value & 0x80000000 else value
+
+
+def is_int_literal(node, value=None):
+    if node.node_type() != "literal" or node.type != "int":
+        return False
+    return value is None or int(node.value) == value
+
+
+def int_literal(value):
+    return LiteralNode(str(value), "int")
+
+
+def evaluate(operation, left, right):
+    if operation == "+":
+        return to_int32(left + right)
+    if operation == "-":
+        return to_int32(left - right)
+    if operation == "*":
+        return to_int32(left * right)
+    if operation == "/":
+        if right == 0:
+            return None
+        quotient = abs(left) // abs(right)
+        return to_int32(quotient if (left < 0) == (right < 0) else -quotient)
+    raise Exception(f"Operator {operation} doesn't exist.")
+
+
+def replace(node, new_node):
+    parent = node.parent
+    for i, child_node in enumerate(parent.children):
+        if child_node is node:
+            parent.children[i] = new_node
+            break
+    node.parent = None
+    new_node.parent = parent
+    return new_node
+
+
+class ConstantFolder(NodeVisitor):
+
+    def __init__(self, ast) -> None:
+        self.ast = ast
+        self.constants = {}
+        self.scope_constants = []
+        self.assignment_counts = {}
+        self.propagate = True
+        self.folded_operations = 0
+        self.simplified_identities = 0
+        self.propagated_constants = 0
+
+    def run(self):
+        for node in walk_preorder(self.ast):
+            if node.node_type() == "goto":
+                self.propagate = False
+            elif node.node_type() == "assign":
+                symbol = node.children[0].symbol
+                self.assignment_counts[symbol] = self.assignment_counts.get(symbol, 0) + 1
+
+        self.visit(self.ast)
+        return self.ast
+
+    def enter_program(self, program_node):
+        self.scope_constants.append([])
+
+    def enter_subroutine(self, subroutine_node):
+        self.scope_constants.append([])
+
+    def leave_subroutine(self, subroutine_node):
+        for symbol in self.scope_constants.pop():
+            del self.constants[symbol]
+
+    def enter_assign(self, assign_node):
+        variable_node = assign_node.children[0]
+        for index_node in list(variable_node.children):
+            self.fold(index_node)
+        expression_node = self.fold(assign_node.children[1])
+
+        if (self.propagate and
+                variable_node.num_of_dims() == 0 and
+                self.assignment_counts[variable_node.symbol] == 1 and
+                assign_node.parent.node_type() in ["program", "subroutine"] and
+                is_int_literal(expression_node)):
+            self.constants[variable_node.symbol] = int(expression_node.value)
+            self.scope_constants[-1].append(variable_node.symbol)
+        return []
+
+    def enter_for(self, for_node):
+        self.enter_assign(for_node.children[0])
+        self.fold(for_node.children[1])
+        self.fold(for_node.children[2])
+        return [for_node.children[3]]
+
+    def enter_if(self, if_node):
+        comparator_node = if_node.children[0]
+        for child_node in list(comparator_node.children):
+            self.fold(child_node)
+        return if_node.children[1:]
+
+    def enter_print(self, print_node):
+        for child_node in print_node.children[1:]:
+            self.fold(child_node)
+        return []
+
+    def enter_println(self, println_node):
+        return []
+
+    def enter_goto(self, goto_node):
+        return []
+
+    def fold(self, expression_node):
+        root_node = expression_node
+        for node in list(walk_postorder(expression_node)):
+            if node.node_type() == "variable":
+                new_node = self.propagate_constant(node)
+            elif node.node_type() == "operator":
+                new_node = self.fold_operator(node)
+            else:
+                continue
+            if new_node is not node:
+                replace(node, new_node)
+                if node is root_node:
+                    root_node = new_node
+        return root_node
+
+    def propagate_constant(self, variable_node):
+        if variable_node.num_of_dims() != 0 or variable_node.symbol not in self.constants:
+            return variable_node
+        self.propagated_constants += 1
+        return int_literal(self.constants[variable_node.symbol])
+
+    def fold_operator(self, operator_node):
+        if operator_node.is_unary():
+            operand_node = operator_node.children[0]
+            if is_int_literal(operand_node):
+                self.folded_operations += 1
+                return int_literal(to_int32(-int(operand_node.value)))
+            if operand_node.node_type() == "operator" and operand_node.is_unary():
+                self.simplified_identities += 1
+                return operand_node.children[0]
+            return operator_node
+
+        left_node, right_node = operator_node.children
+        operation = operator_node.operation
+        if is_int_literal(left_node) and is_int_literal(right_node):
+            value = evaluate(operation, int(left_node.value), int(right_node.value))
+            if value is None:
+                return operator_node
+            self.folded_operations += 1
+            return int_literal(value)
+
+        new_node = self.simplify_identity(operator_node, operation, left_node, right_node)
+        if new_node is not operator_node:
+            self.simplified_identities += 1
+        return new_node
+
+    def simplify_identity(self, operator_node, operation, left_node, right_node):
+        if operation in ["+", "-"] and is_int_literal(right_node, 0):
+            return left_node
+        if operation == "+" and is_int_literal(left_node, 0):
+            return right_node
+        if operation == "-" and is_int_literal(left_node, 0):
+            return self.negate(right_node)
+        if operation in ["*", "/"] and is_int_literal(right_node, 1):
+            return left_node
+        if operation == "*" and is_int_literal(left_node, 1):
+            return right_node
+        if operation == "*" and (is_int_literal(left_node, 0) or is_int_literal(right_node, 0)):
+            # Keep operands that may divide by zero, the fault must still happen.
+            if not any(node.node_type() == "operator" and node.operation == "/"
+                       for node in walk_preorder(operator_node)):
+                return int_literal(0)
+        if operation in ["+", "-"] and is_int_literal(right_node):
+            return self.combine_offsets(operator_node, left_node, right_node)
+        return operator_node
+
+    def combine_offsets(self, operator_node, left_node, right_node):
+        if (left_node.node_type() != "operator" or left_node.is_unary() or
+                left_node.operation not in ["+", "-"] or
+                not is_int_literal(left_node.children[1])):
+            return operator_node
+        inner_value = int(left_node.children[1].value)
+        if left_node.operation == "-":
+            inner_value = -inner_value
+        outer_value = int(right_node.value)
+        if operator_node.operation == "-":
+            outer_value = -outer_value
+        value = to_int32(inner_value + outer_value)
+        if value == -2 ** 31:
+            return operator_node
+
+        base_node = left_node.children[0]
+        if value == 0:
+            return base_node
+        new_node = OperatorNode("+" if value > 0 else "-")
+        new_node.type = operator_node.type
+        new_node.add_child(base_node)
+        new_node.add_child(int_literal(abs(value)))
+        return new_node
+
+    def negate(self, expression_node):
+        operator_node = OperatorNode("-")
+        operator_node.type = expression_node.type
+        operator_node.add_child(expression_node)
+        return operator_node
+
+    def report(self):
+        return (f"Constant folder: folded {self.folded_operations} operations, "
+                f"simplified {self.simplified_identities} identities and "
+                f"propagated {self.propagated_constants} constants.")
+
+
+if __name__ == "__main__":
+    from syntax_analyser import SyntaxAnalyser
+
+    filename = "sample_text.txt"
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    ast = SyntaxAnalyser(filename=filename).build_ast()
+    constant_folder = ConstantFolder(ast)
+    constant_folder.run()
+    ast.print_tree()
+    print(constant_folder.report())
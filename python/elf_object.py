@@ -0,0 +1,303 @@
+from x86_encoder import ObjectAssembler
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+
+ELF_IDENT = b"\x7fELF\x02\x01\x01" + bytes(9)
+ET_REL = 1
+EM_X86_64 = 62
+
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_RELA = 4
+SHT_NOBITS = 8
+SHF_WRITE = 1
+SHF_ALLOC = 2
+SHF_EXECINSTR = 4
+SHF_INFO_LINK = 0x40
+
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STT_NOTYPE = 0
+STT_FUNC = 2
+STT_SECTION = 3
+STT_FILE = 4
+SHN_UNDEF = 0
+SHN_ABS = 0xFFF1
+
+RELOCATION_TYPES = {"pc32": 2, "plt32": 4}
+RELOCATION_NAMES = {number: name for name, number in RELOCATION_TYPES.items()}
+# Type and flags of the sections the code generator uses.
+SECTION_KINDS = {
+    ".text": (SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR),
+    ".data": (SHT_PROGBITS, SHF_ALLOC | SHF_WRITE),
+    ".bss": (SHT_NOBITS, SHF_ALLOC | SHF_WRITE),
+    ".rodata": (SHT_PROGBITS, SHF_ALLOC),
+    ".note.GNU-stack": (SHT_PROGBITS, 0),
+}
+
+HEADER_FORMAT = "<16sHHIQQQIHHHHHH"
+SECTION_HEADER_FORMAT = "<IIQQQQIIQQ"
+SYMBOL_FORMAT = "<IBBHQQ"
+RELOCATION_FORMAT = "<QQq"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SECTION_HEADER_SIZE = struct.calcsize(SECTION_HEADER_FORMAT)
+SYMBOL_SIZE = struct.calcsize(SYMBOL_FORMAT)
+RELOCATION_SIZE = struct.calcsize(RELOCATION_FORMAT)
+
+
+class StringTable:
+
+    def __init__(self) -> None:
+        self.data = bytearray(b"\0")
+        self.offsets = {"": 0}
+
+    def add(self, string):
+        offset = self.offsets.get(string)
+        if offset is None:
+            offset = self.offsets[string] = len(self.data)
+            self.data += string.encode() + b"\0"
+        return offset
+
+
+class ElfObjectWriter:
+
+    # Writes an assembled program as an x86-64 relocatable ELF object, with
+    # the sections in the order the GNU assembler gives them.
+
+    def __init__(self, assembled) -> None:
+        self.assembled = assembled
+        self.section_names = StringTable()
+        self.symbol_names = StringTable()
+        # Section headers as (name, type, flags, data, link, info, alignment,
+        # entry size), the first one is the null section.
+        self.headers = [("", 0, 0, b"", 0, 0, 0, 0)]
+        self.indices = {}
+
+    def add_section(self, name, kind, flags, data, link=0, info=0, alignment=1, entry_size=0):
+        self.headers.append((name, kind, flags, data, link, info, alignment, entry_size))
+        self.indices[name] = len(self.headers) - 1
+        return len(self.headers) - 1
+
+    def write(self, path):
+        sections = self.assembled.sections
+        for name in [".text", ".data", ".bss"] + [name for name in sections if name not in [".text", ".data", ".bss"]]:
+            if name not in SECTION_KINDS:
+                raise Exception(f"Unsupported section {name}.")
+            kind, flags = SECTION_KINDS[name]
+            section = sections.get(name)
+            data = b"" if section is None else bytes(section.data)
+            self.add_section(name, kind, flags, data, alignment=1 if section is None else section.alignment)
+
+        symbols, symbol_indices, first_global = self.symbols()
+        relocations = {}
+        for section, offset, kind, target, addend in self.assembled.relocations:
+            symbol = symbol_indices[target.name if target in sections.values() else target]
+            relocations.setdefault(section.name, []).append(
+                struct.pack(RELOCATION_FORMAT, offset, symbol << 32 | RELOCATION_TYPES[kind], addend))
+
+        # Relocation sections point at the symbol table, added after them.
+        symbol_table = len(self.headers) + len(relocations)
+        for name, entries in relocations.items():
+            self.add_section(f".rela{name}", SHT_RELA, SHF_INFO_LINK, b"".join(entries), symbol_table,
+                             self.indices[name], 8, RELOCATION_SIZE)
+        symbol_data = b"".join(struct.pack(SYMBOL_FORMAT, self.symbol_names.add(name), info, 0,
+                                           self.indices.get(section, section), value, size)
+                               for name, info, section, value, size in symbols)
+        self.add_section(".symtab", SHT_SYMTAB, 0, symbol_data, symbol_table + 1, first_global, 8, SYMBOL_SIZE)
+        self.add_section(".strtab", SHT_STRTAB, 0, bytes(self.symbol_names.data))
+        for header in self.headers:
+            self.section_names.add(header[0])
+        self.section_names.add(".shstrtab")
+        self.add_section(".shstrtab", SHT_STRTAB, 0, bytes(self.section_names.data))
+
+        with open(path, "wb") as f:
+            f.write(self.image())
+
+    def symbols(self):
+        # Symbols as (name, info, section, value, size) with the locals first,
+        # and the index of each label's section or external symbol.
+        symbols = [("", 0, SHN_UNDEF, 0, 0)]
+        if self.assembled.filename is not None:
+            symbols.append((os.path.basename(self.assembled.filename), STB_LOCAL << 4 | STT_FILE, SHN_ABS, 0, 0))
+        indices = {}
+        for name in self.assembled.sections:
+            indices[name] = len(symbols)
+            symbols.append(("", STB_LOCAL << 4 | STT_SECTION, name, 0, 0))
+
+        labels = self.assembled.symbols()
+        global_symbols = []
+        for name, section, offset, size, is_global, is_function in labels:
+            info = (STB_GLOBAL if is_global else STB_LOCAL) << 4 | (STT_FUNC if is_function else STT_NOTYPE)
+            symbol = (name, info, section.name, offset, size)
+            if is_global:
+                global_symbols.append(symbol)
+            else:
+                symbols.append(symbol)
+        first_global = len(symbols)
+        for symbol in global_symbols:
+            symbols.append(symbol)
+        for name in self.assembled.externals:
+            indices[name] = len(symbols)
+            symbols.append((name, STB_GLOBAL << 4 | STT_NOTYPE, SHN_UNDEF, 0, 0))
+        return symbols, indices, first_global
+
+    def image(self):
+        image = bytearray(HEADER_SIZE)
+        offsets = []
+        for name, kind, flags, data, link, info, alignment, entry_size in self.headers:
+            if kind in [0, SHT_NOBITS]:
+                offsets.append(len(image) if kind else 0)
+                continue
+            image += bytes(-len(image) % max(alignment, 1))
+            offsets.append(len(image))
+            image += data
+        image += bytes(-len(image) % 8)
+        section_headers = len(image)
+        for (name, kind, flags, data, link, info, alignment, entry_size), offset in zip(self.headers, offsets):
+            image += struct.pack(SECTION_HEADER_FORMAT, self.section_names.add(name) if name else 0, kind, flags, 0,
+                                 offset, len(data), link, info, alignment, entry_size)
+        image[:HEADER_SIZE] = struct.pack(HEADER_FORMAT, ELF_IDENT, ET_REL, EM_X86_64, 1, 0, 0, section_headers, 0,
+                                          HEADER_SIZE, 0, 0, SECTION_HEADER_SIZE, len(self.headers),
+                                          len(self.headers) - 1)
+        return bytes(image)
+
+
+def write_elf_object(program_lines, path, filename=None):
+    ElfObjectWriter(ObjectAssembler(program_lines, filename).run()).write(path)
+
+
+def read_elf_object(path):
+    # Returns the contents of the sections by name and their relocations as
+    # (offset, type, target, addend), with the labels they refer to
+    # replaced by their section and the offset in it.
+    with open(path, "rb") as f:
+        image = f.read()
+    header = struct.unpack_from(HEADER_FORMAT, image)
+    if header[0][:4] != ELF_IDENT[:4] or header[1] != ET_REL or header[2] != EM_X86_64:
+        raise Exception(f"{path} is not an x86-64 relocatable object.")
+    section_headers, count, names_index = header[6], header[12], header[13]
+    headers = [struct.unpack_from(SECTION_HEADER_FORMAT, image, section_headers + i * SECTION_HEADER_SIZE)
+               for i in range(count)]
+
+    def contents(header):
+        return b"" if header[1] == SHT_NOBITS else image[header[4]:header[4] + header[5]]
+
+    def string(table, offset):
+        return table[offset:table.index(b"\0", offset)].decode()
+
+    section_names = contents(headers[names_index])
+    names = [string(section_names, header[0]) for header in headers]
+    sections = {name: contents(header) for name, header in zip(names, headers) if name}
+
+    symbols = []
+    for name, header in zip(names, headers):
+        if header[1] == SHT_SYMTAB:
+            strings = contents(headers[header[6]])
+            data = contents(header)
+            for i in range(len(data) // SYMBOL_SIZE):
+                symbol_name, info, other, section, value, size = struct.unpack_from(SYMBOL_FORMAT, data, i * SYMBOL_SIZE)
+                symbols.append((string(strings, symbol_name), info, section, value, size))
+
+    relocations = {}
+    for name, header in zip(names, headers):
+        if header[1] != SHT_RELA:
+            continue
+        entries = relocations[names[header[7]]] = []
+        data = contents(header)
+        for i in range(len(data) // RELOCATION_SIZE):
+            offset, info, addend = struct.unpack_from(RELOCATION_FORMAT, data, i * RELOCATION_SIZE)
+            symbol_name, symbol_info, section, value, size = symbols[info >> 32]
+            if symbol_info >> 4 == STB_LOCAL and section not in [SHN_UNDEF, SHN_ABS]:
+                target, addend = names[section], addend + value
+            else:
+                target = symbol_name
+            entries.append((offset, RELOCATION_NAMES.get(info & 0xFFFFFFFF, info & 0xFFFFFFFF), target, addend))
+    return sections, relocations
+
+
+def compare_objects(path, reference_path, section_names=(".text", ".rodata")):
+    # Lists the differences in the code, data and relocations of two objects.
+    sections, relocations = read_elf_object(path)
+    reference_sections, reference_relocations = read_elf_object(reference_path)
+    differences = []
+    for name in section_names:
+        data, reference = sections.get(name, b""), reference_sections.get(name, b"")
+        if data != reference:
+            offset = next((i for i, (a, b) in enumerate(zip(data, reference)) if a != b), min(len(data), len(reference)))
+            differences.append(f"{name} differs at offset {offset:#x}: {data[offset:offset + 8].hex(' ')} "
+                               f"instead of {reference[offset:offset + 8].hex(' ')}, "
+                               f"{len(data)} bytes instead of {len(reference)}.")
+        entries = sorted(relocations.get(name, []))
+        reference_entries = sorted(reference_relocations.get(name, []))
+        if entries != reference_entries:
+            extra = [entry for entry in entries if entry not in reference_entries]
+            missing = [entry for entry in reference_entries if entry not in entries]
+            differences.append(f"Relocations of {name} differ, {len(extra)} extra {extra[:3]} "
+                               f"and {len(missing)} missing {missing[:3]}.")
+    return differences
+
+
+def check_program(filename, output_dir, runtime=None):
+    # Builds the program through gcc -c and through the encoder and compares
+    # the objects, and the output of both executables when given the runtime.
+    from code_generator import CodeGenerator
+
+    name = os.path.splitext(os.path.basename(filename))[0]
+    assembly = os.path.join(output_dir, f"{name}.s")
+    reference = os.path.join(output_dir, f"{name}.gcc.o")
+    direct = os.path.join(output_dir, f"{name}.o")
+    with contextlib.redirect_stdout(io.StringIO()):
+        code_generator = CodeGenerator(filename=filename, backend="x86_64-linux")
+        code_generator.generate()
+    with open(assembly, "w") as f:
+        f.write(code_generator.assembly())
+    subprocess.run(["gcc", "-c", assembly, "-o", reference], check=True)
+    write_elf_object(code_generator.program_lines, direct, filename)
+    differences = compare_objects(direct, reference)
+
+    if runtime is not None:
+        outputs = []
+        for path in [reference, direct]:
+            executable = path[:-2]
+            subprocess.run(["gcc", path, runtime, "-o", executable], check=True)
+            outputs.append(subprocess.run([executable], capture_output=True, timeout=60).stdout)
+        if outputs[0] != outputs[1]:
+            differences.append("The executables print different output.")
+    return differences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the objects of the built-in encoder with gcc -c.")
+    parser.add_argument("filenames", nargs="*", help="programs to check, all .txt files here by default")
+    parser.add_argument("--run", action="store_true", help="also link and run both objects, comparing the output")
+    args = parser.parse_args()
+    if shutil.which("gcc") is None:
+        raise Exception("The comparison needs gcc.")
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as output_dir:
+        runtime = None
+        if args.run:
+            runtime = os.path.join(output_dir, "runtime.o")
+            runtime_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime.c")
+            subprocess.run(["gcc", "-O2", "-c", runtime_source, "-o", runtime], check=True)
+        for filename in args.filenames or sorted(glob.glob("*.txt")):
+            try:
+                differences = check_program(filename, output_dir, runtime)
+            except Exception as e:
+                differences = [str(e)]
+            failed += bool(differences)
+            print(f"{filename:<32}{'differs' if differences else 'matches'}")
+            for difference in differences:
+                print(f"    {difference}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,74 @@
+import sys
+
+# Locals are addressed as -address(%ebp). The caller's stack is 16 byte
+# aligned at the call, so after the 4 byte return address and the saved ebp
+# are pushed, ebp sits 8 bytes past a 16 byte boundary.
+FRAME_BASE_OFFSET = 8
+ARRAY_ALIGNMENT = 16
+
+
+def align(address, base_offset=FRAME_BASE_OFFSET, alignment=ARRAY_ALIGNMENT):
+    # Rounds the address up so that -address(%ebp) is aligned.
+    return address + (base_offset - address) % alignment
+
+
+def child_scopes(node):
+    stack = node.children[::-1]
+    while stack:
+        child_node = stack.pop()
+        if child_node.node_type() == "subroutine":
+            yield child_node
+        else:
+            stack.extend(child_node.children[::-1])
+
+
+class FrameLayout:
+
+    def __init__(self, ast, reserved=0, base_offset=FRAME_BASE_OFFSET) -> None:
+        self.ast = ast
+        self.reserved = reserved
+        self.base_offset = base_offset
+        self.frame_size = reserved
+        self.slots = 0
+        self.scopes = 0
+
+    def run(self):
+        # Every scope is placed after the scopes enclosing it, sibling scopes
+        # are never active together and start at the same address.
+        stack = [(self.ast, self.reserved)]
+        while stack:
+            scope_node, address = stack.pop()
+            address = self.allocate(scope_node, address)
+            self.frame_size = max(self.frame_size, address)
+            stack.extend((child_node, address) for child_node in child_scopes(scope_node))
+            self.scopes += 1
+        self.frame_size = align(self.frame_size, self.base_offset)
+        return self.frame_size
+
+    def allocate(self, scope_node, address):
+        symbols = [symbol for symbol in scope_node.symbol_table
+                   if symbol.type == "int" and symbol.register is None]
+        for symbol in sorted(symbols, key=lambda symbol: symbol.num_of_dims() > 0):
+            address += 4 * symbol.num_of_items()
+            if symbol.num_of_dims() > 0:
+                address = align(address, self.base_offset)
+            symbol.address = address
+            self.slots += 1
+        return address
+
+    def report(self):
+        return (f"Frame layout: placed {self.slots} variables from {self.scopes} scopes "
+                f"in a {self.frame_size} byte frame.")
+
+
+if __name__ == "__main__":
+    from syntax_analyser import SyntaxAnalyser
+
+    filename = "sample_text.txt"
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    ast = SyntaxAnalyser(filename=filename).build_ast()
+    frame_layout = FrameLayout(ast)
+    frame_layout.run()
+    ast.print_tree()
+    print(frame_layout.report())
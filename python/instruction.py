@@ -0,0 +1,302 @@
+# Names of the 64-bit registers, registers are always identified by the
+# name of their low 32 bits.
+WIDE_NAMES = {
+    "eax": "rax", "ebx": "rbx", "ecx": "rcx", "edx": "rdx",
+    "esi": "rsi", "edi": "rdi", "ebp": "rbp", "esp": "rsp",
+    "r8d": "r8", "r9d": "r9", "r10d": "r10", "r11d": "r11",
+    "r12d": "r12", "r13d": "r13", "r14d": "r14", "r15d": "r15",
+}
+
+
+class Register:
+
+    __slots__ = ("name", "size")
+
+    def __init__(self, name, size=4) -> None:
+        self.name = name
+        self.size = size
+
+    def registers(self):
+        return [self.name]
+
+    def __eq__(self, other):
+        return isinstance(other, Register) and self.name == other.name and self.size == other.size
+
+    def __hash__(self):
+        return hash(("register", self.name, self.size))
+
+    def __str__(self) -> str:
+        if self.size == 8:
+            return f"%{WIDE_NAMES.get(self.name, self.name)}"
+        return f"%{self.name}"
+
+    __repr__ = __str__
+
+
+class Immediate:
+
+    __slots__ = ("value",)
+
+    def __init__(self, value) -> None:
+        self.value = value
+
+    def registers(self):
+        return []
+
+    def __eq__(self, other):
+        return isinstance(other, Immediate) and self.value == other.value
+
+    def __hash__(self):
+        return hash(("immediate", self.value))
+
+    def __str__(self) -> str:
+        return f"${self.value}"
+
+    __repr__ = __str__
+
+
+class Memory:
+
+    __slots__ = ("displacement", "base", "index", "scale")
+
+    def __init__(self, displacement=0, base=None, index=None, scale=1) -> None:
+        self.displacement = displacement
+        self.base = base
+        self.index = index
+        self.scale = scale
+
+    def registers(self):
+        return [register.name for register in [self.base, self.index] if register is not None]
+
+    def may_alias(self, other):
+        if not isinstance(other, Memory):
+            return False
+        if (self.index is not None or other.index is not None or
+                self.base != other.base or
+                not isinstance(self.displacement, int) or not isinstance(other.displacement, int)):
+            return True
+        return abs(self.displacement - other.displacement) < 4
+
+    def __eq__(self, other):
+        return (isinstance(other, Memory) and self.displacement == other.displacement and
+                self.base == other.base and self.index == other.index and self.scale == other.scale)
+
+    def __hash__(self):
+        return hash(("memory", self.displacement, self.base, self.index, self.scale))
+
+    def __str__(self) -> str:
+        if self.base is None and self.index is None:
+            return f"{self.displacement}"
+        displacement = "" if self.displacement == 0 else f"{self.displacement}"
+        base = "" if self.base is None else f"{self.base}"
+        if self.index is None:
+            return f"{displacement}({base})"
+        return f"{displacement}({base}, {self.index}, {self.scale})"
+
+    __repr__ = __str__
+
+
+class Target:
+
+    __slots__ = ("name", "arguments", "clobbers")
+
+    def __init__(self, name, arguments=(), clobbers=()) -> None:
+        self.name = name
+        # Registers a called function reads its arguments from, and the ones
+        # it may change beyond the caller-saved registers common to all targets.
+        self.arguments = arguments
+        self.clobbers = clobbers
+
+    def registers(self):
+        return []
+
+    def __eq__(self, other):
+        return isinstance(other, Target) and self.name == other.name
+
+    def __hash__(self):
+        return hash(("target", self.name))
+
+    def __str__(self) -> str:
+        return f"{self.name}"
+
+    __repr__ = __str__
+
+
+EAX = Register("eax")
+EBX = Register("ebx")
+ECX = Register("ecx")
+EDX = Register("edx")
+ESI = Register("esi")
+EDI = Register("edi")
+EBP = Register("ebp")
+ESP = Register("esp")
+R8D = Register("r8d")
+R9D = Register("r9d")
+R10D = Register("r10d")
+R11D = Register("r11d")
+RIP = Register("rip", 8)
+
+CALLER_SAVED = ["eax", "ecx", "edx"]
+CALLEE_SAVED = ["ebx", "esi", "edi"]
+
+# Two-operand instructions whose destination is also read.
+READ_WRITE = ["addl", "subl", "imul", "andl", "orl", "xorl", "shll", "sarl", "addq", "subq"]
+# Two-operand instructions whose destination is only written.
+WRITE_ONLY = ["movl", "leal", "movq", "leaq"]
+COMPARES = ["cmpl", "testl"]
+UNARY_READ = ["pushl", "pushq", "idivl"]
+UNARY_READ_WRITE = ["negl", "incl", "decl", "notl"]
+UNARY_WRITE = ["popl", "popq"]
+ADDRESS_LOADS = ["leal", "leaq"]
+
+IMPLICIT_READS = {
+    "pushl": ["esp"],
+    "popl": ["esp"],
+    "pushq": ["esp"],
+    "popq": ["esp"],
+    "idivl": ["eax", "edx"],
+    "cltd": ["eax"],
+    "call": ["esp"],
+    "ret": ["eax", "esp"],
+    "leave": ["ebp"],
+    "rep movsl": ["ecx", "esi", "edi"],
+}
+IMPLICIT_WRITES = {
+    "pushl": ["esp"],
+    "popl": ["esp"],
+    "pushq": ["esp"],
+    "popq": ["esp"],
+    "idivl": ["eax", "edx"],
+    "cltd": ["edx"],
+    "call": CALLER_SAVED,
+    "ret": ["esp"],
+    "leave": ["esp", "ebp"],
+    "rep movsl": ["ecx", "esi", "edi"],
+}
+# Block moves touch memory through their pointer registers, an index makes
+# the operand alias any other memory operand.
+IMPLICIT_MEMORY_READS = {
+    "rep movsl": [Memory(0, ESI, ECX, 4)],
+}
+IMPLICIT_MEMORY_WRITES = {
+    "rep movsl": [Memory(0, EDI, ECX, 4)],
+}
+
+FLAG_WRITERS = READ_WRITE + COMPARES + UNARY_READ_WRITE + ["idivl", "call"]
+
+
+class Instruction:
+
+    __slots__ = ("opcode", "operands", "read_registers", "written_registers")
+
+    def __init__(self, opcode, *operands) -> None:
+        self.opcode = opcode
+        self.operands = operands
+        self.read_registers = None
+        self.written_registers = None
+
+    def with_operands(self, *operands):
+        return Instruction(self.opcode, *operands)
+
+    def is_write_only(self):
+        return self.opcode in WRITE_ONLY or (self.opcode == "imul" and len(self.operands) == 3)
+
+    def source_operands(self):
+        if self.is_write_only():
+            return list(self.operands[:-1])
+        if (self.opcode in READ_WRITE or self.opcode in COMPARES or
+                self.opcode in UNARY_READ or self.opcode in UNARY_READ_WRITE):
+            return list(self.operands)
+        return []
+
+    def destination_operands(self):
+        if self.is_write_only() or self.opcode in READ_WRITE:
+            return [self.operands[-1]]
+        if self.opcode in UNARY_WRITE or self.opcode in UNARY_READ_WRITE:
+            return list(self.operands)
+        return []
+
+    def registers_read(self):
+        if self.read_registers is None:
+            registers = set(IMPLICIT_READS.get(self.opcode, []))
+            for operand in self.operands:
+                if isinstance(operand, Memory):
+                    registers.update(operand.registers())
+                elif isinstance(operand, Target):
+                    registers.update(operand.arguments)
+            for operand in self.source_operands():
+                if isinstance(operand, Register):
+                    registers.add(operand.name)
+            self.read_registers = frozenset(registers)
+        return self.read_registers
+
+    def registers_written(self):
+        if self.written_registers is None:
+            registers = set(IMPLICIT_WRITES.get(self.opcode, []))
+            for operand in self.operands:
+                if isinstance(operand, Target):
+                    registers.update(operand.clobbers)
+            for operand in self.destination_operands():
+                if isinstance(operand, Register):
+                    registers.add(operand.name)
+            self.written_registers = frozenset(registers)
+        return self.written_registers
+
+    def memory_read(self):
+        if self.opcode in ADDRESS_LOADS:
+            return []
+        return IMPLICIT_MEMORY_READS.get(self.opcode, []) + [
+            operand for operand in self.source_operands() if isinstance(operand, Memory)]
+
+    def memory_written(self):
+        return IMPLICIT_MEMORY_WRITES.get(self.opcode, []) + [
+            operand for operand in self.destination_operands() if isinstance(operand, Memory)]
+
+    def reads_flags(self):
+        return self.is_jump() and self.opcode != "jmp"
+
+    def writes_flags(self):
+        return self.opcode in FLAG_WRITERS
+
+    def is_jump(self):
+        return self.opcode.startswith("j")
+
+    def is_control_flow(self):
+        return self.is_jump() or self.opcode in ["call", "ret"]
+
+    def uses_stack(self):
+        return "esp" in self.registers_read() or "esp" in self.registers_written()
+
+    def __str__(self) -> str:
+        if not self.operands:
+            return f"\t{self.opcode}"
+        operands = ",\t".join(str(operand) for operand in self.operands)
+        return f"\t{self.opcode}\t{operands}"
+
+    __repr__ = __str__
+
+
+class Label:
+
+    __slots__ = ("name",)
+
+    def __init__(self, name) -> None:
+        self.name = name
+
+    def __str__(self) -> str:
+        return f"{self.name}:"
+
+    __repr__ = __str__
+
+
+class Directive:
+
+    __slots__ = ("text",)
+
+    def __init__(self, text) -> None:
+        self.text = text
+
+    def __str__(self) -> str:
+        return self.text
+
+    __repr__ = __str__
@@ -0,0 +1,277 @@
+from bytecode_compiler import OPCODE_NAMES, compile_file
+
+import argparse
+import sys
+
+INT_MIN = -2**31
+INT_MAX = 2**31 - 1
+# Output is written in chunks of this many PRINT statements.
+OUTPUT_CHUNK = 4096
+
+
+def wrap(value):
+    return ((value - INT_MIN) & 0xFFFFFFFF) + INT_MIN
+
+
+class Interpreter:
+
+    def __init__(self, bytecode, output=None) -> None:
+        self.bytecode = bytecode
+        self.output = sys.stdout if output is None else output
+        self.memory = None
+        self.out = []
+        self.pc = 0
+
+    def run(self):
+        # The memory is copied so that the same bytecode can run again.
+        self.memory = list(self.bytecode.memory)
+        self.out = []
+        handlers = self.thread()
+        end = len(handlers)
+        pc = 0
+        try:
+            while pc < end:
+                pc = handlers[pc]()
+        except ZeroDivisionError:
+            raise Exception(f"Division by zero on line {self.bytecode.lines[pc]}.")
+        except IndexError:
+            raise Exception(f"Array index out of bounds on line {self.bytecode.lines[pc]}.")
+        finally:
+            self.pc = pc
+            self.flush()
+
+    def thread(self):
+        # Every instruction becomes a function with its operands bound that
+        # runs it and returns the next pc, so the loop only calls through.
+        handlers = []
+        for pc, (opcode, *operands) in enumerate(self.bytecode.code):
+            while operands and operands[-1] is None:
+                operands.pop()
+            method = getattr(self, f"op_{OPCODE_NAMES[opcode].lower()}")
+            handlers.append(method(pc + 1, *operands))
+        return handlers
+
+    def flush(self):
+        self.output.write("".join(self.out))
+        self.out.clear()
+        self.output.flush()
+
+    def op_for_next(self, next_pc, variable, step, limit, target):
+        m = self.memory
+
+        def for_next():
+            v = m[variable] + m[step]
+            if v > INT_MAX or v < INT_MIN:
+                v = wrap(v)
+            m[variable] = v
+            return target if v <= m[limit] else next_pc
+        return for_next
+
+    def op_add(self, next_pc, destination, left, right):
+        m = self.memory
+
+        def add():
+            v = m[left] + m[right]
+            m[destination] = v if INT_MIN <= v <= INT_MAX else wrap(v)
+            return next_pc
+        return add
+
+    def op_sub(self, next_pc, destination, left, right):
+        m = self.memory
+
+        def sub():
+            v = m[left] - m[right]
+            m[destination] = v if INT_MIN <= v <= INT_MAX else wrap(v)
+            return next_pc
+        return sub
+
+    def op_mul(self, next_pc, destination, left, right):
+        m = self.memory
+
+        def mul():
+            v = m[left] * m[right]
+            m[destination] = v if INT_MIN <= v <= INT_MAX else wrap(v)
+            return next_pc
+        return mul
+
+    def op_div(self, next_pc, destination, left, right):
+        m = self.memory
+
+        def div():
+            x = m[left]
+            y = m[right]
+            # Integer division truncates toward zero, as idivl does.
+            v = abs(x) // abs(y)
+            if (x < 0) != (y < 0):
+                v = -v
+            m[destination] = v if v <= INT_MAX else wrap(v)
+            return next_pc
+        return div
+
+    def op_neg(self, next_pc, destination, operand):
+        m = self.memory
+
+        def neg():
+            m[destination] = wrap(-m[operand])
+            return next_pc
+        return neg
+
+    def op_move(self, next_pc, destination, source):
+        m = self.memory
+
+        def move():
+            m[destination] = m[source]
+            return next_pc
+        return move
+
+    def op_load(self, next_pc, destination, base, index, bounds):
+        m = self.memory
+
+        def load():
+            i = m[index]
+            if i not in bounds:
+                raise IndexError(i)
+            m[destination] = m[base + i]
+            return next_pc
+        return load
+
+    def op_store(self, next_pc, base, index, bounds, source):
+        m = self.memory
+
+        def store():
+            i = m[index]
+            if i not in bounds:
+                raise IndexError(i)
+            m[base + i] = m[source]
+            return next_pc
+        return store
+
+    def op_load2(self, next_pc, destination, base, index, bounds):
+        m = self.memory
+        index, term, stride = index
+
+        def load2():
+            i = m[index] + m[term] * stride
+            if i not in bounds:
+                raise IndexError(i)
+            m[destination] = m[base + i]
+            return next_pc
+        return load2
+
+    def op_store2(self, next_pc, base, index, bounds, source):
+        m = self.memory
+        index, term, stride = index
+
+        def store2():
+            i = m[index] + m[term] * stride
+            if i not in bounds:
+                raise IndexError(i)
+            m[base + i] = m[source]
+            return next_pc
+        return store2
+
+    def op_offset(self, next_pc, destination, index, term, stride):
+        m = self.memory
+
+        def offset():
+            m[destination] = m[index] + m[term] * stride
+            return next_pc
+        return offset
+
+    def op_scale(self, next_pc, destination, term, stride):
+        m = self.memory
+
+        def scale():
+            m[destination] = m[term] * stride
+            return next_pc
+        return scale
+
+    def op_jump(self, next_pc, target):
+        def jump():
+            return target
+        return jump
+
+    def op_jeq(self, next_pc, left, right, target):
+        m = self.memory
+
+        def jeq():
+            return target if m[left] == m[right] else next_pc
+        return jeq
+
+    def op_jne(self, next_pc, left, right, target):
+        m = self.memory
+
+        def jne():
+            return target if m[left] != m[right] else next_pc
+        return jne
+
+    def op_jlt(self, next_pc, left, right, target):
+        m = self.memory
+
+        def jlt():
+            return target if m[left] < m[right] else next_pc
+        return jlt
+
+    def op_jle(self, next_pc, left, right, target):
+        m = self.memory
+
+        def jle():
+            return target if m[left] <= m[right] else next_pc
+        return jle
+
+    def op_jgt(self, next_pc, left, right, target):
+        m = self.memory
+
+        def jgt():
+            return target if m[left] > m[right] else next_pc
+        return jgt
+
+    def op_jge(self, next_pc, left, right, target):
+        m = self.memory
+
+        def jge():
+            return target if m[left] >= m[right] else next_pc
+        return jge
+
+    def op_print(self, next_pc, python_format, slots):
+        m = self.memory
+        out = self.out
+        flush = self.flush
+
+        def print_():
+            out.append(python_format % tuple([m[slot] for slot in slots]))
+            if len(out) >= OUTPUT_CHUNK:
+                flush()
+            return next_pc
+        return print_
+
+    def op_printf(self, next_pc, python_format, slots, unsigned):
+        m = self.memory
+        out = self.out
+
+        def printf():
+            out.append(python_format % tuple([m[slot] & 0xFFFFFFFF if is_unsigned else m[slot]
+                                              for slot, is_unsigned in zip(slots, unsigned)]))
+            return next_pc
+        return printf
+
+    def op_init(self, next_pc, base, values):
+        m = self.memory
+        end = base + len(values)
+
+        def init():
+            m[base:end] = values
+            return next_pc
+        return init
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a BASIC program with the bytecode interpreter.")
+    parser.add_argument("filename", nargs="?", default="sample_text.txt")
+    parser.add_argument("--disassemble", action="store_true", help="print the bytecode instead of running it")
+    args = parser.parse_args()
+    bytecode = compile_file(args.filename)
+    if args.disassemble:
+        print(bytecode.disassemble())
+    else:
+        Interpreter(bytecode).run()
@@ -0,0 +1,286 @@
+from node import AssignNode, LiteralNode, OperatorNode, VariableNode
+from register_allocator import is_constant, is_simple
+from visitor import NodeVisitor, walk_postorder, walk_preorder
+
+import sys
+
+
+def index_terms(variable_node):
+    # Indexes are matched with dims from the right, so an access with fewer
+    # indexes than dims addresses the array as if it were flattened.
+    constant = 0
+    terms = []
+    stride = 1
+    for index_node, dim in zip(variable_node.children[::-1], variable_node.dims[::-1]):
+        if is_constant(index_node):
+            constant += int(index_node.value) * stride
+        else:
+            terms.append((index_node, stride))
+        stride = stride * dim
+    return constant, terms[::-1]
+
+
+def int_operator(operation, left_node, right_node):
+    operator_node = OperatorNode(operation)
+    operator_node.type = "int"
+    operator_node.add_child(left_node)
+    operator_node.add_child(right_node)
+    return operator_node
+
+
+def index_sum(terms, constant=0):
+    sum_node = None
+    for index_node, stride in terms:
+        if stride != 1:
+            index_node = int_operator("*", index_node, LiteralNode(str(stride), "int"))
+        sum_node = index_node if sum_node is None else int_operator("+", sum_node, index_node)
+    if sum_node is None:
+        return LiteralNode(str(constant), "int")
+    if constant != 0:
+        sum_node = int_operator("+", sum_node, LiteralNode(str(constant), "int"))
+    return sum_node
+
+
+class InvariantCodeMover(NodeVisitor):
+
+    def __init__(self, ast) -> None:
+        self.ast = ast
+        self.loops = []
+        self.restores = []
+        self.assigned_symbols = {}
+        self.body_symbols = {}
+        self.innermost_loops = {}
+        self.invariant_depths = {}
+        self.safe_nodes = set()
+        self.expression_ids = {}
+        self.hoisted_symbols = {}
+        self.temporaries = 0
+        self.hoisted_limits = 0
+        self.hoisted_offsets = 0
+        self.hoisted_expressions = 0
+
+    def run(self):
+        if any(node.node_type() == "goto" for node in walk_preorder(self.ast)):
+            return self.ast
+
+        self.measure_loops()
+        self.visit(self.ast)
+        return self.ast
+
+    def measure_loops(self):
+        for node in walk_postorder(self.ast):
+            if node.node_type() != "for":
+                continue
+            symbols = set()
+            stack = [node.children[3]]
+            while stack:
+                child_node = stack.pop()
+                if child_node.node_type() == "for":
+                    symbols.update(self.assigned_symbols[child_node])
+                    continue
+                if child_node.node_type() == "assign":
+                    symbols.add(child_node.children[0].symbol)
+                elif child_node.node_type() == "initializer":
+                    symbols.add(child_node.symbol)
+                stack.extend(child_node.children)
+            self.body_symbols[node] = symbols
+            self.assigned_symbols[node] = symbols | {node.children[0].children[0].symbol}
+
+    def enter_assign(self, assign_node):
+        self.process_expression(assign_node.children[0])
+        self.process_expression(assign_node.children[1])
+        return []
+
+    def enter_for(self, for_node):
+        self.enter_assign(for_node.children[0])
+
+        depth = len(self.loops)
+        restore = []
+        for symbol in self.assigned_symbols[for_node]:
+            restore.append((symbol, self.innermost_loops.get(symbol)))
+            self.innermost_loops[symbol] = depth
+        self.loops.append(for_node)
+        self.restores.append(restore)
+
+        self.hoist_limit(for_node)
+        return [for_node.children[3]]
+
+    def leave_for(self, for_node):
+        self.loops.pop()
+        for symbol, depth in reversed(self.restores.pop()):
+            if depth is None:
+                del self.innermost_loops[symbol]
+            else:
+                self.innermost_loops[symbol] = depth
+
+    def enter_if(self, if_node):
+        for child_node in list(if_node.children[0].children):
+            self.process_expression(child_node)
+        return if_node.children[1:]
+
+    def enter_print(self, print_node):
+        for child_node in print_node.children[1:]:
+            self.process_expression(child_node)
+        return []
+
+    def enter_println(self, println_node):
+        return []
+
+    def enter_goto(self, goto_node):
+        return []
+
+    def measure(self, root_node):
+        # A node is invariant in every loop from its invariant depth inwards.
+        # Safe nodes can be evaluated speculatively: they cannot divide by
+        # zero or read an array out of bounds.
+        stack = [(root_node, False)]
+        while stack:
+            node, children_measured = stack.pop()
+            if not children_measured:
+                if node not in self.invariant_depths:
+                    stack.append((node, True))
+                    stack.extend((child_node, False) for child_node in node.children)
+                continue
+
+            depth = max([self.invariant_depths[child_node] for child_node in node.children], default=0)
+            safe = all(child_node in self.safe_nodes for child_node in node.children)
+            if node.node_type() == "variable":
+                depth = max(depth, self.innermost_loops.get(node.symbol, -1) + 1)
+                if not all(is_constant(index_node) for index_node in node.children):
+                    safe = False
+            elif node.node_type() == "operator" and node.operation == "/":
+                safe = False
+            self.invariant_depths[node] = depth
+            if safe:
+                self.safe_nodes.add(node)
+
+    def process_expression(self, root_node):
+        if not self.loops:
+            return
+        self.measure(root_node)
+
+        for node in list(walk_postorder(root_node)):
+            if node.node_type() == "variable" and len(node.children) > 1:
+                self.hoist_offset(node)
+
+        stack = [root_node]
+        while stack:
+            node = stack.pop()
+            if (node.node_type() == "operator" and node in self.safe_nodes and
+                    self.invariant_depths[node] < len(self.loops)):
+                self.hoist(node, self.invariant_depths[node])
+                self.hoisted_expressions += 1
+                continue
+            stack.extend(node.children)
+
+    def hoist_limit(self, for_node):
+        self.process_expression(for_node.children[1])
+        limit_node = for_node.children[1]
+        if is_simple(limit_node):
+            return
+        depth = self.invariant_depths[limit_node]
+        if depth >= len(self.loops):
+            return
+        # The limit is evaluated at least once, so it can always move to the
+        # preheader of its own loop.
+        if limit_node not in self.safe_nodes:
+            depth = len(self.loops) - 1
+        self.hoist(limit_node, depth)
+        self.hoisted_limits += 1
+
+    def hoist_offset(self, variable_node):
+        constant, terms = index_terms(variable_node)
+        invariant_terms = [(index_node, stride) for index_node, stride in terms
+                           if index_node in self.safe_nodes and self.invariant_depths[index_node] < len(self.loops)]
+        if not invariant_terms:
+            return
+        if len(invariant_terms) == 1 and invariant_terms[0][1] == 1 and is_simple(invariant_terms[0][0]):
+            return
+        variant_terms = [term for term in terms if term not in invariant_terms]
+        depth = max(self.invariant_depths[index_node] for index_node, stride in invariant_terms)
+
+        for index_node in variable_node.children:
+            index_node.parent = None
+        variable_node.children = []
+        temporary_node = self.hoist_into_temporary(index_sum(invariant_terms, constant), depth)
+        if variant_terms:
+            index_node = int_operator("+", temporary_node, index_sum(variant_terms))
+        else:
+            index_node = temporary_node
+        variable_node.add_child(index_node)
+
+        del self.invariant_depths[variable_node]
+        self.safe_nodes.discard(variable_node)
+        self.measure(variable_node)
+        self.hoisted_offsets += 1
+
+    def hoist(self, expression_node, depth):
+        parent_node = expression_node.parent
+        i = parent_node.children.index(expression_node)
+        temporary_node = self.hoist_into_temporary(expression_node, depth)
+        parent_node.children[i] = temporary_node
+        temporary_node.parent = parent_node
+
+    def expression_id(self, expression_node):
+        # Structurally equal expressions get the same id, so an expression
+        # hoisted twice into the same preheader shares one temporary.
+        ids = {}
+        for node in walk_postorder(expression_node):
+            if node.node_type() == "variable":
+                key = ("variable", node.symbol)
+            elif node.node_type() == "literal":
+                key = ("literal", node.value)
+            else:
+                key = ("operator", node.operation)
+            key += tuple(ids[child_node] for child_node in node.children)
+            ids[node] = self.expression_ids.setdefault(key, len(self.expression_ids))
+        return ids[expression_node]
+
+    def hoist_into_temporary(self, expression_node, depth):
+        loop_node = self.loops[depth]
+        key = (loop_node, self.expression_id(expression_node))
+        symbol = self.hoisted_symbols.get(key)
+        if symbol is None:
+            symbol = self.declare_temporary("invariant", expression_node, depth)
+            self.hoisted_symbols[key] = symbol
+        temporary_node = VariableNode(symbol)
+        self.invariant_depths[temporary_node] = depth
+        self.safe_nodes.add(temporary_node)
+        return temporary_node
+
+    def declare_temporary(self, name, expression_node, depth):
+        loop_node = self.loops[depth]
+        block_node = loop_node.parent
+        # The program scope's stack space is reserved once on entry, so
+        # temporaries declared there are valid wherever they are hoisted.
+        self.temporaries += 1
+        symbol = self.ast.symbol_table.declare(f"[{name} {self.temporaries}]", type="int")
+
+        assign_node = AssignNode(line_number=loop_node.line_number, type="int")
+        assign_node.add_child(VariableNode(symbol))
+        assign_node.add_child(expression_node)
+        block_node.children.insert(block_node.children.index(loop_node), assign_node)
+        assign_node.parent = block_node
+
+        if depth > 0:
+            self.innermost_loops[symbol] = depth - 1
+            self.restores[depth - 1].append((symbol, None))
+        return symbol
+
+    def report(self):
+        return (f"Invariant code mover: hoisted {self.hoisted_limits} loop limits, "
+                f"{self.hoisted_offsets} array offsets and {self.hoisted_expressions} expressions "
+                f"into {self.temporaries} temporaries.")
+
+
+if __name__ == "__main__":
+    from syntax_analyser import SyntaxAnalyser
+
+    filename = "sample_text.txt"
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    ast = SyntaxAnalyser(filename=filename).build_ast()
+    invariant_code_mover = InvariantCodeMover(ast)
+    invariant_code_mover.run()
+    ast.print_tree()
+    print(invariant_code_mover.report())
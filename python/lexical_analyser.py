@@ -1,7 +1,9 @@
 import re
 from token import Token
+from token_buffer import TokenBuffer
 from typing import NewType
 
+from itertools import accumulate
 import sys
 
 class LexicalAnalyser:
@@ -13,10 +15,23 @@ class LexicalAnalyser:
                 "GOSUB", "RETURN", "REM", "E"}
     SEPARATORS = {"(", ")", ",", "[", "]", "\n", "{", "}"}
 
+    TOKEN = r"""
+        (
+            \n
+          | "(?:[^"\n]|(?<=\\)")*(?:"|\n|\Z)
+          | >=|<>|<=|==|[-+*/<>=]
+          | [(),\[\]{}]
+          | [^\s"+\-*/<>=(),\[\]{}]+
+        )
+    """
+    TOKEN_PATTERN = re.compile(r"[^\S\n]*" + TOKEN, re.VERBOSE)
+    # Also captures the spaces before each token, to find its column.
+    SPACED_TOKEN_PATTERN = re.compile(r"([^\S\n]*)" + TOKEN, re.VERBOSE)
+
     def __init__(self, filename="./sample_text.txt") -> None:
         self.token_list = []
         self.filename = filename
-        self.token = ""
+        self.tokens = {}
 
     def is_literal(self, token) -> bool:
         return bool(re.fullmatch(r'[+-]?[0-9]+|[+-]?[0-9]*\.[0-9]+|".*"', token))
@@ -32,94 +47,86 @@ class LexicalAnalyser:
             return "literal"
         return "identifier"
 
-    def add_token(self, token):
-        if token.strip() or token == "\n":
-            token_type = self.get_token_type(token)
-            new_token = Token(token_type, token)
-            self.token_list.append(new_token)
-        self.token = ""
-
-    def build_tokens(self, line):
-        
-        enum_line = enumerate(line)
-        
-        for i, char in enum_line:
-            if not char.strip():
-                self.add_token(self.token)
-                if char == "\n":
-                    self.add_token(char)
-            elif char in self.OPERATORS:
-                self.add_token(self.token)
-                current_and_next = char + line[i+1]
-                if current_and_next in self.OPERATORS:
-                    self.add_token(current_and_next)
-                    next(enum_line, None)
-                else:
-                    self.add_token(char)
-            elif char in self.SEPARATORS:
-                self.add_token(self.token)
-                self.add_token(char)
-            elif char == '"':
-                self.add_token(self.token)
-                
-                token = '"'
-
-                for j in range(i+1, len(line)):
-
-                    i, char = next(enum_line, None)
-                    token = token + char
-
-                    if char == '"' and line[j-1] != "\\":
-                        break
-                    
-                self.add_token(token)
-                
-            else:
-                self.token = self.token + char
-                if i == len(line) - 1:
-                    self.add_token(self.token)
-
-    def analyse_text(self):
+    def get_literal_type(self, token):
+        if token.startswith('"'):
+            return "string"
+        elif "." in token:
+            return "float"
+        return "int"
+
+    def get_token(self, value):
+        # Every distinct value is lexed once, into a Token shared by all of
+        # its occurrences.
+        token = self.tokens.get(value)
+        if token is None:
+            token_type = self.get_token_type(value)
+            literal_type = self.get_literal_type(value) if token_type == "literal" else None
+            token = self.tokens[value] = Token(token_type, value, literal_type)
+        return token
+
+    def scan_line(self, line):
+        tokens = self.tokens
+        for value in self.TOKEN_PATTERN.findall(line):
+            token = tokens.get(value)
+            yield token if token is not None else self.get_token(value)
+
+    def read_lines(self):
         try:
             print(self.filename)
             f = open(self.filename, "r")
-            for line in f:
+            for line_number, line in enumerate(f, 1):
                 if not line.strip():
                     continue
-                self.build_tokens(line)
+                yield line_number, line
             f.close()
         except IOError:
             print("File does no exist.\n")
-        
-        new_line_token = Token("separator", "\n")
-        while True:
-            last_token = self.token_list[-1]
-            if last_token.type == "separator" and last_token.value == "\n":
-                self.token_list.pop()
-            else:
-                break
-        self.token_list.append(new_line_token)
-            
-        for i, token in enumerate(self.token_list):
-            if (token.type == "literal" and
-               self.token_list[i-1].type == "operator" and 
-               self.token_list[i-1].value == "-" and
-               self.token_list[i-2].type not in ["literal", "identifier"]):
-
-               literal_token = self.token_list.pop(i)
-               literal_token.value = "-" + literal_token.value
 
-               self.token_list[i-1] = literal_token
+    def read_tokens(self):
+        for line_number, line in self.read_lines():
+            yield from self.scan_line(line)
 
-        for i, token in enumerate(self.token_list):
-            if (token.type == "identifier" and
-               self.token_list[i-1].type == "operator" and 
-               self.token_list[i-1].value == "-" and
-               self.token_list[i-2].type not in ["literal", "identifier"]):
+    def is_new_line(self, token):
+        return token.type == "separator" and token.value == "\n"
 
-               self.token_list[i-1].value = "*"
-               self.token_list.insert(i-1, Token(type="literal", value="-1"))
+    def end_with_new_line(self, tokens):
+        new_lines = []
+        for token in tokens:
+            if self.is_new_line(token):
+                new_lines.append(token)
+            else:
+                yield from new_lines
+                new_lines = []
+                yield token
+        yield self.get_token("\n")
+
+    def generate_tokens(self):
+        return self.end_with_new_line(self.read_tokens())
+
+    def tokenize(self):
+        # Lexes the whole file into a TokenBuffer that keeps where each
+        # token starts. Like end_with_new_line, it ends in a single new line.
+        buffer = TokenBuffer()
+        tokens = self.tokens
+        line_number, line = 0, ""
+        for line_number, line in self.read_lines():
+            matches = self.SPACED_TOKEN_PATTERN.findall(line)
+            ends = accumulate([len(space) + len(value) for space, value in matches])
+            columns = [end - len(value) + 1 for end, (space, value) in zip(ends, matches)]
+            buffer.extend([tokens.get(value) or self.get_token(value) for space, value in matches], line_number, columns)
+
+        new_line = self.get_token("\n")
+        end = len(buffer)
+        while end > 0 and buffer[end - 1] is new_line:
+            end -= 1
+        if end < len(buffer):
+            buffer.truncate(end + 1)
+        else:
+            buffer.append(new_line, line_number, len(line.rstrip("\n")) + 1)
+        return buffer
 
+    def analyse_text(self):
+        self.token_list = self.tokenize()
         return self.token_list
 
 if __name__ == "__main__":
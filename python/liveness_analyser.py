@@ -0,0 +1,287 @@
+from visitor import walk_postorder, walk_preorder
+
+import sys
+
+# Loops with more nested loops than this get a conservative header live set
+# instead of an exact fixpoint, which costs one iteration per nesting level.
+MAX_FIXPOINT_HEIGHT = 3
+# The analysis recurses once per nested block, so deeper programs are skipped.
+MAX_NESTING_DEPTH = 100
+
+
+class LiveSet:
+
+    def __init__(self) -> None:
+        self.scalars = set()
+        self.elements = {}
+        self.arrays = {}
+
+    def copy(self):
+        live = LiveSet()
+        live.scalars = set(self.scalars)
+        live.elements = {symbol: set(indexes) for symbol, indexes in self.elements.items()}
+        live.arrays = dict(self.arrays)
+        return live
+
+    def add_scalar(self, symbol):
+        self.scalars.add(symbol)
+
+    def add_element(self, symbol, index):
+        if symbol in self.arrays:
+            self.arrays[symbol] = self.arrays[symbol] - {index}
+        else:
+            self.elements.setdefault(symbol, set()).add(index)
+
+    def add_array(self, symbol):
+        self.arrays[symbol] = frozenset()
+        self.elements.pop(symbol, None)
+
+    def kill_scalar(self, symbol):
+        self.scalars.discard(symbol)
+
+    def kill_element(self, symbol, index):
+        if symbol in self.arrays:
+            self.arrays[symbol] = self.arrays[symbol] | {index}
+        elif symbol in self.elements:
+            self.elements[symbol].discard(index)
+
+    def kill_array(self, symbol):
+        self.arrays.pop(symbol, None)
+        self.elements.pop(symbol, None)
+
+    def is_scalar_live(self, symbol):
+        return symbol in self.scalars
+
+    def is_element_live(self, symbol, index):
+        if symbol in self.arrays:
+            return index not in self.arrays[symbol]
+        return index in self.elements.get(symbol, ())
+
+    def is_array_live(self, symbol):
+        return symbol in self.arrays or bool(self.elements.get(symbol))
+
+    def union(self, other):
+        live = LiveSet()
+        live.scalars = self.scalars | other.scalars
+        for symbol in self.arrays.keys() | other.arrays.keys():
+            if symbol in self.arrays and symbol in other.arrays:
+                live.arrays[symbol] = self.arrays[symbol] & other.arrays[symbol]
+            elif symbol in self.arrays:
+                live.arrays[symbol] = self.arrays[symbol] - other.elements.get(symbol, set())
+            else:
+                live.arrays[symbol] = other.arrays[symbol] - self.elements.get(symbol, set())
+        for elements in [self.elements, other.elements]:
+            for symbol, indexes in elements.items():
+                if symbol not in live.arrays:
+                    live.elements.setdefault(symbol, set()).update(indexes)
+        return live
+
+    def __eq__(self, other):
+        return (self.scalars == other.scalars and
+                self.arrays == other.arrays and
+                {s: i for s, i in self.elements.items() if i} == {s: i for s, i in other.elements.items() if i})
+
+
+class LivenessAnalyser:
+
+    def __init__(self, ast) -> None:
+        self.ast = ast
+        self.removed_assignments = 0
+        self.removed_statements = 0
+        self.removed_variables = 0
+        self.loop_heights = {}
+        self.loop_uses = {}
+
+    def run(self):
+        if any(node.node_type() == "goto" for node in walk_preorder(self.ast)):
+            return self.ast
+        if self.nesting_depth() > MAX_NESTING_DEPTH:
+            return self.ast
+
+        self.measure_loops()
+        self.analyse_block(self.ast, LiveSet(), remove=True)
+        self.remove_unused_variables()
+        return self.ast
+
+    def nesting_depth(self):
+        max_depth = 0
+        stack = [(self.ast, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node.node_type() in ["for", "if"]:
+                depth += 1
+                max_depth = max(max_depth, depth)
+            stack.extend((child_node, depth) for child_node in node.children)
+        return max_depth
+
+    def measure_loops(self):
+        for node in walk_postorder(self.ast):
+            if node.node_type() != "for":
+                continue
+            height = 1
+            uses = LiveSet()
+            stack = list(node.children)
+            while stack:
+                child_node = stack.pop()
+                if child_node.node_type() == "for":
+                    height = max(height, self.loop_heights[child_node] + 1)
+                    uses = uses.union(self.loop_uses[child_node])
+                elif child_node.node_type() == "variable":
+                    self.add_uses(uses, child_node)
+                else:
+                    stack.extend(child_node.children)
+            self.loop_heights[node] = height
+            self.loop_uses[node] = uses
+
+    def constant_index(self, variable_node):
+        index = []
+        for index_node in variable_node.children:
+            if index_node.node_type() != "literal" or index_node.type != "int":
+                return None
+            index.append(int(index_node.value))
+        return tuple(index)
+
+    def add_uses(self, live, expression_node):
+        for node in walk_preorder(expression_node):
+            if node.node_type() != "variable":
+                continue
+            if node.num_of_dims() == 0:
+                live.add_scalar(node.symbol)
+                continue
+            index = self.constant_index(node)
+            if index is None:
+                live.add_array(node.symbol)
+            else:
+                live.add_element(node.symbol, index)
+        return live
+
+    def is_store_live(self, variable_node, live):
+        if variable_node.num_of_dims() == 0:
+            return live.is_scalar_live(variable_node.symbol)
+        index = self.constant_index(variable_node)
+        if index is None:
+            return live.is_array_live(variable_node.symbol)
+        return live.is_element_live(variable_node.symbol, index)
+
+    def analyse_assign(self, assign_node, live):
+        variable_node, expression_node = assign_node.children
+        if variable_node.num_of_dims() == 0:
+            live.kill_scalar(variable_node.symbol)
+        else:
+            index = self.constant_index(variable_node)
+            if index is not None:
+                live.kill_element(variable_node.symbol, index)
+            for index_node in variable_node.children:
+                self.add_uses(live, index_node)
+        return self.add_uses(live, expression_node)
+
+    def analyse_block(self, block_node, live_out, remove):
+        live = live_out.copy()
+        kept_children = []
+        for node in reversed(block_node.children):
+            node_type = node.node_type()
+            if node_type == "assign":
+                if not self.is_store_live(node.children[0], live):
+                    if remove:
+                        self.removed_assignments += 1
+                    continue
+                live = self.analyse_assign(node, live)
+            elif node_type == "initializer":
+                if not live.is_array_live(node.symbol):
+                    if remove:
+                        self.removed_assignments += 1
+                    continue
+                live.kill_array(node.symbol)
+            elif node_type == "for":
+                live, removable = self.analyse_for(node, live, remove)
+                if remove and removable:
+                    self.removed_statements += 1
+                    continue
+            elif node_type == "if":
+                live, removable = self.analyse_if(node, live, remove)
+                if remove and removable:
+                    self.removed_statements += 1
+                    continue
+            else:
+                for child_node in node.children:
+                    self.add_uses(live, child_node)
+            kept_children.append(node)
+
+        if remove:
+            removed_children = set(block_node.children) - set(kept_children)
+            for node in removed_children:
+                node.parent = None
+            block_node.children = kept_children[::-1]
+        return live
+
+    def analyse_for(self, for_node, live_out, remove):
+        assign_node, limit_node, step_node, subroutine_node = for_node.children
+        variable_node = assign_node.children[0]
+
+        header_live = live_out.copy()
+        self.add_uses(header_live, variable_node)
+        self.add_uses(header_live, limit_node)
+        self.add_uses(header_live, step_node)
+        if self.loop_heights[for_node] > MAX_FIXPOINT_HEIGHT:
+            header_live = header_live.union(self.loop_uses[for_node])
+        else:
+            while True:
+                body_live = self.analyse_block(subroutine_node, header_live, remove=False)
+                new_header_live = header_live.union(body_live)
+                if new_header_live == header_live:
+                    break
+                header_live = new_header_live
+        if remove:
+            self.analyse_block(subroutine_node, header_live, remove=True)
+
+        removable = (not subroutine_node.children and
+                     variable_node.num_of_dims() == 0 and
+                     not live_out.is_scalar_live(variable_node.symbol) and
+                     step_node.node_type() == "literal" and
+                     step_node.type == "int" and
+                     int(step_node.value) > 0)
+        if removable:
+            return live_out, True
+        return self.analyse_assign(assign_node, header_live.copy()), False
+
+    def analyse_if(self, if_node, live_out, remove):
+        comparator_node = if_node.children[0]
+        live = LiveSet()
+        for subroutine_node in if_node.children[1:]:
+            live = live.union(self.analyse_block(subroutine_node, live_out, remove=remove))
+        if len(if_node.children) < 3:
+            live = live.union(live_out)
+
+        if all(not subroutine_node.children for subroutine_node in if_node.children[1:]):
+            return live_out, True
+        return self.add_uses(live, comparator_node), False
+
+    def remove_unused_variables(self):
+        used_symbols = set()
+        scope_nodes = []
+        for node in walk_preorder(self.ast):
+            if node.node_type() in ["variable", "initializer"]:
+                used_symbols.add(node.symbol)
+            elif node.node_type() in ["program", "subroutine"]:
+                scope_nodes.append(node)
+
+        for scope_node in scope_nodes:
+            for symbol in list(scope_node.symbol_table):
+                if symbol not in used_symbols:
+                    scope_node.symbol_table.remove(symbol.name)
+                    self.removed_variables += 1
+
+
+if __name__ == "__main__":
+    from syntax_analyser import SyntaxAnalyser
+
+    filename = "sample_text.txt"
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    ast = SyntaxAnalyser(filename=filename).build_ast()
+    liveness_analyser = LivenessAnalyser(ast)
+    liveness_analyser.run()
+    ast.print_tree()
+    print(f"Removed {liveness_analyser.removed_assignments} assignments, "
+          f"{liveness_analyser.removed_statements} statements and "
+          f"{liveness_analyser.removed_variables} variables.")
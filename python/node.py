@@ -1,8 +1,12 @@
-import re
+from symbol_table import SymbolTable
+from visitor import walk_preorder
 
 
 class Node:
 
+    __slots__ = ("parent", "line_number", "children")
+    KIND = None
+
     def __init__(self, line_number=None) -> None:
         self.parent = None
         self.line_number = line_number
@@ -64,149 +68,175 @@ class Node:
         return current_node
 
     def node_type(self):
-        class_name = self.__class__.__name__
-        return None if class_name == "Node" else re.match(r"([a-zA-Z]+)Node", class_name).group(1).lower()
+        return self.KIND
+
+    def attribute_names(self):
+        names = []
+        for cls in reversed(self.__class__.__mro__):
+            names.extend(cls.__dict__.get("__slots__", ()))
+        return names
 
     def get_all_children(self):
-        all_children = [self]
-        for child in self.children:
-            all_children += child.get_all_children()
-        return all_children
+        return list(walk_preorder(self))
 
     def print_node(self, padding="", last_child=True):
-
-        print(f"{padding}|-{self}")
-        for child in self.children:
-            if last_child:
-                child.print_node(padding+"  ", child is self.children[-1])
-            else:
-                child.print_node(padding+"| ", child is self.children[-1])
-
+        stack = [(self, padding, last_child)]
+        while stack:
+            node, padding, last_child = stack.pop()
+            print(f"{padding}|-{node}")
+            child_padding = padding + ("  " if last_child else "| ")
+            for child in node.children[::-1]:
+                stack.append((child, child_padding, child is node.children[-1]))
 
     def print_tree(self):
         self.get_root().print_node()
 
     def __repr__(self) -> str:
         attributes = ""
-        for attr, value in self.__dict__.items():
+        for attr in self.attribute_names():
+            value = getattr(self, attr)
             if attr in ["parent", "children", "line_number", "scope"]:
                 continue
-            elif attr == "dims":
-                if self.num_of_dims() > 0:
-                    attributes += f' dims="{self.num_of_dims()}"'
-            elif attr == "variable_list":
-                attributes += f' variable_list={self.variable_list}'
+            elif attr == "symbol":
+                attributes += f' name="{value.name}" type="{value.type}" address="{value.address}"'
+                if value.register is not None:
+                    attributes += f' register="{value.register}"'
+                if value.num_of_dims() > 0:
+                    attributes += f' dims="{value.num_of_dims()}"'
+            elif attr == "values":
+                attributes += f' items="{len(value)}"'
+            elif attr == "symbol_table":
+                attributes += f' symbol_table={self.symbol_table}'
             else:
                 attributes += f' {attr}="{value}"'
         return f'{self.node_type()}{attributes}'
 
 class ProgramNode(Node):
+
+    __slots__ = ("symbol_table",)
+    KIND = "program"
     
     def __init__(self, line_number=None):
         super().__init__(line_number=line_number)
-        self.variable_list = []
-        
-    def set_address(self, name, address):
-        all_children = self.get_all_children()
-        all_variables = [node for node in all_children if node.node_type() == "variable" and 
-                                                          node.name == name and
-                                                          node.scope == self]
-        for variable in all_variables:
-            variable.address = address
-        for variable in [var for var in self.variable_list if var.name == name]:
-            variable.address = address
-
-    def set_type(self, name, type):
-        all_children = self.get_all_children()
-        all_variables = [node for node in all_children if node.node_type() == "variable" and 
-                                                          node.name == name and
-                                                          node.scope == self]
-        for variable in all_variables:
-            variable.type = type
-        for variable in self.variable_list:
-            variable.type = type
+        self.symbol_table = SymbolTable(scope=self)
     
 
 class AssignNode(Node):
+
+    __slots__ = ("type",)
+    KIND = "assign"
     
     def __init__(self, line_number=None, type=None) -> None:
         super().__init__(line_number=line_number)
         self.type = type  
 
+class InitializerNode(Node):
+
+    __slots__ = ("symbol", "values", "address")
+    KIND = "initializer"
+
+    def __init__(self, symbol, values, line_number=None) -> None:
+        super().__init__(line_number=line_number)
+        self.symbol = symbol
+        self.values = values
+        self.address = None
+
 class GoToNode(Node):
-    pass
+
+    __slots__ = ()
+    KIND = "goto"
 
 class VariableNode(Node):
 
-    def __init__(self, name, type=None, dims=None, address=0, scope=None):
+    __slots__ = ("symbol",)
+    KIND = "variable"
+
+    def __init__(self, symbol):
         super().__init__()
-        self.name = name
-        self.type = type
-        self.address = address
-        self.scope = scope
-        if dims is not None:
-            self.dims = dims
-        else:
-            self.dims = []
+        self.symbol = symbol
 
-    def num_of_dims(self):
-        return len(self.dims)
+    @property
+    def name(self):
+        return self.symbol.name
 
-    def num_of_items(self):
-        items = 1
-        for dim in self.dims:
-            items = items * dim
-        return items
+    @property
+    def type(self):
+        return self.symbol.type
 
-    def deepcopy(self):
-        new_node = self.__class__(self.name)
-        new_node.type = self.type
-        new_node.dims = [dim for dim in self.dims]
-        new_node.address = self.address
-        new_node.scope = self.scope
-        new_node.children = []
+    @type.setter
+    def type(self, type):
+        self.symbol.type = type
 
-        return new_node
+    @property
+    def dims(self):
+        return self.symbol.dims
+
+    @property
+    def address(self):
+        return self.symbol.address
+
+    @property
+    def scope(self):
+        return self.symbol.scope
+
+    @property
+    def register(self):
+        return self.symbol.register
+
+    def num_of_dims(self):
+        return self.symbol.num_of_dims()
+
+    def num_of_items(self):
+        return self.symbol.num_of_items()
 
 class LiteralNode(Node):
 
-    def __init__(self, value) -> None:
+    __slots__ = ("value", "type", "address")
+    KIND = "literal"
+
+    def __init__(self, value, type) -> None:
         super().__init__()
         self.value = value
-        self.set_type(value)
+        self.type = type
         self.address = None
 
-    def set_type(self, value):
-        if re.match(r"-?[0-9]+", value):
-            self.type = "int"  
-        elif re.match(r"-?[0-9]*\.[0-9]+", value):
-            self.type = "float"
-        elif re.match(r'".*"', value):
-            self.type = "string"
-        else:
-            raise Exception(f"Literal {value} has no type.")
-
 class OperatorNode(Node):
+
+    __slots__ = ("operation", "type")
+    KIND = "operator"
     
     def __init__(self, operation, type=None) -> None:
         super().__init__()
         self.operation = operation
         self.type = None
 
+    def is_unary(self):
+        return len(self.children) == 1
+
 class ForNode(Node):
-    pass
+
+    __slots__ = ()
+    KIND = "for"
 
 class IfNode(Node):
-    pass
+
+    __slots__ = ()
+    KIND = "if"
 
 class SubRoutineNode(ProgramNode):
-    pass
+
+    __slots__ = ()
+    KIND = "subroutine"
 
 class PrintNode(Node):
-    pass
+
+    __slots__ = ()
+    KIND = "print"
 
 class PrintlnNode(Node):
-    pass
+
+    __slots__ = ()
+    KIND = "println"
 
 if __name__ == "__main__":
     main = Node("Aaron")
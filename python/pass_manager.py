@@ -0,0 +1,98 @@
+from token_buffer import TokenBuffer
+from visitor import walk_preorder
+
+import json
+import sys
+import time
+# tracemalloc imports tokenize, which finds token.py here instead of the
+# standard library's, so its C module is used directly.
+import _tracemalloc as tracemalloc
+
+
+class PassStats:
+
+    __slots__ = ("name", "time", "peak_memory", "tokens", "nodes", "instructions")
+
+    def __init__(self, name) -> None:
+        self.name = name
+        self.time = 0.0
+        self.peak_memory = None
+        self.tokens = None
+        self.nodes = None
+        self.instructions = None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class PassManager:
+
+    def __init__(self, collect_stats=False, trace_memory=False) -> None:
+        self.collect_stats = collect_stats or trace_memory
+        self.trace_memory = trace_memory
+        self.stats = []
+
+    def run(self, passes, context):
+        # Passes are (name, function) pairs run in order. After each one the
+        # context is measured through its tokens, ast and program_lines.
+        for name, function in passes:
+            self.run_pass(name, function, context)
+
+    def run_pass(self, name, function, context):
+        if not self.collect_stats:
+            function()
+            return
+
+        stats = PassStats(name)
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        function()
+        stats.time = time.perf_counter() - start
+        if self.trace_memory:
+            stats.peak_memory = tracemalloc.get_traced_memory()[1]
+
+        if isinstance(context.tokens, (list, TokenBuffer)):
+            stats.tokens = len(context.tokens)
+        if context.ast is not None:
+            stats.nodes = sum(1 for node in walk_preorder(context.ast))
+        if context.program_lines:
+            stats.instructions = len(context.program_lines)
+        self.stats.append(stats)
+
+    def stop(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def total_time(self):
+        return sum(stats.time for stats in self.stats)
+
+    def table(self):
+        def cell(value, width, format=""):
+            return f"{'-':>{width}}" if value is None else f"{value:>{width}{format}}"
+
+        lines = [f"{'pass':<24}{'time ms':>10}{'peak KiB':>12}{'tokens':>10}{'nodes':>10}{'instructions':>14}"]
+        for stats in self.stats:
+            peak_memory = None if stats.peak_memory is None else stats.peak_memory / 2**10
+            lines.append(f"{stats.name:<24}{stats.time * 1000:>10.2f}{cell(peak_memory, 12, '.1f')}"
+                         f"{cell(stats.tokens, 10)}{cell(stats.nodes, 10)}{cell(stats.instructions, 14)}")
+        lines.append(f"{'total':<24}{self.total_time() * 1000:>10.2f}")
+        return "\n".join(lines)
+
+    def to_json(self, **fields):
+        return json.dumps(dict(fields, passes=[stats.to_dict() for stats in self.stats],
+                               total_time=self.total_time()), indent=2)
+
+
+if __name__ == "__main__":
+    from code_generator import CodeGenerator
+
+    filename = "sample_text.txt"
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    code_generator = CodeGenerator(filename=filename, pass_manager=PassManager(trace_memory=True))
+    code_generator.generate()
+    code_generator.pass_manager.stop()
+    print(code_generator.pass_manager.table())
@@ -0,0 +1,364 @@
+from instruction import ESP, Immediate, Instruction, Label, Memory, Register
+
+import sys
+
+WINDOW_SIZE = 8
+LIVENESS_HORIZON = 32
+
+# Instructions whose first operand may be replaced by any register, memory or
+# immediate operand, as long as the result still has at most one memory operand.
+SUBSTITUTABLE = ["movl", "addl", "subl", "imul", "andl", "orl", "xorl", "cmpl", "pushl", "idivl"]
+
+
+class PeepholeOptimizer:
+
+    def __init__(self, instructions) -> None:
+        self.instructions = instructions
+        self.lines_before = len(instructions)
+        self.passes = 0
+        self.labels = {}
+        self.stats = {name: 0 for name, opcodes, rule in RULES}
+
+    def run(self):
+        active_positions = None
+        while True:
+            self.passes += 1
+            self.labels = {item.name: i for i, item in enumerate(self.instructions) if isinstance(item, Label)}
+            optimized_instructions = []
+            changed_positions = []
+            i = 0
+            while i < len(self.instructions):
+                match = None
+                if active_positions is None or active_positions[i]:
+                    match = self.apply_rules(i)
+                if match is None:
+                    optimized_instructions.append(self.instructions[i])
+                    i += 1
+                else:
+                    end, replacement = match
+                    changed_positions.append(len(optimized_instructions))
+                    optimized_instructions.extend(replacement)
+                    i = end
+            self.instructions = optimized_instructions
+            if not changed_positions:
+                return self.instructions
+            active_positions = self.neighbourhood(changed_positions)
+
+    def apply_rules(self, i):
+        item = self.instructions[i]
+        if not isinstance(item, Instruction):
+            return None
+        for name, rule in RULES_BY_OPCODE.get(item.opcode, []):
+            match = rule(self, i)
+            if match is not None:
+                self.stats[name] += 1
+                return match
+        return None
+
+    def neighbourhood(self, changed_positions):
+        # Only code near a rewrite can have become optimizable, because rules
+        # look back at most LIVENESS_HORIZON and forward at most WINDOW_SIZE items.
+        active_positions = [False] * len(self.instructions)
+        for position in changed_positions:
+            start = max(0, position - LIVENESS_HORIZON)
+            end = min(len(active_positions), position + WINDOW_SIZE)
+            active_positions[start:end] = [True] * (end - start)
+        return active_positions
+
+    def report(self):
+        lines = [f"Peephole optimizer: {self.lines_before} -> {len(self.instructions)} lines in {self.passes} passes"]
+        for name, count in self.stats.items():
+            lines.append(f"\t{name:<24} {count}")
+        return "\n".join(lines)
+
+    def instruction_at(self, i):
+        if i < len(self.instructions) and isinstance(self.instructions[i], Instruction):
+            return self.instructions[i]
+        return None
+
+    def is_register_dead(self, start, register_name):
+        return self.is_dead(start, lambda instruction: register_name in instruction.registers_read(),
+                            lambda instruction: register_name in instruction.registers_written())
+
+    def are_flags_dead(self, start):
+        return self.is_dead(start, Instruction.reads_flags, Instruction.writes_flags)
+
+    def is_dead(self, start, reads, writes):
+        pending = [start]
+        visited = set()
+        while pending:
+            i = pending.pop()
+            while i < len(self.instructions):
+                if i in visited or len(visited) > LIVENESS_HORIZON:
+                    break
+                visited.add(i)
+                item = self.instructions[i]
+                i += 1
+                if not isinstance(item, Instruction):
+                    continue
+                if reads(item):
+                    return False
+                if writes(item) or item.opcode == "ret":
+                    break
+                if item.is_jump():
+                    target = self.labels.get(item.operands[0].name)
+                    if target is None:
+                        return False
+                    pending.append(target)
+                    if item.opcode == "jmp":
+                        break
+            if len(visited) > LIVENESS_HORIZON:
+                return False
+        return True
+
+    def window(self, start):
+        for i in range(start, min(start + WINDOW_SIZE, len(self.instructions))):
+            instruction = self.instruction_at(i)
+            if instruction is None or instruction.is_control_flow():
+                return
+            yield i, instruction
+
+    def preserves(self, instruction, operand):
+        if set(operand.registers()) & instruction.registers_written():
+            return False
+        if isinstance(operand, Memory):
+            return not any(operand.may_alias(memory) for memory in instruction.memory_written())
+        return True
+
+    def find_use(self, start, register, operand):
+        for i, instruction in self.window(start):
+            if register.name in instruction.registers_read():
+                return i, instruction
+            if (register.name in instruction.registers_written() or
+                    instruction.uses_stack() or not self.preserves(instruction, operand)):
+                return None
+        return None
+
+
+def is_valid(instruction):
+    memory_operands = [operand for operand in instruction.operands if isinstance(operand, Memory)]
+    if len(memory_operands) > 1:
+        return False
+    destinations = instruction.destination_operands()
+    if any(isinstance(operand, Immediate) for operand in destinations):
+        return False
+    if instruction.opcode == "idivl" and isinstance(instruction.operands[0], Immediate):
+        return False
+    if instruction.opcode == "cmpl" and isinstance(instruction.operands[1], Immediate):
+        return False
+    if instruction.opcode == "imul" and not isinstance(instruction.operands[-1], Register):
+        return False
+    return True
+
+
+def push_pop(optimizer, i):
+    push = optimizer.instruction_at(i)
+    if push is None or push.opcode != "pushl" or "esp" in push.operands[0].registers():
+        return None
+    value = push.operands[0]
+    intermediates = []
+    for j, instruction in optimizer.window(i + 1):
+        if instruction.opcode == "popl":
+            register = instruction.operands[0]
+            if value == register:
+                return j + 1, intermediates
+            move = Instruction("movl", value, register)
+            if not is_valid(move):
+                return None
+            return j + 1, intermediates + [move]
+        if instruction.uses_stack() or not optimizer.preserves(instruction, value):
+            return None
+        intermediates.append(instruction)
+    return None
+
+
+def self_move(optimizer, i):
+    instruction = optimizer.instruction_at(i)
+    if instruction is None or instruction.opcode != "movl" or instruction.operands[0] != instruction.operands[1]:
+        return None
+    return i + 1, []
+
+
+def forward_source(optimizer, i):
+    move = optimizer.instruction_at(i)
+    if move is None or move.opcode != "movl" or not isinstance(move.operands[1], Register):
+        return None
+    value, register = move.operands
+    if register.name == "esp" or register.name in value.registers():
+        return None
+    use = optimizer.find_use(i + 1, register, value)
+    if use is None:
+        return None
+    j, instruction = use
+    if instruction.opcode not in SUBSTITUTABLE or instruction.operands[0] != register:
+        return None
+    if any(register.name in operand.registers() for operand in instruction.operands[1:]):
+        return None
+    replaced = instruction.with_operands(value, *instruction.operands[1:])
+    if not is_valid(replaced) or register.name in replaced.registers_read():
+        return None
+    if not optimizer.is_register_dead(j + 1, register.name):
+        return None
+    return j + 1, optimizer.instructions[i + 1:j] + [replaced]
+
+
+def fold_index(optimizer, i):
+    move = optimizer.instruction_at(i)
+    if (move is None or move.opcode != "movl" or not isinstance(move.operands[0], Immediate) or
+            not isinstance(move.operands[0].value, int) or not isinstance(move.operands[1], Register)):
+        return None
+    value, register = move.operands
+    use = optimizer.find_use(i + 1, register, value)
+    if use is None:
+        return None
+    j, instruction = use
+    operands = []
+    for operand in instruction.operands:
+        if (isinstance(operand, Memory) and operand.index is not None and operand.index.name == register.name and
+                (operand.base is None or operand.base.name != register.name)):
+            if not isinstance(operand.displacement, int):
+                return None
+            operand = Memory(operand.displacement + value.value * operand.scale, operand.base)
+        elif register.name in operand.registers():
+            return None
+        operands.append(operand)
+    replaced = instruction.with_operands(*operands)
+    if operands == list(instruction.operands) or register.name in replaced.registers_read():
+        return None
+    if not optimizer.is_register_dead(j + 1, register.name):
+        return None
+    return j + 1, optimizer.instructions[i + 1:j] + [replaced]
+
+
+def zero_add(optimizer, i):
+    move = optimizer.instruction_at(i)
+    if move is None or move.opcode != "movl" or move.operands[0] != Immediate(0):
+        return None
+    register = move.operands[1]
+    if not isinstance(register, Register):
+        return None
+    use = optimizer.find_use(i + 1, register, register)
+    if use is None:
+        return None
+    j, instruction = use
+    if instruction.opcode != "addl" or instruction.operands[1] != register:
+        return None
+    value = instruction.operands[0]
+    if register.name in value.registers() or not optimizer.are_flags_dead(j + 1):
+        return None
+    return j + 1, optimizer.instructions[i + 1:j] + [Instruction("movl", value, register)]
+
+
+def store_load(optimizer, i):
+    store = optimizer.instruction_at(i)
+    load = optimizer.instruction_at(i + 1)
+    if (store is None or load is None or store.opcode != "movl" or load.opcode != "movl" or
+            not isinstance(store.operands[0], Register) or not isinstance(store.operands[1], Memory)):
+        return None
+    register, memory = store.operands
+    if load.operands[0] != memory or not isinstance(load.operands[1], Register):
+        return None
+    if register.name in memory.registers() or load.operands[1].name in memory.registers():
+        return None
+    if load.operands[1] == register:
+        return i + 2, [store]
+    return i + 2, [store, Instruction("movl", register, load.operands[1])]
+
+
+def dead_move(optimizer, i):
+    move = optimizer.instruction_at(i)
+    if move is None or move.opcode not in ["movl", "leal"] or not isinstance(move.operands[1], Register):
+        return None
+    if move.operands[1].name == "esp" or not optimizer.is_register_dead(i + 1, move.operands[1].name):
+        return None
+    return i + 1, []
+
+
+def identity_operation(optimizer, i):
+    instruction = optimizer.instruction_at(i)
+    if instruction is None or len(instruction.operands) != 2:
+        return None
+    identities = {"imul": Immediate(1), "addl": Immediate(0), "subl": Immediate(0)}
+    if identities.get(instruction.opcode) != instruction.operands[0]:
+        return None
+    if not optimizer.are_flags_dead(i + 1):
+        return None
+    return i + 1, []
+
+
+def discard_pop(optimizer, i):
+    pop = optimizer.instruction_at(i)
+    if pop is None or pop.opcode != "popl" or not isinstance(pop.operands[0], Register):
+        return None
+    if not optimizer.is_register_dead(i + 1, pop.operands[0].name) or not optimizer.are_flags_dead(i + 1):
+        return None
+    return i + 1, [Instruction("addl", Immediate(4), ESP)]
+
+
+def merge_stack_adjustments(optimizer, i):
+    first = optimizer.instruction_at(i)
+    second = optimizer.instruction_at(i + 1)
+    if first is None or second is None:
+        return None
+    adjustments = []
+    for instruction in [first, second]:
+        if (instruction.opcode not in ["addl", "subl"] or instruction.operands[1] != ESP or
+                not isinstance(instruction.operands[0], Immediate) or
+                not isinstance(instruction.operands[0].value, int)):
+            return None
+        sign = 1 if instruction.opcode == "addl" else -1
+        adjustments.append(sign * instruction.operands[0].value)
+    if not optimizer.are_flags_dead(i + 2):
+        return None
+    total = sum(adjustments)
+    if total == 0:
+        return i + 2, []
+    if total > 0:
+        return i + 2, [Instruction("addl", Immediate(total), ESP)]
+    return i + 2, [Instruction("subl", Immediate(-total), ESP)]
+
+
+def jump_to_next(optimizer, i):
+    jump = optimizer.instruction_at(i)
+    if jump is None or jump.opcode != "jmp":
+        return None
+    for j in range(i + 1, len(optimizer.instructions)):
+        item = optimizer.instructions[j]
+        if not isinstance(item, Label):
+            return None
+        if item.name == jump.operands[0].name:
+            return i + 1, []
+    return None
+
+
+RULES = [
+    ("push-pop", ["pushl"], push_pop),
+    ("self-move", ["movl"], self_move),
+    ("store-load", ["movl"], store_load),
+    ("forward-source", ["movl"], forward_source),
+    ("fold-index", ["movl"], fold_index),
+    ("zero-add", ["movl"], zero_add),
+    ("dead-move", ["movl", "leal"], dead_move),
+    ("identity-operation", ["imul", "addl", "subl"], identity_operation),
+    ("discard-pop", ["popl"], discard_pop),
+    ("merge-stack-adjustments", ["addl", "subl"], merge_stack_adjustments),
+    ("jump-to-next", ["jmp"], jump_to_next),
+]
+
+RULES_BY_OPCODE = {}
+for name, opcodes, rule in RULES:
+    for opcode in opcodes:
+        RULES_BY_OPCODE.setdefault(opcode, []).append((name, rule))
+
+
+if __name__ == "__main__":
+    from code_generator import CodeGenerator
+
+    filename = "sample_text.txt"
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    code_generator = CodeGenerator(filename=filename, optimize=False)
+    code_generator.generate()
+    optimizer = PeepholeOptimizer(code_generator.program_lines)
+    optimizer.run()
+    print(optimizer.report())
@@ -0,0 +1,48 @@
+import re
+
+# Escapes the assembler decodes in .ascii strings.
+STRING_ESCAPES = {b"n": b"\n", b"t": b"\t", b"r": b"\r", b"b": b"\b", b"f": b"\f", b"\\": b"\\", b'"': b'"'}
+# Conversions the runtime writes without printf: integers with an optional
+# width, and literal percent signs.
+FORMAT_CONVERSION = re.compile(rb"%([1-9][0-9]*)?[di]|%%")
+
+def decode_string(value):
+    text = value[1:-1].encode()
+    decoded = b""
+    i = 0
+    while i < len(text):
+        if text[i:i + 1] != b"\\":
+            decoded += text[i:i + 1]
+            i += 1
+            continue
+        escape = STRING_ESCAPES.get(text[i + 1:i + 2])
+        if escape is None:
+            return None
+        decoded += escape
+        i += 2
+    return decoded
+
+def parse_format(value):
+    # Splits a format string into ("write", offset, length) pieces of its
+    # bytes and ("int", width) conversions, or returns None if printf is needed.
+    text = decode_string(value)
+    if text is None:
+        return None
+    pieces = []
+    start = 0
+    i = text.find(b"%")
+    while i != -1:
+        match = FORMAT_CONVERSION.match(text, i)
+        if match is None:
+            return None
+        # The first sign of "%%" is written as part of the text before it.
+        end = i + 1 if match.group(0) == b"%%" else i
+        if end > start:
+            pieces.append(("write", start, end - start))
+        if match.group(0) != b"%%":
+            pieces.append(("int", int(match.group(1) or 0)))
+        start = match.end()
+        i = text.find(b"%", start)
+    if start < len(text):
+        pieces.append(("write", start, len(text) - start))
+    return pieces
@@ -0,0 +1,180 @@
+from instruction import CALLEE_SAVED
+from visitor import NodeVisitor, walk_postorder
+
+import sys
+
+LOOP_WEIGHT = 10
+
+
+def is_constant(node):
+    return node.node_type() == "literal" and node.type == "int"
+
+
+def is_register_variable(node):
+    return node.node_type() == "variable" and node.num_of_dims() == 0 and node.register is not None
+
+
+def register_offset(node):
+    if is_register_variable(node):
+        return node, 0
+    if (node.node_type() == "operator" and not node.is_unary() and node.operation in ["+", "-"] and
+            is_register_variable(node.children[0]) and is_constant(node.children[1])):
+        offset = int(node.children[1].value)
+        return node.children[0], offset if node.operation == "+" else -offset
+    return None
+
+
+def is_simple(node):
+    node_type = node.node_type()
+    if node_type == "literal":
+        return node.type == "int"
+    if node_type == "variable":
+        if not node.children:
+            return True
+        # The last index has a stride of one, so a register holding it can be
+        # used directly as the index of the memory operand, with any constant
+        # offset folded into the displacement.
+        last_index_node = node.children[-1]
+        return (all(is_constant(index_node) for index_node in node.children[:-1]) and
+                (is_constant(last_index_node) or register_offset(last_index_node) is not None))
+    return False
+
+
+def sethi_ullman_numbers(expression_node):
+    needs = {}
+    for node in walk_postorder(expression_node):
+        if is_simple(node):
+            needs[node] = 0
+        elif node.node_type() == "variable":
+            dynamic_indexes = [index_node for index_node in node.children if not is_simple(index_node)]
+            need = max([1] + [needs[index_node] for index_node in dynamic_indexes])
+            if len(node.children) > 1:
+                need = max([need] + [needs[index_node] + 1 for index_node in node.children[1:]])
+            needs[node] = need
+        elif node.node_type() == "operator" and node.is_unary():
+            needs[node] = max(1, needs[node.children[0]])
+        else:
+            left_node, right_node = node.children
+            left_need = max(1, needs[left_node])
+            right_need = needs[right_node]
+            if left_need == right_need:
+                needs[node] = left_need + 1
+            else:
+                needs[node] = max(left_need, right_need)
+    return needs
+
+
+class Interval:
+
+    __slots__ = ("symbol", "start", "end", "weight")
+
+    def __init__(self, symbol, position) -> None:
+        self.symbol = symbol
+        self.start = position
+        self.end = position
+        self.weight = 0
+
+    def __repr__(self) -> str:
+        return f"interval {self.symbol.name} [{self.start}, {self.end}] weight={self.weight}"
+
+
+class RegisterAllocator(NodeVisitor):
+
+    def __init__(self, ast, registers=None) -> None:
+        self.ast = ast
+        self.registers = list(CALLEE_SAVED) if registers is None else registers
+        self.intervals = {}
+        self.position = 0
+        self.loops = []
+        self.has_goto = False
+        self.spilled = []
+
+    def run(self):
+        self.visit(self.ast)
+        if self.has_goto:
+            for interval in self.intervals.values():
+                interval.start = 0
+                interval.end = self.position
+        self.linear_scan()
+        return self.used_registers()
+
+    def enter(self, node):
+        self.position += 1
+        return super().enter(node)
+
+    def interval(self, symbol):
+        interval = self.intervals.get(symbol)
+        if interval is None:
+            interval = Interval(symbol, self.position)
+            self.intervals[symbol] = interval
+        return interval
+
+    def enter_variable(self, variable_node):
+        if variable_node.num_of_dims() != 0 or variable_node.type != "int":
+            return None
+        interval = self.interval(variable_node.symbol)
+        interval.end = self.position
+        interval.weight += LOOP_WEIGHT ** len(self.loops)
+        if self.loops:
+            self.loops[-1][1].add(variable_node.symbol)
+        return None
+
+    def enter_goto(self, goto_node):
+        self.has_goto = True
+
+    def enter_for(self, for_node):
+        self.loops.append((self.position, set()))
+        variable_node = for_node.children[0].children[0]
+        if variable_node.num_of_dims() == 0 and variable_node.type == "int":
+            # The increment and the limit test run once per iteration.
+            self.interval(variable_node.symbol).weight += 2 * LOOP_WEIGHT ** len(self.loops)
+
+    def leave_for(self, for_node):
+        start, symbols = self.loops.pop()
+        for symbol in symbols:
+            interval = self.intervals[symbol]
+            interval.start = min(interval.start, start)
+            interval.end = max(interval.end, self.position)
+        if self.loops:
+            self.loops[-1][1].update(symbols)
+
+    def linear_scan(self):
+        free_registers = list(self.registers)
+        active = []
+        for interval in sorted(self.intervals.values(), key=lambda interval: interval.start):
+            for active_interval in list(active):
+                if active_interval.end < interval.start:
+                    active.remove(active_interval)
+                    free_registers.append(active_interval.symbol.register)
+
+            if free_registers:
+                interval.symbol.register = free_registers.pop(0)
+                active.append(interval)
+                continue
+
+            cheapest = min(active, key=lambda active_interval: active_interval.weight)
+            if cheapest.weight < interval.weight:
+                interval.symbol.register = cheapest.symbol.register
+                cheapest.symbol.register = None
+                active.remove(cheapest)
+                active.append(interval)
+                self.spilled.append(cheapest)
+            else:
+                self.spilled.append(interval)
+
+    def used_registers(self):
+        used = {interval.symbol.register for interval in self.intervals.values()}
+        return [register for register in self.registers if register in used]
+
+
+if __name__ == "__main__":
+    from syntax_analyser import SyntaxAnalyser
+
+    filename = "sample_text.txt"
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    ast = SyntaxAnalyser(filename=filename).build_ast()
+    register_allocator = RegisterAllocator(ast)
+    register_allocator.run()
+    for interval in sorted(register_allocator.intervals.values(), key=lambda interval: interval.start):
+        print(f"{interval} -> {interval.symbol.register or 'memory'}")
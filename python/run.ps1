@@ -1,12 +1,11 @@
+$source = "sample_text.txt"
 if ( $args.count -gt 0 ) 
 {   
-    python code_generator.py $args[0]
+    $source = $args[0]
 } 
-else 
+python batch_compile.py $source
+if ( $LASTEXITCODE -ne 0 ) 
 {
-    python code_generator.py
+    exit $LASTEXITCODE
 }
-gcc -c .\final.s -o final.o
-gcc final.o -o final.exe
-./final.exe
-
+& ".\build\$([System.IO.Path]::GetFileNameWithoutExtension($source)).exe"
@@ -0,0 +1,4 @@
+#!/bin/sh
+source="${1:-sample_text.txt}"
+python3 batch_compile.py --target x86_64-linux "$source" || exit 1
+./build/"$(basename "${source%.*}")"
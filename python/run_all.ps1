@@ -1 +1 @@
-run.ps1 
\ No newline at end of file
+python batch_compile.py $args
@@ -0,0 +1,219 @@
+/* Output runtime linked with the generated code.
+ *
+ * PRINT statements call basic_printf, which formats into a large buffer that
+ * is written out when it fills up and when the program exits. Integers,
+ * characters and strings are formatted here; any other conversion flushes the
+ * buffer and falls back to vprintf. */
+
+#include <stdarg.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define BUFFER_SIZE (64 * 1024)
+
+static char buffer[BUFFER_SIZE];
+static int buffer_length = 0;
+static int flush_registered = 0;
+static int written = 0;
+
+void basic_flush(void) {
+    if (buffer_length > 0) {
+        fwrite(buffer, 1, buffer_length, stdout);
+        buffer_length = 0;
+    }
+    fflush(stdout);
+}
+
+static void reserve(int length) {
+    if (!flush_registered) {
+        atexit(basic_flush);
+        flush_registered = 1;
+    }
+    if (buffer_length + length > BUFFER_SIZE) {
+        basic_flush();
+    }
+}
+
+void basic_write(const char *data, int length) {
+    written += length;
+    reserve(length);
+    if (length > BUFFER_SIZE) {
+        fwrite(data, 1, length, stdout);
+        return;
+    }
+    memcpy(buffer + buffer_length, data, length);
+    buffer_length += length;
+}
+
+static void write_padding(char padding, int count) {
+    if (count > 0) {
+        written += count;
+    }
+    while (count > 0) {
+        int length = count < BUFFER_SIZE ? count : BUFFER_SIZE;
+        reserve(length);
+        memset(buffer + buffer_length, padding, length);
+        buffer_length += length;
+        count -= length;
+    }
+}
+
+static void write_padded(const char *data, int length, int width, int left_align) {
+    if (!left_align) {
+        write_padding(' ', width - length);
+    }
+    basic_write(data, length);
+    if (left_align) {
+        write_padding(' ', width - length);
+    }
+}
+
+static int format_int(char *end, int value, char sign) {
+    /* Formats backwards from end, the magnitude is taken unsigned so that
+     * INT_MIN needs no special case. */
+    unsigned int magnitude = value < 0 ? 0u - (unsigned int) value : (unsigned int) value;
+    char *start = end;
+    do {
+        *--start = (char) ('0' + magnitude % 10);
+        magnitude /= 10;
+    } while (magnitude != 0);
+    if (value < 0) {
+        *--start = '-';
+    } else if (sign) {
+        *--start = sign;
+    }
+    return (int) (end - start);
+}
+
+void basic_write_int(int value, int width) {
+    char digits[16];
+    int length = format_int(digits + sizeof(digits), value, 0);
+    write_padded(digits + sizeof(digits) - length, length, width, 0);
+}
+
+static void write_int(int value, int width, int left_align, int zero_pad, char sign) {
+    char digits[16];
+    char *end = digits + sizeof(digits);
+    int length = format_int(end, value, sign);
+    char *start = end - length;
+    if (zero_pad && !left_align && length < width) {
+        if (*start == '-' || *start == '+' || *start == ' ') {
+            basic_write(start, 1);
+            start++;
+            length--;
+            width--;
+        }
+        write_padding('0', width - length);
+        basic_write(start, length);
+        return;
+    }
+    write_padded(start, length, width, left_align);
+}
+
+static int is_supported(const char *format) {
+    /* Only flags, a width and the conversions d, i, c, s and % are handled
+     * here, anything else goes through the C library. */
+    const char *p = format;
+    while ((p = strchr(p, '%')) != NULL) {
+        p++;
+        while (*p == '-' || *p == '+' || *p == ' ' || *p == '0') {
+            p++;
+        }
+        while ((*p >= '0' && *p <= '9') || *p == '*') {
+            p++;
+        }
+        if (*p != 'd' && *p != 'i' && *p != 'c' && *p != 's' && *p != '%') {
+            return 0;
+        }
+        p++;
+    }
+    return 1;
+}
+
+int basic_printf(const char *format, ...) {
+    va_list args;
+    const char *p = format;
+    int start_written = written;
+
+    va_start(args, format);
+    if (!is_supported(format)) {
+        int result;
+        basic_flush();
+        result = vprintf(format, args);
+        va_end(args);
+        if (result > 0) {
+            written += result;
+        }
+        return result;
+    }
+
+    while (*p != '\0') {
+        const char *literal = p;
+        int left_align = 0, zero_pad = 0, width = 0;
+        char sign = 0;
+
+        while (*p != '\0' && *p != '%') {
+            p++;
+        }
+        if (p > literal) {
+            basic_write(literal, (int) (p - literal));
+        }
+        if (*p == '\0') {
+            break;
+        }
+
+        p++;
+        for (;; p++) {
+            if (*p == '-') {
+                left_align = 1;
+            } else if (*p == '0') {
+                zero_pad = 1;
+            } else if (*p == '+') {
+                sign = '+';
+            } else if (*p == ' ') {
+                if (sign == 0) {
+                    sign = ' ';
+                }
+            } else {
+                break;
+            }
+        }
+        if (*p == '*') {
+            width = va_arg(args, int);
+            if (width < 0) {
+                left_align = 1;
+                width = -width;
+            }
+            p++;
+        } else {
+            while (*p >= '0' && *p <= '9') {
+                width = width * 10 + (*p - '0');
+                p++;
+            }
+        }
+
+        switch (*p) {
+        case 'd':
+        case 'i':
+            write_int(va_arg(args, int), width, left_align, zero_pad, sign);
+            break;
+        case 'c': {
+            char c = (char) va_arg(args, int);
+            write_padded(&c, 1, width, left_align);
+            break;
+        }
+        case 's': {
+            const char *s = va_arg(args, const char *);
+            write_padded(s, (int) strlen(s), width, left_align);
+            break;
+        }
+        default:
+            basic_write(p, 1);
+            break;
+        }
+        p++;
+    }
+    va_end(args);
+    return written - start_written;
+}
@@ -0,0 +1,154 @@
+from invariant_code_mover import InvariantCodeMover, index_sum, index_terms, int_operator
+from node import AssignNode, LiteralNode, VariableNode
+from register_allocator import is_constant
+from visitor import walk_postorder
+
+import sys
+
+
+class LinearForm:
+
+    __slots__ = ("coefficient", "constant", "terms")
+
+    def __init__(self, coefficient=0, constant=0, terms=None) -> None:
+        self.coefficient = coefficient
+        self.constant = constant
+        self.terms = [] if terms is None else terms
+
+    def add(self, other, factor=1):
+        return LinearForm(self.coefficient + factor * other.coefficient,
+                          self.constant + factor * other.constant,
+                          self.terms + [(node, factor * node_factor) for node, node_factor in other.terms])
+
+    def scale(self, factor):
+        return LinearForm().add(self, factor)
+
+
+def linear_form(expression_node, symbol):
+    # Writes the expression as coefficient * symbol + constant + the sum of
+    # the terms, or returns None when symbol does not appear linearly.
+    forms = {}
+    references = {}
+    for node in walk_postorder(expression_node):
+        node_type = node.node_type()
+        references[node] = ((node_type == "variable" and node.symbol is symbol) or
+                            any(references[child_node] for child_node in node.children))
+        if is_constant(node):
+            forms[node] = LinearForm(constant=int(node.value))
+        elif not references[node]:
+            forms[node] = LinearForm(terms=[(node, 1)])
+        elif node_type == "variable":
+            forms[node] = LinearForm(coefficient=1) if not node.children else None
+        elif node_type != "operator" or any(forms[child_node] is None for child_node in node.children):
+            forms[node] = None
+        elif node.is_unary():
+            forms[node] = forms[node.children[0]].scale(-1)
+        elif node.operation in ["+", "-"]:
+            left_node, right_node = node.children
+            forms[node] = forms[left_node].add(forms[right_node], 1 if node.operation == "+" else -1)
+        elif node.operation == "*" and is_constant(node.children[0]):
+            forms[node] = forms[node.children[1]].scale(int(node.children[0].value))
+        elif node.operation == "*" and is_constant(node.children[1]):
+            forms[node] = forms[node.children[0]].scale(int(node.children[1].value))
+        else:
+            forms[node] = None
+    return forms[expression_node]
+
+
+class StrengthReducer(InvariantCodeMover):
+
+    def __init__(self, ast) -> None:
+        super().__init__(ast)
+        self.inductions = {}
+        self.induction_symbols = {}
+        self.reduced_accesses = 0
+
+    def enter_for(self, for_node):
+        children = super().enter_for(for_node)
+        assign_node, limit_node, step_node, subroutine_node = for_node.children
+        variable_node, init_node = assign_node.children
+        if (variable_node.num_of_dims() == 0 and variable_node.type == "int" and
+                variable_node.symbol not in self.body_symbols[for_node] and
+                is_constant(step_node) and
+                (is_constant(init_node) or
+                 (init_node.node_type() == "variable" and init_node.num_of_dims() == 0 and
+                  init_node.type == "int"))):
+            self.inductions[for_node] = (variable_node.symbol, init_node, int(step_node.value))
+        return children
+
+    def hoist_limit(self, for_node):
+        pass
+
+    def process_expression(self, root_node):
+        if not self.loops or self.loops[-1] not in self.inductions:
+            return
+        self.measure(root_node)
+        for node in list(walk_postorder(root_node)):
+            if node.node_type() == "variable" and node.children:
+                self.reduce_access(node)
+
+    def reduce_access(self, variable_node):
+        loop_node = self.loops[-1]
+        symbol, init_node, step = self.inductions[loop_node]
+
+        constant, terms = index_terms(variable_node)
+        form = LinearForm(constant=constant)
+        for index_node, stride in terms:
+            index_form = linear_form(index_node, symbol)
+            if index_form is None:
+                return
+            form = form.add(index_form, stride)
+        # An offset of the loop variable plus a constant needs no new register,
+        # the constant goes into the displacement.
+        if form.coefficient == 0 or (form.coefficient == 1 and not form.terms):
+            return
+        for node, factor in form.terms:
+            if node not in self.safe_nodes or self.invariant_depths[node] >= len(self.loops):
+                return
+
+        # The induction offset starts at the offset of the first iteration and
+        # advances with the loop variable at the end of every iteration.
+        key = (loop_node, form.coefficient, form.constant,
+               tuple((self.expression_id(node), factor) for node, factor in form.terms))
+        induction_symbol = self.induction_symbols.get(key)
+        if induction_symbol is None:
+            start_terms = list(form.terms)
+            start_constant = form.constant
+            if is_constant(init_node):
+                start_constant += form.coefficient * int(init_node.value)
+            else:
+                start_terms.append((VariableNode(init_node.symbol), form.coefficient))
+            start_node = index_sum(start_terms, start_constant)
+            induction_symbol = self.declare_temporary("induction", start_node, len(self.loops) - 1)
+            self.induction_symbols[key] = induction_symbol
+            self.add_increment(loop_node, induction_symbol, form.coefficient * step)
+
+        for index_node in variable_node.children:
+            index_node.parent = None
+        variable_node.children = []
+        variable_node.add_child(VariableNode(induction_symbol))
+        self.reduced_accesses += 1
+
+    def add_increment(self, loop_node, symbol, increment):
+        assign_node = AssignNode(line_number=loop_node.line_number, type="int")
+        assign_node.add_child(VariableNode(symbol))
+        assign_node.add_child(int_operator("+", VariableNode(symbol), LiteralNode(str(increment), "int")))
+        loop_node.children[3].add_child(assign_node)
+
+    def report(self):
+        return (f"Strength reducer: replaced {self.reduced_accesses} array offsets "
+                f"with {len(self.induction_symbols)} induction variables.")
+
+
+if __name__ == "__main__":
+    from syntax_analyser import SyntaxAnalyser
+
+    filename = "sample_text.txt"
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    ast = SyntaxAnalyser(filename=filename).build_ast()
+    InvariantCodeMover(ast).run()
+    strength_reducer = StrengthReducer(ast)
+    strength_reducer.run()
+    ast.print_tree()
+    print(strength_reducer.report())
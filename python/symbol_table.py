@@ -0,0 +1,65 @@
+class Symbol:
+
+    def __init__(self, name, type=None, dims=None, address=0, scope=None) -> None:
+        self.name = name
+        self.type = type
+        self.address = address
+        self.register = None
+        self.scope = scope
+        if dims is not None:
+            self.dims = dims
+        else:
+            self.dims = []
+
+    def num_of_dims(self):
+        return len(self.dims)
+
+    def num_of_items(self):
+        items = 1
+        for dim in self.dims:
+            items = items * dim
+        return items
+
+    def __repr__(self) -> str:
+        attributes = f'name="{self.name}" type="{self.type}" address="{self.address}"'
+        if self.register is not None:
+            attributes += f' register="{self.register}"'
+        if self.num_of_dims() > 0:
+            attributes += f' dims="{self.num_of_dims()}"'
+        return f'symbol {attributes}'
+
+
+class SymbolTable:
+
+    def __init__(self, scope=None, parent=None) -> None:
+        self.scope = scope
+        self.parent = parent
+        self.symbols = {}
+
+    def declare(self, name, type=None, dims=None):
+        if name in self.symbols:
+            raise Exception(f"Variable {name} is already declared in this scope.")
+        symbol = Symbol(name, type=type, dims=dims, scope=self.scope)
+        self.symbols[name] = symbol
+        return symbol
+
+    def remove(self, name):
+        return self.symbols.pop(name)
+
+    def lookup(self, name):
+        table = self
+        while table is not None:
+            symbol = table.symbols.get(name)
+            if symbol is not None:
+                return symbol
+            table = table.parent
+        return None
+
+    def __iter__(self):
+        return iter(self.symbols.values())
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __repr__(self) -> str:
+        return f'{list(self.symbols.values())}'
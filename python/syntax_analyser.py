@@ -1,5 +1,6 @@
 from lexical_analyser import LexicalAnalyser
-from node import ForNode, GoToNode, IfNode, OperatorNode, PrintNode, PrintlnNode, ProgramNode, AssignNode, LiteralNode, SubRoutineNode, VariableNode
+from token_stream import TokenStream
+from node import ForNode, GoToNode, IfNode, InitializerNode, OperatorNode, PrintNode, PrintlnNode, ProgramNode, AssignNode, LiteralNode, SubRoutineNode, VariableNode
 
 import sys
 
@@ -8,10 +9,15 @@ from helpers import is_int
 class SyntaxAnalyser:
 
 
-    def __init__(self, filename="sample_text.txt") -> None:
-        self.current_token_index = 0
-        self.token_list = LexicalAnalyser(filename).analyse_text()
-        self.current_token = self.token_list[0]
+    def __init__(self, filename="sample_text.txt", streaming=True, tokens=None) -> None:
+        if tokens is None:
+            lexical_analyser = LexicalAnalyser(filename)
+            if streaming:
+                tokens = lexical_analyser.generate_tokens()
+            else:
+                tokens = lexical_analyser.analyse_text()
+        self.token_stream = TokenStream(tokens)
+        self.current_token = self.token_stream.current_token
         self.root = ProgramNode()
         self.current_node = self.root
         self.parentheses_count = 0
@@ -19,31 +25,32 @@ class SyntaxAnalyser:
         self.text_line = 1
         self.scope_stack = [self.root]
         self.string_list = []
+        self.initializer_list = []
 
     def tokens_remaining(self):
-        return self.current_token_index < len(self.token_list)
+        return self.token_stream.tokens_remaining()
 
     def get_next_token(self):
-        self.current_token_index += 1
-        if self.tokens_remaining():
-            self.current_token = self.token_list[self.current_token_index]
+        self.current_token = self.token_stream.advance()
 
     def peek_next_token(self):
-        if (self.current_token_index + 1 < len(self.token_list)):
-            return self.token_list[self.current_token_index + 1]
-        return None
+        return self.token_stream.peek()
 
     def get_previous_token(self):
-        self.current_token_index -= 1
-        if (self.current_token_index >= 0):
-            self.current_token = self.token_list[self.current_token_index]
+        self.current_token = self.token_stream.retreat()
+
+    def location(self):
+        location = self.token_stream.location()
+        if location is None:
+            return f"line {self.text_line}"
+        return "line {}, column {}".format(*location)
 
     def build_ast(self):
-        while self.current_token_index < len(self.token_list):
+        while self.tokens_remaining():
             self.set_line_number()
             self.handle_keyword(self.current_token.value)
             if self.tokens_remaining() and self.current_token.value != "\n":
-                raise Exception(f"Command must end with a new line. Ended with {self.current_token.value}.")
+                raise Exception(f"Command must end with a new line. Ended with {self.current_token.value} on {self.location()}.")
             else:
                 self.get_next_token()
         return self.root
@@ -54,7 +61,7 @@ class SyntaxAnalyser:
             self.current_line_number = int(self.current_token.value)
             self.get_next_token()
         else:
-            raise Exception(f'Invalid line number "{self.current_token.value}" on line {self.text_line}.\n')
+            raise Exception(f'Invalid line number "{self.current_token.value}" on {self.location()}.\n')
 
     def handle_keyword(self, keyword):
 
@@ -79,7 +86,7 @@ class SyntaxAnalyser:
         elif self.current_token.type == "identifier":
             self.LET(with_keyword=False)
         else:
-            raise Exception(f"Invalid command at line {self.text_line}.")
+            raise Exception(f"Invalid command at {self.location()}.")
 
     def LET(self, with_keyword=True):                
         assign_node = AssignNode()
@@ -131,12 +138,16 @@ class SyntaxAnalyser:
                 raise Exception("Must close brackets")
             self.get_next_token()
         
-        variable_node = VariableNode(id_name, dims=dims, scope=self.scope_stack[-1])
-        self.current_node.variable_list.append(variable_node)
+        symbol = self.current_node.symbol_table.declare(id_name, dims=dims)
         if self.current_token.type == "operator" and self.current_token.value == "=":
             self.get_next_token()
             current_dim = -1
             current_pos = [0 for dim in dims]
+            strides = [symbol.num_of_items() // (dims[0] if dims else 1)]
+            for dim in dims[1:]:
+                strides.append(strides[-1] // dim)
+            values = ["0" for i in range(symbol.num_of_items())]
+            negated = False
             while self.current_token.type != "separator" or self.current_token.value != "\n":
                 if self.current_token.type == "separator" and self.current_token.value == "{":
                     current_dim += 1
@@ -145,22 +156,33 @@ class SyntaxAnalyser:
                     current_dim -= 1
                 elif self.current_token.type == "separator" and self.current_token.value == ",":
                     current_pos[current_dim] += 1
+                elif self.current_token.type == "operator" and self.current_token.value == "-":
+                    negated = not negated
                 elif self.current_token.type == "literal":
-                    literal_node = LiteralNode(self.current_token.value)
-                    assign_node = AssignNode()
-                    assign_node.type = literal_node.type
-                    variable_node.type = literal_node.type
+                    literal_node = LiteralNode(self.current_token.value, self.current_token.literal_type)
+                    if negated:
+                        literal_node = self.negate(literal_node)
+                        negated = False
+                    symbol.type = literal_node.type
+                    if any(pos >= dim for pos, dim in zip(current_pos, dims)):
+                        raise Exception(f"Too many initializers for {id_name} on line {self.current_line_number}.")
+                    values[sum(pos * stride for pos, stride in zip(current_pos, strides))] = literal_node.value
 
-                    temp_variable_node = variable_node.deepcopy()
-                    assign_node.add_child(temp_variable_node)
+                self.get_next_token()
 
-                    for pos in current_pos:
-                        temp_variable_node.add_child(LiteralNode(str(pos)))
+            if not dims:
+                assign_node = AssignNode(line_number=self.current_line_number, type=symbol.type)
+                assign_node.add_child(VariableNode(symbol))
+                assign_node.add_child(LiteralNode(values[0], symbol.type))
+                self.current_node.add_child(assign_node)
+                return
 
-                    assign_node.add_child(literal_node)
-                    self.current_node.add_child(assign_node)
-                    
-                self.get_next_token()
+            # The whole array is written by a single node holding its values in
+            # row-major order, elements without an initializer are zeroed.
+            initializer_node = InitializerNode(symbol, values, line_number=self.current_line_number)
+            initializer_node.address = f"LI{len(self.initializer_list)}"
+            self.initializer_list.append(initializer_node)
+            self.current_node.add_child(initializer_node)
 
     def GOTO(self):
         goto_node = GoToNode()
@@ -169,7 +191,7 @@ class SyntaxAnalyser:
 
         self.get_next_token()
         if self.current_token.type == "literal" and is_int(self.current_token.value):
-            goto_node.add_child(LiteralNode(self.current_token.value))
+            goto_node.add_child(LiteralNode(self.current_token.value, self.current_token.literal_type))
             self.get_next_token()
         else:
             raise Exception(f"GOTO command must have an integer as argument. Received {self.current_token.value}")
@@ -216,7 +238,7 @@ class SyntaxAnalyser:
             self.get_next_token()
             step_node = self.handle_expression()
         elif self.current_token.type == "separator" and self.current_token.value == "\n":
-            step_node = LiteralNode("1")
+            step_node = LiteralNode("1", "int")
         else:
             raise Exception(f"FOR loop must end with STEP or a new line. Received {self.current_token.value}")
 
@@ -224,8 +246,7 @@ class SyntaxAnalyser:
 
         subroutine_node = SubRoutineNode()
         for_node.add_child(subroutine_node)
-        self.scope_stack.append(subroutine_node)
-        self.current_node = subroutine_node
+        self.push_scope(subroutine_node)
 
     def IF(self):
         if_node = IfNode()
@@ -253,8 +274,7 @@ class SyntaxAnalyser:
 
         subroutine_node = SubRoutineNode()
         if_node.add_child(subroutine_node)
-        self.scope_stack.append(subroutine_node)
-        self.current_node = subroutine_node
+        self.push_scope(subroutine_node)
 
     def ELSE(self):
         if self.scope_stack[-1].parent.node_type() != "if":
@@ -265,11 +285,15 @@ class SyntaxAnalyser:
 
         subroutine_node = SubRoutineNode()
         if_node.add_child(subroutine_node)
-        self.scope_stack.append(subroutine_node)
-        self.current_node = subroutine_node
+        self.push_scope(subroutine_node)
 
         self.get_next_token()
 
+    def push_scope(self, subroutine_node):
+        subroutine_node.symbol_table.parent = self.scope_stack[-1].symbol_table
+        self.scope_stack.append(subroutine_node)
+        self.current_node = subroutine_node
+
     def END(self):
         if len(self.scope_stack) <= 1:
             raise Exception(f"END keyword cannot be used at the global scope.")
@@ -280,10 +304,11 @@ class SyntaxAnalyser:
 
     def PRINT(self):
         print_node = PrintNode()
+        print_node.line_number = self.current_line_number
         self.current_node.add_child(print_node)
 
         self.get_next_token()
-        literal_node = LiteralNode(self.current_token.value)
+        literal_node = LiteralNode(self.current_token.value, self.current_token.literal_type)
         print_node.add_child(literal_node)
         if literal_node.type == "string":
             literal_node.address = f"LC{len(self.string_list)}"
@@ -302,6 +327,7 @@ class SyntaxAnalyser:
 
     def PRINTLN(self):
         println_node = PrintlnNode()
+        println_node.line_number = self.current_line_number
         self.current_node.add_child(println_node)
 
         self.get_next_token()
@@ -359,88 +385,133 @@ class SyntaxAnalyser:
 
         return acc_node
 
+    def negate(self, operand_node):
+        if operand_node.node_type() == "literal" and operand_node.type in ["int", "float"]:
+            if operand_node.value.startswith("-"):
+                return LiteralNode(operand_node.value[1:], operand_node.type)
+            return LiteralNode("-" + operand_node.value, operand_node.type)
+
+        operator_node = OperatorNode("-")
+        operator_node.add_child(operand_node)
+        operator_node.type = operand_node.type
+        return operator_node
+
+    def is_separator(self, value):
+        return self.current_token.type == "separator" and self.current_token.value == value
+
     def handle_expression(self):
+        frames = []
         operands = []
         operators = []
         
         while True:
+            negated = False
+            while self.current_token.type == "operator" and self.current_token.value == "-":
+                negated = not negated
+                self.get_next_token()
+
+            operand_node = None
             if self.current_token.type == "identifier":
-                id_node = self.handle_identifier(being_assigned=False)
-                operands.append(id_node)
+                operand_node = self.get_identifier_node(being_assigned=False)
+                if self.is_separator("["):
+                    self.get_next_token()
+                    frames.append((operands, operators, negated, operand_node))
+                    operands, operators = [], []
+                    continue
+                self.check_dimensions(operand_node)
             elif self.current_token.type == "literal":
-                literal_node = LiteralNode(self.current_token.value)
-                operands.append(literal_node)
+                operand_node = LiteralNode(self.current_token.value, self.current_token.literal_type)
                 self.get_next_token()
-            elif self.current_token.type == "separator" and self.current_token.value == "(":
+            elif self.is_separator("("):
                 self.get_next_token()
-                subexpression_node = self.handle_expression()
-                self.get_next_token()
-                operands.append(subexpression_node)
-            else:
-                break
-
-            if self.current_token.type == "operator":
-                if self.current_token.value in ["*", "/", "+", "-"]:
-                    operator_node = OperatorNode(self.current_token.value)
-                    operators.append(operator_node)
+                frames.append((operands, operators, negated, None))
+                operands, operators = [], []
+                continue
+            elif negated:
+                raise Exception(f"Expected operand after unary minus. Received {self.current_token.value}")
+
+            while True:
+                if operand_node is not None:
+                    if negated:
+                        operand_node = self.negate(operand_node)
+                    operands.append(operand_node)
+
+                    if self.current_token.type == "operator" and self.current_token.value in ["*", "/", "+", "-"]:
+                        operator_node = OperatorNode(self.current_token.value)
+                        operators.append(operator_node)
+                        self.get_next_token()
+                        break
+                    elif self.current_token.type not in ["operator", "separator", "keyword"]:
+                        raise Exception(f"Expressions must have either operators or separators. Received {self.current_token.value}")
+
+                expression_node = self.build_expression_node(operators, operands)
+                if not frames:
+                    return expression_node
+
+                operands, operators, negated, operand_node = frames.pop()
+                if operand_node is None:
                     self.get_next_token()
+                    operand_node = expression_node
                 else:
-                    break
-            elif self.current_token.type == "separator" or self.current_token.type == "keyword":
-                break
-            else:
-                raise Exception(f"Expressions must have either operators or separators. Received {self.current_token.value}")
-    
-        return self.build_expression_node(operators, operands)
+                    operand_node.add_child(expression_node)
+                    if self.is_separator("]"):
+                        self.get_next_token()
+                    else:
+                        raise Exception("Wrong index.")
+                    if self.is_separator("["):
+                        self.get_next_token()
+                        frames.append((operands, operators, negated, operand_node))
+                        operands, operators = [], []
+                        break
+                    self.check_dimensions(operand_node)
 
     def set_variable_type(self, variable_name, type):
-        found = False
-        for scope in self.scope_stack[::-1]:
-            for variable_node in scope.variable_list:
-                if variable_node.name == variable_name:
-                    scope.set_type(variable_name, type)
-                    return
+        symbol = self.scope_stack[-1].symbol_table.lookup(variable_name)
+        if symbol is not None:
+            symbol.type = type
 
     def get_variable_by_name(self, variable_name):
-        for scope in self.scope_stack[::-1]:
-            for variable_node in scope.variable_list:
-                if variable_node.name == variable_name:
-                    return variable_node.deepcopy()
-        return None
+        symbol = self.scope_stack[-1].symbol_table.lookup(variable_name)
+        if symbol is None:
+            return None
+        return VariableNode(symbol)
 
     def list_contains_symbol(self, variable_name):
         return self.get_variable_by_name(variable_name) is not None
 
-    def handle_identifier(self, being_assigned=True):
+    def get_identifier_node(self, being_assigned=True):
+        if self.current_token.type != "identifier":
+            raise Exception("Must assign to variable.")
 
-        if self.current_token.type == "identifier":
+        id_node = self.get_variable_by_name(self.current_token.value)
+        if id_node is None:
+            if being_assigned:
+                symbol = self.current_node.symbol_table.declare(self.current_token.value)
+                id_node = VariableNode(symbol)
+            else:
+                raise Exception(f"Variable {self.current_token.value} is not initialized.")
 
-            id_node = self.get_variable_by_name(self.current_token.value)
-            if id_node is None:
-                if being_assigned:
-                    id_node = VariableNode(self.current_token.value, dims=[], scope=self.scope_stack[-1])
-                    self.current_node.variable_list.append(id_node)
-                else:
-                    raise Exception(f"Variable {self.current_token.value} is not initialized.")
+        self.get_next_token()
+        return id_node
 
-            self.get_next_token() 
-            dim = 0
-            while self.current_token.type == "separator" and self.current_token.value == "[":
-                dim += 1
+    def check_dimensions(self, id_node):
+        dim = len(id_node.children)
+        if id_node.num_of_dims() != dim:
+            raise Exception(f"Wrong dimensions. The variable {id_node.name} has {id_node.num_of_dims()} dimentions, not {dim}.")
 
+    def handle_identifier(self, being_assigned=True):
+        id_node = self.get_identifier_node(being_assigned=being_assigned)
+        while self.is_separator("["):
+            self.get_next_token()
+            expression_node = self.handle_expression()
+            id_node.add_child(expression_node)
+
+            if self.is_separator("]"):
                 self.get_next_token()
-                expression_node = self.handle_expression()
-                id_node.add_child(expression_node)
+            else:
+                raise Exception("Wrong index.")  
 
-                if self.current_token.type == "separator" and self.current_token.value == "]":
-                    self.get_next_token()
-                else:
-                    raise Exception("Wrong index.")  
-            
-            if id_node.num_of_dims() != dim:
-                raise Exception(f"Wrong dimensions. The variable {id_node.name} has {id_node.num_of_dims()} dimentions, not {dim}.")
-        else:
-            raise Exception("Must assign to variable.")
+        self.check_dimensions(id_node)
         return id_node
 
 if __name__ == "__main__":
@@ -3,9 +3,12 @@ class Token:
 
     TYPES = {"identifier", "keyword", "separator", "operator", "literal", "comment"}
 
-    def __init__(self, type=None, value=None) -> None:
+    __slots__ = ("type", "value", "literal_type")
+
+    def __init__(self, type=None, value=None, literal_type=None) -> None:
         self.type = type
         self.value = value
+        self.literal_type = literal_type
 
     def set_type(self, type):
         if (type in self.TYPES):
@@ -0,0 +1,76 @@
+from array import array
+
+KINDS = ("identifier", "keyword", "separator", "operator", "literal", "comment")
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+
+class TokenBuffer:
+
+    # Tokens are kept as parallel arrays: the kind as a small int, the index
+    # of the token's value among the distinct ones, and the line and column
+    # where it starts. Each distinct value has a single Token, shared by all
+    # of its occurrences.
+
+    __slots__ = ("kinds", "value_ids", "lines", "columns", "distinct_tokens", "distinct_kinds", "value_index")
+
+    def __init__(self) -> None:
+        self.kinds = array("B")
+        self.value_ids = array("I")
+        self.lines = array("I")
+        self.columns = array("I")
+        self.distinct_tokens = []
+        self.distinct_kinds = []
+        self.value_index = {}
+
+    def intern(self, token):
+        value_id = self.value_index.get(token)
+        if value_id is None:
+            value_id = self.value_index[token] = len(self.distinct_tokens)
+            self.distinct_tokens.append(token)
+            self.distinct_kinds.append(KIND_CODES[token.type])
+        return value_id
+
+    def append(self, token, line=0, column=0):
+        value_id = self.intern(token)
+        self.kinds.append(self.distinct_kinds[value_id])
+        self.value_ids.append(value_id)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def extend(self, tokens, line, columns):
+        # Adds the tokens of a whole line at once, the common case only
+        # looks up tokens that were already seen.
+        value_ids = list(map(self.value_index.get, tokens))
+        if None in value_ids:
+            value_ids = [self.intern(token) for token in tokens]
+        self.value_ids.extend(value_ids)
+        self.kinds.extend(map(self.distinct_kinds.__getitem__, value_ids))
+        self.lines.extend([line] * len(value_ids))
+        self.columns.extend(columns)
+
+    def truncate(self, length):
+        del self.kinds[length:]
+        del self.value_ids[length:]
+        del self.lines[length:]
+        del self.columns[length:]
+
+    def __len__(self):
+        return len(self.value_ids)
+
+    def __getitem__(self, index):
+        return self.distinct_tokens[self.value_ids[index]]
+
+    def __iter__(self):
+        return map(self.distinct_tokens.__getitem__, self.value_ids)
+
+    def kind(self, index):
+        return KINDS[self.kinds[index]]
+
+    def location(self, index):
+        return self.lines[index], self.columns[index]
+
+    def nbytes(self):
+        return sum(len(column) * column.itemsize for column in [self.kinds, self.value_ids, self.lines, self.columns])
+
+    def __repr__(self) -> str:
+        return f"<TokenBuffer tokens={len(self)} distinct={len(self.distinct_tokens)} bytes={self.nbytes()}>"
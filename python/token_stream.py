@@ -0,0 +1,61 @@
+from token_buffer import TokenBuffer
+
+from collections import deque
+
+
+class TokenStream:
+
+    def __init__(self, tokens, history_size=1) -> None:
+        self.buffer = tokens if isinstance(tokens, TokenBuffer) else None
+        self.tokens = iter(tokens)
+        self.lookahead = deque()
+        self.history = deque(maxlen=history_size)
+        self.position = 0
+        self.exhausted = False
+        self.current_token = self.pull()
+        if self.current_token is None:
+            raise Exception("There are no tokens to parse.")
+
+    def pull(self):
+        if self.lookahead:
+            return self.lookahead.popleft()
+        return next(self.tokens, None)
+
+    def tokens_remaining(self):
+        return not self.exhausted
+
+    def advance(self):
+        self.position += 1
+        next_token = self.pull()
+        if next_token is None:
+            self.exhausted = True
+        else:
+            self.history.append(self.current_token)
+            self.current_token = next_token
+        return self.current_token
+
+    def location(self):
+        # The line and column of the current token, when the tokens come
+        # from a TokenBuffer.
+        if self.buffer is None:
+            return None
+        return self.buffer.location(min(self.position, len(self.buffer) - 1))
+
+    def peek(self):
+        if not self.lookahead:
+            next_token = next(self.tokens, None)
+            if next_token is None:
+                return None
+            self.lookahead.append(next_token)
+        return self.lookahead[0]
+
+    def retreat(self):
+        self.position -= 1
+        if self.exhausted:
+            self.exhausted = False
+        elif self.history:
+            self.lookahead.appendleft(self.current_token)
+            self.current_token = self.history.pop()
+        elif self.position >= 0:
+            raise Exception("Cannot go back further than the token history.")
+        return self.current_token
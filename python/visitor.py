@@ -0,0 +1,41 @@
+def walk_preorder(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
+
+def walk_postorder(node):
+    stack = [(node, False)]
+    while stack:
+        node, children_visited = stack.pop()
+        if children_visited:
+            yield node
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+
+
+class NodeVisitor:
+
+    def visit(self, root):
+        stack = [(root, False)]
+        while stack:
+            node, leaving = stack.pop()
+            if leaving:
+                self.leave(node)
+            else:
+                children = self.enter(node)
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+
+    def enter(self, node):
+        method = getattr(self, f"enter_{node.node_type()}", None)
+        children = method(node) if method is not None else None
+        return node.children if children is None else children
+
+    def leave(self, node):
+        method = getattr(self, f"leave_{node.node_type()}", None)
+        if method is not None:
+            method(node)
@@ -0,0 +1,543 @@
+from instruction import Directive, Immediate, Instruction, Label, Memory, Register, Target
+
+import re
+import struct
+
+REGISTER_NUMBERS = {name: number for number, name in enumerate([
+    "eax", "ecx", "edx", "ebx", "esp", "ebp", "esi", "edi",
+    "r8d", "r9d", "r10d", "r11d", "r12d", "r13d", "r14d", "r15d",
+])}
+SCALES = {1: 0, 2: 1, 4: 2, 8: 3}
+CONDITION_CODES = {
+    "jo": 0, "jno": 1, "jb": 2, "jae": 3, "je": 4, "jne": 5, "jbe": 6, "ja": 7,
+    "js": 8, "jns": 9, "jp": 10, "jnp": 11, "jl": 12, "jge": 13, "jle": 14, "jg": 15,
+}
+# The /digit of the group 1 opcodes, also giving their register forms.
+ALU_DIGITS = {"add": 0, "or": 1, "and": 4, "sub": 5, "xor": 6, "cmp": 7}
+SHIFT_DIGITS = {"shl": 4, "shr": 5, "sar": 7}
+# Single operand instructions as (opcode, /digit).
+UNARY_OPCODES = {"not": (0xF7, 2), "neg": (0xF7, 3), "idiv": (0xF7, 7), "inc": (0xFF, 0), "dec": (0xFF, 1)}
+FIXED_ENCODINGS = {"ret": b"\xc3", "leave": b"\xc9", "cltd": b"\x99", "rep movsl": b"\xf3\xa5"}
+OPERAND_SIZES = {"l": 4, "q": 8}
+
+REX_W = 8
+REX_R = 4
+REX_X = 2
+REX_B = 1
+# Directives with no effect on the object, call frame information included.
+IGNORED_DIRECTIVES = {".file", ".ident"}
+DIRECTIVE_PATTERN = re.compile(r"(\S+)\s*(.*)", re.DOTALL)
+STRING_ESCAPES = {"b": 8, "f": 12, "n": 10, "r": 13, "t": 9, "v": 11, "\\": 92, '"': 34}
+
+
+def fits_byte(value):
+    return -128 <= value <= 127
+
+
+def register_number(register):
+    number = REGISTER_NUMBERS.get(register.name)
+    if number is None:
+        raise Exception(f"Register {register} can't be encoded.")
+    return number
+
+
+def immediate_value(operand):
+    try:
+        return int(operand.value)
+    except ValueError:
+        raise Exception(f"Immediate {operand} must be a number to be encoded.")
+
+
+def symbol_offset(text):
+    # Splits a displacement like LC0+8 into the symbol and the offset.
+    name, _, offset = text.partition("+")
+    try:
+        return name, int(offset or 0)
+    except ValueError:
+        raise Exception(f"Invalid symbol displacement {text}.")
+
+
+def decode_ascii(text):
+    # The escapes of a quoted .ascii string, as the assembler reads them.
+    if len(text) < 2 or text[0] != '"' or text[-1] != '"':
+        raise Exception(f"Expected a quoted string. Received {text}.")
+    data = bytearray()
+    characters = text[1:-1]
+    i = 0
+    while i < len(characters):
+        character = characters[i]
+        i += 1
+        if character != "\\" or i == len(characters):
+            data += character.encode()
+            continue
+        character = characters[i]
+        i += 1
+        if character in "01234567":
+            digits = re.match(r"[0-7]{1,3}", characters[i - 1:]).group()
+            data.append(int(digits, 8) & 0xFF)
+            i += len(digits) - 1
+        elif character == "x":
+            digits = re.match(r"[0-9a-fA-F]*", characters[i:]).group()
+            data.append(int(digits or "0", 16) & 0xFF)
+            i += len(digits)
+        else:
+            data += bytes([STRING_ESCAPES[character]]) if character in STRING_ESCAPES else character.encode()
+    return bytes(data)
+
+
+class Encoding:
+
+    # Machine code of one instruction. A fixup is a 32 bit field at
+    # fixup_position holding the distance from the end of the instruction to
+    # fixup_offset bytes past fixup_target, a label or an external symbol.
+
+    __slots__ = ("code", "fixup_position", "fixup_target", "fixup_offset", "call")
+
+    def __init__(self, code, fixup_position=None, fixup_target=None, fixup_offset=0, call=False) -> None:
+        self.code = code
+        self.fixup_position = fixup_position
+        self.fixup_target = fixup_target
+        self.fixup_offset = fixup_offset
+        self.call = call
+
+    def size(self, offset):
+        return len(self.code)
+
+
+class Jump:
+
+    # A jump to a label of the same section, short until its target is found
+    # to be out of reach of a signed byte.
+
+    __slots__ = ("opcode", "target", "long")
+
+    def __init__(self, opcode, target) -> None:
+        self.opcode = opcode
+        self.target = target
+        self.long = False
+
+    def size(self, offset):
+        if not self.long:
+            return 2
+        return 5 if self.opcode == "jmp" else 6
+
+    def encode(self, displacement):
+        condition = CONDITION_CODES.get(self.opcode)
+        if not self.long:
+            return bytes([0xEB if condition is None else 0x70 | condition]) + struct.pack("<b", displacement)
+        if condition is None:
+            return b"\xe9" + struct.pack("<i", displacement)
+        return bytes([0x0F, 0x80 | condition]) + struct.pack("<i", displacement)
+
+
+class Align:
+
+    __slots__ = ("alignment",)
+
+    def __init__(self, alignment) -> None:
+        self.alignment = alignment
+
+    def size(self, offset):
+        return -offset % self.alignment
+
+
+class Data:
+
+    __slots__ = ("data",)
+
+    def __init__(self, data) -> None:
+        self.data = data
+
+    def size(self, offset):
+        return len(self.data)
+
+
+class X86Encoder:
+
+    # Encodes the instructions the x86-64 backend emits, in the forms the GNU
+    # assembler picks: the shortest immediate, the register to register/memory
+    # form of two register operations and one byte jumps where they reach.
+
+    def __init__(self) -> None:
+        # Generated code repeats the same instructions often, and encodings
+        # are never changed once made, so each one is only encoded once.
+        self.encodings = {}
+
+    def encode(self, instruction):
+        key = (instruction.opcode, *instruction.operands)
+        encoding = self.encodings.get(key)
+        if encoding is None:
+            encoding = self.encodings[key] = self.encode_instruction(instruction)
+        return encoding
+
+    def encode_instruction(self, instruction):
+        opcode = instruction.opcode
+        operands = instruction.operands
+        if opcode in FIXED_ENCODINGS:
+            return Encoding(FIXED_ENCODINGS[opcode])
+        if opcode == "call":
+            return Encoding(b"\xe8\x00\x00\x00\x00", 1, operands[0].name, call=True)
+
+        mnemonic, size = self.split_opcode(opcode)
+        if mnemonic == "mov":
+            return self.encode_mov(size, *operands)
+        if mnemonic == "lea":
+            return self.modrm_instruction(size, [0x8D], register_number(operands[1]), operands[0])
+        if mnemonic in ALU_DIGITS:
+            return self.encode_alu(mnemonic, size, *operands)
+        if mnemonic == "test":
+            return self.encode_test(size, *operands)
+        if mnemonic == "imul":
+            return self.encode_imul(size, *operands)
+        if mnemonic in SHIFT_DIGITS:
+            return self.encode_shift(mnemonic, size, *operands)
+        if mnemonic in UNARY_OPCODES:
+            code, digit = UNARY_OPCODES[mnemonic]
+            if not isinstance(operands[0], (Register, Memory)):
+                raise Exception(f"Can't encode {instruction}.")
+            return self.modrm_instruction(size, [code], digit, operands[0])
+        if mnemonic == "push":
+            return self.encode_push(*operands)
+        if mnemonic == "pop":
+            return self.encode_pop(*operands)
+        raise Exception(f"Can't encode {instruction}.")
+
+    def split_opcode(self, opcode):
+        if opcode == "imul":
+            return "imul", 4
+        size = OPERAND_SIZES.get(opcode[-1])
+        if size is None:
+            raise Exception(f"Can't encode {opcode}.")
+        return opcode[:-1], size
+
+    def rex(self, size, bits):
+        if size == 8:
+            bits |= REX_W
+        return bytes([0x40 | bits]) if bits else b""
+
+    def modrm(self, reg, operand):
+        # Returns the REX bits, the ModRM byte with its SIB and displacement,
+        # the position of a label's displacement in them and whether the
+        # address needs the 32 bit address size prefix.
+        reg_bits = (reg & 7) << 3
+        rex_bits = REX_R if reg & 8 else 0
+        if isinstance(operand, Register):
+            rm = register_number(operand)
+            return rex_bits | (REX_B if rm & 8 else 0), bytes([0xC0 | reg_bits | rm & 7]), None, False
+        if not isinstance(operand, Memory):
+            raise Exception(f"Expected a register or memory operand. Received {operand}.")
+
+        base, index, displacement = operand.base, operand.index, operand.displacement
+        if base is not None and base.name == "rip":
+            if isinstance(displacement, str):
+                return rex_bits, bytes([0x05 | reg_bits]) + b"\x00\x00\x00\x00", 1, False
+            return rex_bits, bytes([0x05 | reg_bits]) + struct.pack("<i", displacement), None, False
+        if isinstance(displacement, str):
+            raise Exception(f"Labels can only be addressed relative to rip. Received {operand}.")
+
+        prefix = any(register.size == 4 for register in [base, index] if register is not None)
+        base_number = None if base is None else register_number(base)
+        index_number = None if index is None else register_number(index)
+        if index_number == 4:
+            raise Exception(f"{index} can't be an index register.")
+        if index_number is not None and index_number & 8:
+            rex_bits |= REX_X
+        if base_number is not None and base_number & 8:
+            rex_bits |= REX_B
+
+        if base_number is None:
+            mod, displacement_format = 0, "<i"
+        elif displacement == 0 and base_number & 7 != 5:
+            mod, displacement_format = 0, None
+        elif fits_byte(displacement):
+            mod, displacement_format = 1, "<b"
+        else:
+            mod, displacement_format = 2, "<i"
+
+        if index_number is None and base_number is not None and base_number & 7 != 4:
+            code = bytes([mod << 6 | reg_bits | base_number & 7])
+        else:
+            sib_index = 4 if index_number is None else index_number & 7
+            sib_base = 5 if base_number is None else base_number & 7
+            code = bytes([mod << 6 | reg_bits | 4, SCALES[operand.scale] << 6 | sib_index << 3 | sib_base])
+        if displacement_format is not None:
+            code += struct.pack(displacement_format, displacement)
+        return rex_bits, code, None, prefix
+
+    def modrm_instruction(self, size, opcode, reg, operand, immediate=b""):
+        rex_bits, code, fixup, prefix = self.modrm(reg, operand)
+        head = (b"\x67" if prefix else b"") + self.rex(size, rex_bits) + bytes(opcode)
+        encoding = Encoding(head + code + immediate)
+        if fixup is not None:
+            encoding.fixup_position = len(head) + fixup
+            encoding.fixup_target, encoding.fixup_offset = symbol_offset(operand.displacement)
+        return encoding
+
+    def register_or_memory(self, size, opcode, source, destination):
+        # Register sources use the r/m, reg form, as the assembler does even
+        # when both operands are registers.
+        if isinstance(source, Register):
+            return self.modrm_instruction(size, [opcode], register_number(source), destination)
+        if isinstance(destination, Register):
+            return self.modrm_instruction(size, [opcode | 2], register_number(destination), source)
+        raise Exception(f"One of {source} and {destination} must be a register.")
+
+    def encode_mov(self, size, source, destination):
+        if isinstance(source, Immediate):
+            value = immediate_value(source)
+            if isinstance(destination, Register) and size == 4:
+                number = register_number(destination)
+                return Encoding(self.rex(size, REX_B if number & 8 else 0) + bytes([0xB8 | number & 7]) +
+                                struct.pack("<I", value & 0xFFFFFFFF))
+            return self.modrm_instruction(size, [0xC7], 0, destination, struct.pack("<i", value))
+        return self.register_or_memory(size, 0x89, source, destination)
+
+    def encode_alu(self, mnemonic, size, source, destination):
+        digit = ALU_DIGITS[mnemonic]
+        if not isinstance(source, Immediate):
+            return self.register_or_memory(size, digit << 3 | 1, source, destination)
+        value = immediate_value(source)
+        if fits_byte(value):
+            return self.modrm_instruction(size, [0x83], digit, destination, struct.pack("<b", value))
+        immediate = struct.pack("<I", value & 0xFFFFFFFF)
+        if isinstance(destination, Register) and destination.name == "eax":
+            return Encoding(self.rex(size, 0) + bytes([digit << 3 | 5]) + immediate)
+        return self.modrm_instruction(size, [0x81], digit, destination, immediate)
+
+    def encode_test(self, size, source, destination):
+        if not isinstance(source, Immediate):
+            return self.modrm_instruction(size, [0x85], register_number(source), destination)
+        immediate = struct.pack("<I", immediate_value(source) & 0xFFFFFFFF)
+        if isinstance(destination, Register) and destination.name == "eax":
+            return Encoding(self.rex(size, 0) + b"\xa9" + immediate)
+        return self.modrm_instruction(size, [0xF7], 0, destination, immediate)
+
+    def encode_imul(self, size, *operands):
+        if len(operands) == 2 and isinstance(operands[0], Immediate):
+            operands = (operands[0], operands[1], operands[1])
+        if len(operands) == 2:
+            source, destination = operands
+            return self.modrm_instruction(size, [0x0F, 0xAF], register_number(destination), source)
+        factor, source, destination = operands
+        value = immediate_value(factor)
+        if fits_byte(value):
+            return self.modrm_instruction(size, [0x6B], register_number(destination), source, struct.pack("<b", value))
+        return self.modrm_instruction(size, [0x69], register_number(destination), source,
+                                      struct.pack("<I", value & 0xFFFFFFFF))
+
+    def encode_shift(self, mnemonic, size, count, destination):
+        digit = SHIFT_DIGITS[mnemonic]
+        if isinstance(count, Register):
+            if count.name != "ecx":
+                raise Exception(f"Shifts count in cl. Received {count}.")
+            return self.modrm_instruction(size, [0xD3], digit, destination)
+        value = immediate_value(count)
+        if value == 1:
+            return self.modrm_instruction(size, [0xD1], digit, destination)
+        return self.modrm_instruction(size, [0xC1], digit, destination, struct.pack("<B", value & 0xFF))
+
+    def encode_push(self, operand):
+        if isinstance(operand, Register):
+            number = register_number(operand)
+            return Encoding(self.rex(4, REX_B if number & 8 else 0) + bytes([0x50 | number & 7]))
+        if isinstance(operand, Immediate):
+            value = immediate_value(operand)
+            if fits_byte(value):
+                return Encoding(b"\x6a" + struct.pack("<b", value))
+            return Encoding(b"\x68" + struct.pack("<i", value))
+        return self.modrm_instruction(4, [0xFF], 6, operand)
+
+    def encode_pop(self, operand):
+        if isinstance(operand, Register):
+            number = register_number(operand)
+            return Encoding(self.rex(4, REX_B if number & 8 else 0) + bytes([0x58 | number & 7]))
+        return self.modrm_instruction(4, [0x8F], 0, operand)
+
+
+class Section:
+
+    __slots__ = ("name", "entries", "alignment", "offsets", "size", "data")
+
+    def __init__(self, name) -> None:
+        self.name = name
+        self.entries = []
+        self.alignment = 1
+        self.offsets = None
+        self.size = 0
+        self.data = None
+
+
+class ObjectAssembler:
+
+    # Lays out the program lines into sections and resolves their labels,
+    # leaving relocations for labels of other sections and for external
+    # symbols. Call frame information is left out of the object.
+
+    def __init__(self, program_lines, filename=None) -> None:
+        self.program_lines = program_lines
+        self.filename = filename
+        self.encoder = X86Encoder()
+        self.sections = {}
+        self.section = self.get_section(".text")
+        self.labels = {}
+        self.globals = set()
+        self.functions = set()
+        self.sizes = {}
+        # Relocations as (section, offset, kind, target, addend), the target
+        # is a section for labels and a symbol otherwise.
+        self.relocations = []
+        self.externals = []
+
+    def get_section(self, name):
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(name)
+        return section
+
+    def run(self):
+        for line in self.program_lines:
+            if isinstance(line, Instruction):
+                self.add_instruction(line)
+            elif isinstance(line, Label):
+                if line.name in self.labels:
+                    raise Exception(f"Label {line.name} is defined twice.")
+                self.labels[line.name] = (self.section, len(self.section.entries))
+            elif isinstance(line, Directive):
+                self.add_directive(line.text)
+            else:
+                raise Exception(f"Can't assemble {line}.")
+        for section in self.sections.values():
+            self.relax(section)
+        for section in self.sections.values():
+            self.emit(section)
+        return self
+
+    def add_instruction(self, instruction):
+        if instruction.opcode == "jmp" or instruction.opcode in CONDITION_CODES:
+            target = instruction.operands[0]
+            if not isinstance(target, Target):
+                raise Exception(f"Jumps must be to labels. Received {instruction}.")
+            self.section.entries.append(Jump(instruction.opcode, target.name))
+        else:
+            self.section.entries.append(self.encoder.encode(instruction))
+
+    def add_directive(self, text):
+        name, arguments = DIRECTIVE_PATTERN.fullmatch(text.strip()).groups()
+        if name in IGNORED_DIRECTIVES or name.startswith(".cfi_"):
+            return
+        if name in [".text", ".data", ".bss"]:
+            self.section = self.get_section(name)
+        elif name == ".section":
+            self.section = self.get_section(arguments.split(",")[0].strip())
+        elif name == ".globl":
+            self.globals.add(arguments)
+        elif name == ".type":
+            symbol, kind = [argument.strip() for argument in arguments.split(",")]
+            if kind == "@function":
+                self.functions.add(symbol)
+        elif name == ".size":
+            symbol, expression = [argument.strip() for argument in arguments.split(",")]
+            if expression != f".-{symbol}":
+                raise Exception(f"Unsupported size expression {expression}.")
+            self.sizes[symbol] = (self.section, len(self.section.entries))
+        elif name == ".ascii":
+            self.section.entries.append(Data(decode_ascii(arguments)))
+        elif name == ".long":
+            values = [int(value) & 0xFFFFFFFF for value in arguments.split(",")]
+            self.section.entries.append(Data(struct.pack(f"<{len(values)}I", *values)))
+        elif name == ".align":
+            alignment = int(arguments)
+            self.section.alignment = max(self.section.alignment, alignment)
+            self.section.entries.append(Align(alignment))
+        else:
+            raise Exception(f"Unsupported directive {text.strip()}.")
+
+    def layout(self, section):
+        offsets = []
+        offset = 0
+        for entry in section.entries:
+            offsets.append(offset)
+            offset += entry.size(offset)
+        offsets.append(offset)
+        section.offsets = offsets
+        section.size = offset
+
+    def label_offset(self, section, name):
+        label = self.labels.get(name)
+        if label is None or label[0] is not section:
+            raise Exception(f"Jump to {name}, which is not a label of {section.name}.")
+        return section.offsets[label[1]]
+
+    def relax(self, section):
+        # Jumps start short and only ever grow, so this stops at the smallest
+        # layout where all of them reach.
+        jumps = [(i, entry) for i, entry in enumerate(section.entries) if isinstance(entry, Jump)]
+        while True:
+            self.layout(section)
+            changed = False
+            for i, jump in jumps:
+                if jump.long:
+                    continue
+                displacement = self.label_offset(section, jump.target) - section.offsets[i + 1]
+                if not fits_byte(displacement):
+                    jump.long = True
+                    changed = True
+            if not changed:
+                break
+
+    def offset(self, name):
+        section, index = self.labels[name]
+        return section, section.offsets[index]
+
+    def emit(self, section):
+        data = bytearray()
+        for i, entry in enumerate(section.entries):
+            end = section.offsets[i + 1]
+            if isinstance(entry, Jump):
+                data += entry.encode(self.label_offset(section, entry.target) - end)
+            elif isinstance(entry, Align):
+                data += bytes(entry.size(len(data)))
+            elif isinstance(entry, Data):
+                data += entry.data
+            else:
+                data += entry.code
+                if entry.fixup_target is not None:
+                    self.fix_up(section, data, section.offsets[i], end, entry)
+        section.data = data
+
+    def fix_up(self, section, data, start, end, encoding):
+        position = start + encoding.fixup_position
+        addend = position - end + encoding.fixup_offset
+        if encoding.fixup_target in self.labels:
+            target_section, target_offset = self.offset(encoding.fixup_target)
+            if target_section is section:
+                data[position:position + 4] = struct.pack("<i", target_offset + encoding.fixup_offset - end)
+            else:
+                self.relocations.append((section, position, "pc32", target_section, target_offset + addend))
+        else:
+            if encoding.fixup_target not in self.externals:
+                self.externals.append(encoding.fixup_target)
+            kind = "plt32" if encoding.call else "pc32"
+            self.relocations.append((section, position, kind, encoding.fixup_target, addend))
+
+    def symbols(self):
+        # Labels as (name, section, offset, size, is_global, is_function).
+        symbols = []
+        for name, (section, index) in self.labels.items():
+            size = 0
+            if name in self.sizes:
+                size_section, size_index = self.sizes[name]
+                size = size_section.offsets[size_index] - section.offsets[index]
+            symbols.append((name, section, section.offsets[index], size, name in self.globals,
+                            name in self.functions))
+        return symbols
+
+
+if __name__ == "__main__":
+    from instruction import EAX, ECX, RIP
+
+    encoder = X86Encoder()
+    for instruction in [Instruction("movl", Immediate(5), EAX), Instruction("addl", ECX, EAX),
+                        Instruction("leaq", Memory("LC0", RIP), Register("edi", 8)), Instruction("cltd"),
+                        Instruction("idivl", ECX), Instruction("call", Target("basic_write"))]:
+        print(f"{str(instruction):<32}{encoder.encode(instruction).code.hex(' ')}")